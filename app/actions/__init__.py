@@ -6,12 +6,16 @@ def setup_action_handlers():
 
 
 def get_action_handler_by_data_type(type_name: str):
-    for action_id, value in action_handlers.items():
-        func, config_model, data_model = value
-        if data_model and data_model.__name__ == type_name.strip():
-            return action_id, func, config_model, data_model
-    else:
+    try:
+        return action_handlers_by_data_type[type_name.strip()]
+    except KeyError:
         raise ValueError(f"No action handler found for data type '{type_name}'.")
 
 
+def get_actions():
+    # Served from the registry built on startup, the handlers module isn't inspected again
+    return list(action_handlers.keys())
+
+
 action_handlers = setup_action_handlers()
+action_handlers_by_data_type = index_actions_by_data_type(action_handlers)
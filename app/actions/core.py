@@ -63,6 +63,7 @@ class GenericActionConfiguration(ActionConfiguration):
 
 def discover_actions(module_name, prefix):
     action_handlers = {}
+    push_actions_by_data_type = {}
     # Import the module using importlib
     module = importlib.import_module(module_name)
     all_members = inspect.getmembers(module)
@@ -94,6 +95,12 @@ def discover_actions(module_name, prefix):
                     raise ValueError(f"Push action '{key}' must accept a 'data' parameter.")
                 if not signature.parameters.get("metadata"):
                     raise ValueError(f"Push action '{key}' must accept a 'metadata' parameter.")
+                # Push data is routed to its action by data type, so it must be unique
+                if (other_key := push_actions_by_data_type.get(data_model.__name__)) is not None:
+                    raise ValueError(
+                        f"Push actions '{other_key}' and '{key}' can't both accept data of type '{data_model.__name__}'."
+                    )
+                push_actions_by_data_type[data_model.__name__] = key
             else:
                 data_model = None
             action_handlers[key] = (func, config_model, data_model)
@@ -101,6 +108,10 @@ def discover_actions(module_name, prefix):
     return action_handlers
 
 
-
-def get_actions():
-    return list(discover_actions(module_name="app.actions.handlers", prefix="action_").keys())
+def index_actions_by_data_type(action_handlers):
+    """Map the name of the data model of each push action to its handler, for dispatching push data."""
+    return {
+        data_model.__name__: (action_id, func, config_model, data_model)
+        for action_id, (func, config_model, data_model) in action_handlers.items()
+        if data_model
+    }
@@ -55,6 +55,30 @@ def async_return(result):
     return f
 
 
+@pytest.fixture(autouse=True)
+def clear_local_caches():
+    # In-process caches are module-level, don't let them leak between tests
+    from app.services import clients, config_manager, gundi, utils, webhooks
+    from app.webhooks import core as webhooks_core
+    config_manager._local_cache.clear()
+    clients._gundi_client = None
+    gundi.clear_api_keys()
+    webhooks._dynamic_payload_models.clear()
+    webhooks._list_payload_models.clear()
+    webhooks_core._jq_programs.clear()
+    webhooks._validated_diagnostic_hosts.clear()
+    utils._struct_hex_decoders.clear()
+    yield
+    config_manager._local_cache.clear()
+    clients._gundi_client = None
+    gundi.clear_api_keys()
+    webhooks._dynamic_payload_models.clear()
+    webhooks._list_payload_models.clear()
+    webhooks_core._jq_programs.clear()
+    webhooks._validated_diagnostic_hosts.clear()
+    utils._struct_hex_decoders.clear()
+
+
 @pytest.fixture
 def mock_integration_state():
     return {"last_execution": "2024-01-29T11:20:00+0200"}
@@ -87,6 +111,7 @@ def mock_redis_empty(mocker, mock_integration_state):
     redis_client = mocker.MagicMock()
     redis_client.set.return_value = async_return(MagicMock())
     redis_client.get.return_value = async_return(None)
+    redis_client.mget.side_effect = lambda keys, *args: async_return([None] * len(keys))
     redis_client.delete.return_value = async_return(MagicMock())
     redis_client.setex.return_value = async_return(None)
     redis_client.incr.return_value = redis_client
@@ -106,6 +131,7 @@ def mock_redis_with_integration_config(mocker, integration_v2_as_json):
     redis_client = mocker.MagicMock()
     redis_client.set.return_value = async_return(MagicMock())
     redis_client.get.return_value = async_return(integration_v2_as_json)
+    redis_client.mget.side_effect = lambda keys, *args: async_return([integration_v2_as_json] * len(keys))
     redis_client.delete.return_value = async_return(MagicMock())
     redis_client.setex.return_value = async_return(None)
     redis_client.incr.return_value = redis_client
@@ -125,6 +151,7 @@ def mock_redis_with_action_config(mocker, pull_observations_config_as_json):
     redis_client = mocker.MagicMock()
     redis_client.set.return_value = async_return(MagicMock())
     redis_client.get.return_value = async_return(pull_observations_config_as_json)
+    redis_client.mget.side_effect = lambda keys, *args: async_return([pull_observations_config_as_json] * len(keys))
     redis_client.delete.return_value = async_return(MagicMock())
     redis_client.setex.return_value = async_return(None)
     redis_client.incr.return_value = redis_client
@@ -146,6 +173,7 @@ def mock_redis_with_webhook_config(mocker, integration_v2_with_webhook):
     # Return webhook config JSON when asked for webhook key
     webhook_config_json = integration_v2_with_webhook.webhook_configuration.json()
     redis_client.get.return_value = async_return(webhook_config_json)
+    redis_client.mget.side_effect = lambda keys, *args: async_return([webhook_config_json] * len(keys))
     redis_client.delete.return_value = async_return(MagicMock())
     redis_client.setex.return_value = async_return(None)
     redis_client.incr.return_value = redis_client
@@ -923,6 +951,13 @@ def mock_state_manager(mocker):
     # Default: throttle window is open (first-in-window), so throttled events
     # publish. Tests that exercise the suppressed path override this.
     mock_state_manager.set_if_absent.return_value = async_return(True)
+    # Default: no other run holds the pull action lease
+    mock_state_manager.acquire_lease.return_value = async_return("lease-token")
+    mock_state_manager.release_lease.return_value = async_return(True)
+    # Default: push data messages weren't processed before, so they're claimed
+    mock_state_manager.claim_message.side_effect = lambda *args, **kwargs: async_return(None)
+    mock_state_manager.set_message_processed.side_effect = lambda *args, **kwargs: async_return(None)
+    mock_state_manager.release_message.side_effect = lambda *args, **kwargs: async_return(None)
     return mock_state_manager
 
 
@@ -3,7 +3,7 @@ import json
 import logging
 import os
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Request, status, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, status, BackgroundTasks
 from fastapi.encoders import jsonable_encoder
 from fastapi.exceptions import RequestValidationError
 from fastapi.responses import JSONResponse
@@ -12,8 +12,21 @@ import app.settings as settings
 from fastapi.middleware.cors import CORSMiddleware
 
 from app.services.action_runner import execute_action, _portal
+from app.services.activity_logger import (
+    get_publisher_client,
+    close_publisher_client,
+    start_event_publisher,
+    stop_event_publisher,
+)
+from app.services.pubsub_messages import process_messages_batch, run_action_message, run_push_data_message, ACK, \
+    execute_push_action_once, get_push_message_key
 from app.services.self_registration import register_integration_in_gundi
-from app.services.webhooks import close_diagnostic_client
+from app.services.task_executor import pull_action_executor, push_action_executor, submit_or_reject, \
+    wait_for_task, start_executors, drain_executors
+from app.services.webhooks import close_diagnostic_client, start_webhook_body_logger, stop_webhook_body_logger, \
+    start_diagnostic_forwarder, stop_diagnostic_forwarder
+from app.services.clients import close_gundi_client
+from app.services.gundi import clear_api_keys
 
 
 # For running behind a proxy, we'll want to configure the root path for OpenAPI browser.
@@ -23,13 +36,25 @@ root_path = os.environ.get("ROOT_PATH", "")
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     # Startup Hook
+    get_publisher_client()  # Open the pooled PubSub publisher used for activity logs
+    start_event_publisher()
+    start_webhook_body_logger()
+    start_diagnostic_forwarder()
+    start_executors()
     if settings.REGISTER_ON_START:
         await register_integration_in_gundi(gundi_client=_portal)
         # ToDo: set env var to false in GCP after registration
     yield
     # Shutdown Hook
+    await drain_executors()  # Let webhooks and actions in progress finish before closing clients
     await _portal.close()
+    await stop_diagnostic_forwarder()  # Send queued diagnostic payloads before closing the client
     await close_diagnostic_client()
+    clear_api_keys()
+    await close_gundi_client()
+    await stop_event_publisher()  # Flush queued events before closing the publisher
+    await close_publisher_client()
+    stop_webhook_body_logger()
 
 
 app = FastAPI(
@@ -83,21 +108,18 @@ async def execute(
     # scheduled tick vs an operator's "Run now"). Absent the marker we default
     # to automated, so scheduled pulls on destination-only integrations skip
     # quietly instead of erroring.
+    task = submit_or_reject(
+        pull_action_executor,
+        execute_action,
+        integration_id=json_payload.get("integration_id"),
+        action_id=json_payload.get("action_id"),
+        config_overrides=json_payload.get("config_overrides"),
+        triggered_by=json_payload.get("triggered_by"),
+    )
     if settings.PROCESS_PUBSUB_MESSAGES_IN_BACKGROUND:
-        background_tasks.add_task(
-            execute_action,
-            integration_id=json_payload.get("integration_id"),
-            action_id=json_payload.get("action_id"),
-            config_overrides=json_payload.get("config_overrides"),
-            triggered_by=json_payload.get("triggered_by"),
-        )
+        background_tasks.add_task(wait_for_task, task)
     else:
-        await execute_action(
-            integration_id=json_payload.get("integration_id"),
-            action_id=json_payload.get("action_id"),
-            config_overrides=json_payload.get("config_overrides"),
-            triggered_by=json_payload.get("triggered_by"),
-        )
+        await task
     return {}
 
 
@@ -127,12 +149,60 @@ async def push_data(
         return {}
     # Push data rides in the message itself, so execution errors must propagate
     # (non-2xx) for PubSub to redeliver — acking a failed run would drop data.
-    return await execute_action(
-        integration_id=destination_id,
+    # Redeliveries of messages that were processed already are acked right away.
+    return await submit_or_reject(
+        push_action_executor,
+        execute_push_action_once,
+        destination_id=destination_id,
         data=json_payload,
-        metadata=attributes
+        attributes=attributes,
+        message_key=get_push_message_key(json_body["message"]),
     )
 
+
+async def _process_batch_request(request: Request, run_message, executor):
+    json_body = await request.json()
+    items = json_body.get("messages") if isinstance(json_body, dict) else json_body
+    if not isinstance(items, list):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="Expected a list of PubSub messages, or an object with a 'messages' list."
+        )
+    if len(items) > settings.PUBSUB_BATCH_MAX_MESSAGES:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"Too many messages ({len(items)}). The limit is {settings.PUBSUB_BATCH_MAX_MESSAGES}."
+        )
+    results = await process_messages_batch(items=items, run_message=run_message, executor=executor)
+    acked = sum(1 for r in results if r["status"] == ACK)
+    return {"acked": acked, "nacked": len(results) - acked, "results": results}
+
+
+@app.post(
+    "/batch",
+    summary="Execute many actions from GCP PubSub messages",
+    description=(
+        "Runs the actions concurrently and returns an ack or nack per message. Unlike `/`, which acks every "
+        "command, actions that fail with a server error are nacked, so PubSub retries them."
+    ),
+)
+async def execute_batch(
+    request: Request,
+):
+    return await _process_batch_request(request, run_message=run_action_message, executor=pull_action_executor)
+
+
+@app.post(
+    "/push-data/batch",
+    summary="Process many messages from PubSub and run push actions",
+    description="Runs the push actions concurrently and returns an ack or nack per message, so only failed messages are retried.",
+)
+async def push_data_batch(
+    request: Request,
+):
+    return await _process_batch_request(request, run_message=run_push_data_message, executor=push_action_executor)
+
+
 app.include_router(
     actions.router, prefix="/v1/actions", tags=["actions"], responses={}
 )
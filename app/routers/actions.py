@@ -1,10 +1,13 @@
+import hashlib
+import json
 import logging
 from typing import List
 import app.settings
-from fastapi import APIRouter, BackgroundTasks
+from fastapi import APIRouter, BackgroundTasks, Request, Response, status
 from app.actions import get_actions
 from app.services.action_runner import execute_action, ActionTrigger
 from app.api_schemas import ActionRequest
+from app.services.task_executor import pull_action_executor, submit_or_reject, wait_for_task
 
 logger = logging.getLogger(__name__)
 
@@ -16,8 +19,14 @@ router = APIRouter()
     summary="Execute an action with given settings",
     response_model=List[str]
 )
-async def list_actions():
-    return get_actions()
+async def list_actions(request: Request, response: Response):
+    actions = get_actions()
+    # The list only changes on deploys, so pollers can revalidate it with If-None-Match
+    etag = f'"{hashlib.sha256(json.dumps(actions).encode()).hexdigest()[:32]}"'
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers={"ETag": etag})
+    response.headers["ETag"] = etag
+    return actions
 
 @router.post(
     "/execute",
@@ -30,19 +39,16 @@ async def execute(
     # Direct /execute calls are explicit invocations → manual by default, so a
     # misconfigured pull action surfaces a 404/422 here rather than skipping.
     triggered_by = request.triggered_by or ActionTrigger.MANUAL.value
+    task = submit_or_reject(
+        pull_action_executor,
+        execute_action,
+        integration_id=request.integration_id,
+        action_id=request.action_id,
+        config_overrides=request.config_overrides,
+        triggered_by=triggered_by,
+    )
     if request.run_in_background:
-        background_tasks.add_task(
-            execute_action,
-            integration_id=request.integration_id,
-            action_id=request.action_id,
-            config_overrides=request.config_overrides,
-            triggered_by=triggered_by,
-        )
+        background_tasks.add_task(wait_for_task, task)
         return {"message": "Action execution started in background"}
     else:
-        return await execute_action(
-            integration_id=request.integration_id,
-            action_id=request.action_id,
-            config_overrides=request.config_overrides,
-            triggered_by=triggered_by,
-        )
+        return await task
@@ -1,7 +1,9 @@
 import logging
-from fastapi import APIRouter, BackgroundTasks, Request
-from app.services.webhooks import process_webhook
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Request, status
+from app.services.webhooks import process_webhook, process_webhook_stream, read_webhook_body, log_webhook_request, \
+    WebhookPayloadTooLarge, WebhookPayloadInvalid
 from app import settings
+from app.services.task_executor import webhook_executor, submit_or_reject, wait_for_task
 
 logger = logging.getLogger(__name__)
 
@@ -16,17 +18,19 @@ async def webhooks(
     request: Request,
     background_tasks: BackgroundTasks
 ):
-    body = await request.body()
-    print(f"Message Received through Webhooks. RAW body: {body}")
-    headers = dict(request.headers)
-    print(f"Headers: {headers}")
+    try:
+        if settings.WEBHOOKS_STREAMING_ENABLED:
+            log_webhook_request(request=request)
+            return await submit_or_reject(webhook_executor, process_webhook_stream, request=request)
+        body = await read_webhook_body(request=request)
+    except WebhookPayloadTooLarge as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    except WebhookPayloadInvalid as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    log_webhook_request(request=request, body=body)
+    task = submit_or_reject(webhook_executor, process_webhook, request=request, body=body)
     if settings.PROCESS_WEBHOOKS_IN_BACKGROUND:
-        background_tasks.add_task(
-            process_webhook,
-            request=request,
-        )
+        background_tasks.add_task(wait_for_task, task)
         return {}
     else:
-        return await process_webhook(
-            request=request,
-        )
+        return await task
@@ -3,7 +3,7 @@ import logging
 import time
 import traceback
 from enum import Enum
-from typing import Optional
+from typing import Optional, Tuple
 
 import pydantic
 import stamina
@@ -186,6 +186,38 @@ async def _skip_invalid_config(integration_id, action_id, *, error):
     return {"skipped": True, "reason": "invalid_configuration"}
 
 
+async def _acquire_pull_lease(integration_id: str, action_id: str) -> Tuple[bool, Optional[str]]:
+    """Take the lease of a pull action for an integration.
+
+    Overlapping runs happen when a run takes longer than its schedule interval,
+    or when PubSub redelivers a command, and would pull the same data twice.
+    Returns whether the run can go ahead, and the token to release the lease.
+    Fails open: if redis is unavailable the run goes ahead without a lease.
+    """
+    try:
+        token = await state_manager.acquire_lease(
+            integration_id, action_id, ttl_seconds=settings.PULL_ACTIONS_LEASE_TTL
+        )
+    except Exception as e:
+        logger.warning(
+            f"Couldn't take the lease of '{action_id}' for integration '{integration_id}', "
+            f"running it without a lease: {type(e).__name__}: {e}"
+        )
+        return True, None
+    return token is not None, token
+
+
+async def _release_pull_lease(integration_id: str, action_id: str, token: Optional[str]):
+    if token is None:
+        return
+    try:
+        await state_manager.release_lease(integration_id, action_id, token)
+    except Exception as e:  # The lease expires by itself
+        logger.warning(
+            f"Couldn't release the lease of '{action_id}' for integration '{integration_id}': {type(e).__name__}: {e}"
+        )
+
+
 async def execute_action(
         integration_id: str, action_id: Optional[str] = None, config_overrides: dict = None,
         data: dict = None, metadata: dict = None, triggered_by: Optional[str] = None
@@ -283,6 +315,24 @@ async def execute_action(
         except pydantic.ValidationError as e:
             return await _handle_error(e, integration_id, action_id, data, status.HTTP_422_UNPROCESSABLE_ENTITY)
 
+    lease_token = None
+    if is_pull_action and settings.PULL_ACTIONS_LEASE_ENABLED:
+        can_run, lease_token = await _acquire_pull_lease(integration_id, action_id)
+        if not can_run and is_manual:  # Tell whoever triggered it, instead of skipping silently
+            message = f"Action '{action_id}' is already running for integration '{integration_id}'. Try again later."
+            logger.info(message)
+            return JSONResponse(
+                status_code=status.HTTP_409_CONFLICT,
+                content={"detail": message, "skipped": True, "reason": "already_running"},
+            )
+        if not can_run:
+            return _skip_quietly(
+                integration_id, action_id,
+                reason="already_running",
+                message=f"Skipping '{action_id}': a previous run is still in progress.",
+                log_level=logging.INFO,
+            )
+
     try:  # Execute the action handler with a timeout
         start_time = time.monotonic()
         handler_kwargs = {
@@ -309,6 +359,8 @@ async def execute_action(
         return await _handle_error(e, integration_id, action_id,
                                    config_data={"configurations": [c.dict() for c in integration.configurations]},
                                    classify_heuristics=True)
+    finally:
+        await _release_pull_lease(integration_id, action_id, lease_token)
 
     # Success. Log the execution time and return the result
     end_time = time.monotonic()
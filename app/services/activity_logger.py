@@ -1,6 +1,9 @@
 import asyncio
 import json
 import logging
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional, Set
 
 import aiohttp
 import stamina
@@ -32,7 +35,301 @@ from app.services.errors import format_error_message
 logger = logging.getLogger(__name__)
 
 
-# Publish events for other services or system components
+_publisher_session: Optional[aiohttp.ClientSession] = None
+_publisher_client: Optional[pubsub.PublisherClient] = None
+_publisher_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_publisher_client() -> pubsub.PublisherClient:
+    """Return the process-wide PubSub publisher.
+
+    The publisher and its aiohttp session (connection pool and cached auth
+    token) are shared by every event published from this process, instead of
+    paying new TLS handshakes per event. It's created on first use and
+    normally warmed up and closed by the app lifespan. A new one is created if
+    the session was closed or belongs to another event loop (e.g. the test
+    client runs each request in its own loop).
+    """
+    global _publisher_session, _publisher_client, _publisher_loop
+    loop = asyncio.get_running_loop()
+    if _publisher_client is None or _publisher_session.closed or _publisher_loop is not loop:
+        timeout_settings = aiohttp.ClientTimeout(total=20.0)
+        _publisher_session = aiohttp.ClientSession(raise_for_status=True, timeout=timeout_settings)
+        _publisher_client = pubsub.PublisherClient(session=_publisher_session)
+        _publisher_loop = loop
+    return _publisher_client
+
+
+async def close_publisher_client() -> None:
+    global _publisher_session, _publisher_client, _publisher_loop
+    if _publisher_session is not None and not _publisher_session.closed:
+        await _publisher_session.close()
+    _publisher_session = None
+    _publisher_client = None
+    _publisher_loop = None
+
+
+class EventBatchPublisher:
+    """Publishes events in the background, coalescing them per topic.
+
+    Events are queued by `publish_event` and a worker task groups them by topic
+    into multi-message publish requests. A topic's batch is sent when it reaches
+    `max_batch_size` messages or `max_batch_bytes`, or when its oldest message
+    has waited `max_linger_seconds`. Batches are sent in their own tasks, one at
+    a time per topic, so a slow or failing topic doesn't hold back the others.
+    Each batch gets up to `max_attempts` tries; events of batches that still
+    fail are sent again before the next events of their topic, so the events
+    of a topic keep their order. Queued and in-flight events count towards `max_queue_size`.
+    `stop()` flushes whatever is still queued, so nothing is lost on a graceful shutdown.
+    """
+
+    _STOP = object()
+    _WAKE = object()
+
+    def __init__(
+            self, max_batch_size: int = 100, max_batch_bytes: int = 1024 * 1024,
+            max_linger_seconds: float = 0.5, max_queue_size: int = 10000,
+            max_attempts: int = 3, max_retry_wait: float = 5.0
+    ):
+        self.max_batch_size = max_batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.max_linger_seconds = max_linger_seconds
+        self.max_queue_size = max_queue_size
+        self.max_attempts = max_attempts
+        self.max_retry_wait = max_retry_wait
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._worker: Optional[asyncio.Task] = None
+        self._stopping = False
+        self._batches: Dict[str, List[bytes]] = {}
+        self._batch_sizes: Dict[str, int] = {}
+        self._flush_deadlines: Dict[str, float] = {}
+        self._topic_locks: Dict[str, asyncio.Lock] = defaultdict(asyncio.Lock)
+        self._flush_tasks: Set[asyncio.Task] = set()
+        self._retries: Dict[str, List[bytes]] = {}  # Events of failed batches, by topic
+        self._in_flight = 0  # Events taken from the queue and not published yet
+        # Counters to help sizing the queue and batches
+        self.events_published = 0
+        self.events_failed = 0
+        self.events_retried = 0
+        self.batches_published = 0
+        self.last_flush_latency = 0.0
+        self.max_flush_latency = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize()
+
+    @property
+    def is_running(self) -> bool:
+        return (
+            self._worker is not None and not self._worker.done() and not self._stopping
+            and self._worker.get_loop() is asyncio.get_running_loop()
+        )
+
+    def start(self):
+        if not self.is_running:
+            self._stopping = False
+            self._topic_locks.clear()
+            self._worker = asyncio.create_task(self._run())
+
+    def enqueue(self, topic_name: str, data: bytes) -> bool:
+        """Queue a serialized event. Returns False if the queue is full."""
+        if self._stopping or self.queue_depth + self._in_flight >= self.max_queue_size:
+            return False
+        try:
+            self._queue.put_nowait((topic_name, data))
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Flush all the queued events and stop the worker."""
+        if self._worker is None:
+            return
+        self._stopping = True
+        try:
+            self._queue.put_nowait(self._STOP)
+        except asyncio.QueueFull:  # The worker sees the flag with the next event
+            pass
+        try:
+            await asyncio.wait_for(self._worker, timeout=timeout)
+        except asyncio.TimeoutError:
+            for task in list(self._flush_tasks):
+                task.cancel()
+            logger.error(
+                f"Timed out flushing events on shutdown. "
+                f"{self.queue_depth + self._in_flight} queued event(s) were dropped."
+            )
+        self._worker = None
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "in_flight": self._in_flight,
+            "events_published": self.events_published,
+            "events_failed": self.events_failed,
+            "events_retried": self.events_retried,
+            "batches_published": self.batches_published,
+            "last_flush_latency": self.last_flush_latency,
+            "max_flush_latency": self.max_flush_latency,
+        }
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while not self._stopping:
+            timeout = None
+            if self._flush_deadlines:
+                timeout = max(min(self._flush_deadlines.values()) - loop.time(), 0)
+            try:
+                item = await asyncio.wait_for(self._queue.get(), timeout=timeout)
+            except asyncio.TimeoutError:
+                item = None
+            if item is not None and item is not self._STOP and item is not self._WAKE:
+                self._add(*item)
+            now = loop.time()
+            for topic_name in [t for t, deadline in self._flush_deadlines.items() if deadline <= now]:
+                self._flush(topic_name)
+        # Drain: publish anything still buffered or queued
+        while not self._queue.empty():
+            item = self._queue.get_nowait()
+            if item is not self._STOP and item is not self._WAKE:
+                self._add(*item)
+        for topic_name in list(self._batches):
+            self._flush(topic_name)
+        while self._flush_tasks:  # Failed batches aren't queued again while stopping
+            await asyncio.wait(set(self._flush_tasks))
+
+    def _add(self, topic_name: str, data: bytes):
+        self._in_flight += 1
+        if self._batches.get(topic_name) and self._batch_sizes[topic_name] + len(data) > self.max_batch_bytes:
+            self._flush(topic_name)
+        if topic_name not in self._batches:
+            self._batches[topic_name] = []
+            self._batch_sizes[topic_name] = 0
+            self._flush_deadlines[topic_name] = asyncio.get_running_loop().time() + self.max_linger_seconds
+        self._batches[topic_name].append(data)
+        self._batch_sizes[topic_name] += len(data)
+        if (len(self._batches[topic_name]) >= self.max_batch_size
+                or self._batch_sizes[topic_name] >= self.max_batch_bytes):
+            self._flush(topic_name)
+
+    def _flush(self, topic_name: str):
+        batch = self._batches.pop(topic_name, [])
+        self._batch_sizes.pop(topic_name, None)
+        self._flush_deadlines.pop(topic_name, None)
+        if not batch and not self._retries.get(topic_name):
+            return
+        task = asyncio.create_task(self._publish_batch(topic_name, batch))
+        self._flush_tasks.add(task)
+        task.add_done_callback(self._flush_tasks.discard)
+
+    async def _publish_batch(self, topic_name: str, batch: List[bytes]):
+        async with self._topic_locks[topic_name]:  # Batches of a topic are sent in order
+            # Events of failed batches go first, so the events of a topic keep their order
+            events = self._retries.pop(topic_name, []) + batch
+            sent = 0
+            start_time = time.monotonic()
+            try:
+                for events_batch in self._split(events):
+                    async for attempt in stamina.retry_context(
+                            on=(aiohttp.ClientError, asyncio.TimeoutError), attempts=self.max_attempts,
+                            wait_initial=0.5, wait_max=self.max_retry_wait, wait_jitter=0.5
+                    ):
+                        with attempt:
+                            await send_messages(topic_name=topic_name, payloads=events_batch)
+                    sent += len(events_batch)
+                    self._in_flight -= len(events_batch)
+                    self.events_published += len(events_batch)
+                    self.batches_published += 1
+            except Exception as e:
+                self._retry_later(topic_name, events[sent:], error=e)
+            finally:
+                self.last_flush_latency = time.monotonic() - start_time
+                self.max_flush_latency = max(self.max_flush_latency, self.last_flush_latency)
+                logger.debug(
+                    f"Flushed {sent} of {len(events)} event(s) to topic {topic_name} in {self.last_flush_latency:.3f}s. "
+                    f"Queue depth: {self.queue_depth}"
+                )
+
+    def _split(self, events: List[bytes]) -> List[List[bytes]]:
+        """Split events into batches within the size limits, as `_add` does"""
+        batches, batch, batch_size = [], [], 0
+        for data in events:
+            if batch and (len(batch) >= self.max_batch_size or batch_size + len(data) > self.max_batch_bytes):
+                batches.append(batch)
+                batch, batch_size = [], 0
+            batch.append(data)
+            batch_size += len(data)
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _retry_later(self, topic_name: str, events: List[bytes], error: Exception):
+        """Keep the events of a failed batch to be sent before the next events of the topic. Dropped while stopping."""
+        if self._stopping:
+            self._in_flight -= len(events)
+            self.events_failed += len(events)
+            logger.exception(f"Error publishing {len(events)} event(s) to topic {topic_name}: {error}. Events dropped.")
+            return
+        self._retries[topic_name] = events
+        self.events_retried += len(events)
+        # Flush the topic after the linger time, even if no other events arrive for it
+        if topic_name not in self._batches:
+            self._batches[topic_name] = []
+            self._batch_sizes[topic_name] = 0
+            self._flush_deadlines[topic_name] = asyncio.get_running_loop().time() + self.max_linger_seconds
+            try:  # Wake up the worker, so it sees the new deadline
+                self._queue.put_nowait(self._WAKE)
+            except asyncio.QueueFull:  # It's busy already
+                pass
+        logger.exception(
+            f"Error publishing {len(events)} event(s) to topic {topic_name}: {error}. They will be retried."
+        )
+
+
+_event_publisher: Optional[EventBatchPublisher] = None
+
+
+def start_event_publisher():
+    global _event_publisher
+    if not settings.PUBLISH_EVENTS_IN_BACKGROUND:
+        return
+    if _event_publisher is None:
+        _event_publisher = EventBatchPublisher(
+            max_batch_size=settings.EVENTS_PUBLISHER_MAX_BATCH_SIZE,
+            max_batch_bytes=settings.EVENTS_PUBLISHER_MAX_BATCH_BYTES,
+            max_linger_seconds=settings.EVENTS_PUBLISHER_MAX_LINGER_SECONDS,
+            max_queue_size=settings.EVENTS_PUBLISHER_MAX_QUEUE_SIZE,
+            max_attempts=settings.EVENTS_PUBLISHER_MAX_ATTEMPTS,
+            max_retry_wait=settings.EVENTS_PUBLISHER_MAX_RETRY_WAIT,
+        )
+    _event_publisher.start()
+
+
+async def stop_event_publisher():
+    global _event_publisher
+    if _event_publisher is not None:
+        await _event_publisher.stop(timeout=settings.EVENTS_PUBLISHER_DRAIN_TIMEOUT)
+        logger.info(f"Event publisher stopped. Stats: {_event_publisher.stats()}")
+        _event_publisher = None
+
+
+def get_event_publisher_stats() -> dict:
+    """Queue depth, counters and flush latency (seconds) of the background publisher."""
+    return _event_publisher.stats() if _event_publisher else {}
+
+
+async def send_messages(topic_name: str, payloads: List[bytes]):
+    """Publish the messages in a single request, without retries"""
+    client = get_publisher_client()
+    # Get the topic
+    topic = client.topic_path(settings.GCP_PROJECT_ID, topic_name)
+    messages = [pubsub.PubsubMessage(payload) for payload in payloads]
+    response = await client.publish(topic, messages)
+    logger.debug(f"GCP PubSub response: {response}")
+    return response
+
+
 @stamina.retry(
     on=(aiohttp.ClientError, asyncio.TimeoutError),
     attempts=5,
@@ -40,29 +337,33 @@ logger = logging.getLogger(__name__)
     wait_max=60,
     wait_jitter=5.0
 )
+async def publish_messages(topic_name: str, payloads: List[bytes]):
+    try:  # Send to pubsub
+        return await send_messages(topic_name=topic_name, payloads=payloads)
+    except Exception as e:
+        logger.exception(
+            f"Error publishing system event to topic {topic_name}: {e}. This will be retried."
+        )
+        raise e
+
+
+# Publish events for other services or system components
 async def publish_event(event: SystemEventBaseModel, topic_name: str):
-    timeout_settings = aiohttp.ClientTimeout(total=20.0)
-    async with aiohttp.ClientSession(
-        raise_for_status=True, timeout=timeout_settings
-    ) as session:
-        client = pubsub.PublisherClient(session=session)
-        # Get the topic
-        topic = client.topic_path(settings.GCP_PROJECT_ID, topic_name)
-        # Prepare the payload
-        binary_payload = json.dumps(event.dict(), default=str).encode("utf-8")
-        messages = [pubsub.PubsubMessage(binary_payload)]
-        logger.debug(f"Sending event {event} to PubSub topic {topic_name}..")
-        try:  # Send to pubsub
-            response = await client.publish(topic, messages)
-        except Exception as e:
-            logger.exception(
-                f"Error publishing system event to topic {topic_name}: {e}. This will be retried."
-            )
-            raise e
-        else:
-            logger.debug(f"System event {event} published successfully.")
-            logger.debug(f"GCP PubSub response: {response}")
-            return response
+    """
+    Publish an event in a PubSub topic.
+    When the background publisher is running, the event is queued to be sent in a batch
+    and None is returned right away. Otherwise, it's published inline and the PubSub response is returned.
+    """
+    # Prepare the payload
+    binary_payload = json.dumps(event.dict(), default=str).encode("utf-8")
+    publisher = _event_publisher
+    if publisher is not None and publisher.is_running and publisher.enqueue(topic_name, binary_payload):
+        logger.debug(f"Event {event} queued for PubSub topic {topic_name}.")
+        return None
+    logger.debug(f"Sending event {event} to PubSub topic {topic_name}..")
+    response = await publish_messages(topic_name=topic_name, payloads=[binary_payload])
+    logger.debug(f"System event {event} published successfully.")
+    return response
 
 
 async def log_activity(integration_id: str, action_id: str, title: str, level="INFO", config_data: dict = None, data: dict = None):
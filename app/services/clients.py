@@ -0,0 +1,32 @@
+import asyncio
+from typing import Optional
+from gundi_client_v2 import GundiClient
+
+
+# Gundi API client shared by the service, e.g. by the config manager for reloads and by
+# the API key lookups in app.services.gundi, so they reuse pooled connections and the
+# cached auth token instead of opening new ones each time.
+_gundi_client: Optional[GundiClient] = None
+_gundi_client_loop: Optional[asyncio.AbstractEventLoop] = None
+
+
+def get_gundi_client() -> GundiClient:
+    """Return the Gundi API client shared by the service.
+
+    The underlying connection pool is bound to the event loop it was created in,
+    so a new client is created if it's requested from a different loop.
+    """
+    global _gundi_client, _gundi_client_loop
+    loop = asyncio.get_running_loop()
+    if _gundi_client is None or _gundi_client_loop is not loop:
+        _gundi_client = GundiClient()
+        _gundi_client_loop = loop
+    return _gundi_client
+
+
+async def close_gundi_client():
+    global _gundi_client, _gundi_client_loop
+    if _gundi_client is not None:
+        await _gundi_client.close()
+    _gundi_client = None
+    _gundi_client_loop = None
@@ -18,36 +18,48 @@ logger = logging.getLogger(__name__)
 config_manager = IntegrationConfigurationManager()
 
 
+# The local cache of the integration is dropped before the changes (so read-modify-write starts from redis)
+# and again after them, so entries cached by reads that raced with the write don't keep the old values.
 async def handle_integration_created_event(event: IntegrationCreated):
+    config_manager.invalidate_local_cache(integration_id=event.payload.id)
     await config_manager.set_integration(integration=event.payload)
+    config_manager.invalidate_local_cache(integration_id=event.payload.id)
 
 
 async def handle_integration_updated_event(event: IntegrationUpdated):
     event_data = event.payload
+    # Read-modify-write: start from redis rather than a possibly stale in-memory copy
+    config_manager.invalidate_local_cache(integration_id=event_data.id)
     integration = await config_manager.get_integration(integration_id=event_data.id)
     for key, value in event_data.changes.items():
         if hasattr(integration, key):
             setattr(integration, key, value)
     await config_manager.set_integration(integration=integration)
+    config_manager.invalidate_local_cache(integration_id=event_data.id)
 
 
 async def handle_integration_deleted_event(event: IntegrationDeleted):
+    config_manager.invalidate_local_cache(integration_id=event.payload.id)
     await config_manager.delete_integration(integration_id=event.payload.id)
+    config_manager.invalidate_local_cache(integration_id=event.payload.id)
 
 
 async def handle_action_config_created_event(event: ActionConfigCreated):
     action_config = event.payload
+    config_manager.invalidate_local_cache(integration_id=action_config.integration)
     await config_manager.set_action_configuration(
         integration_id=action_config.integration,
         action_id=action_config.action.value,
         config=action_config
     )
+    config_manager.invalidate_local_cache(integration_id=action_config.integration)
 
 
 async def handle_action_config_updated_event(event: ActionConfigUpdated):
     event_data = event.payload
     integration_id = event_data.integration_id
     action_id = event_data.alt_id
+    config_manager.invalidate_local_cache(integration_id=integration_id)
     action_config = await config_manager.get_action_configuration(
         integration_id=integration_id,
         action_id=action_id
@@ -59,16 +71,19 @@ async def handle_action_config_updated_event(event: ActionConfigUpdated):
         action_id=action_id,
         config=action_config
     )
+    config_manager.invalidate_local_cache(integration_id=integration_id)
 
 
 async def handle_action_config_deleted_event(event: ActionConfigDeleted):
     event_data = event.payload
     integration_id = event_data.integration_id
     action_id = event_data.alt_id
+    config_manager.invalidate_local_cache(integration_id=integration_id)
     await config_manager.delete_action_configuration(
         integration_id=integration_id,
         action_id=action_id
     )
+    config_manager.invalidate_local_cache(integration_id=integration_id)
 
 
 event_handlers = {
@@ -1,18 +1,35 @@
+import asyncio
 import json
-from typing import Optional
+from typing import Dict, List, Optional
 
 import stamina
 import httpx
 import redis.asyncio as redis
 from gundi_core.schemas.v2 import Integration, IntegrationSummary, IntegrationActionConfiguration, WebhookConfiguration
-from gundi_client_v2 import GundiClient
 from app import settings
-
-
-# Cached marker meaning "this integration has no webhook configuration", so a
-# cold cache doesn't trigger a Gundi API reload on every webhook-config lookup.
-_NO_WEBHOOK_CONFIG_SENTINEL = "null"
-
+from app.services.clients import get_gundi_client
+from app.services.utils import LRUCache
+
+
+# Cached marker meaning "this integration has no webhook configuration" (or no
+# configuration for an action of its type), so a cold cache doesn't trigger a
+# Gundi API reload on every config lookup.
+_NO_CONFIG_SENTINEL = "null"
+
+# Parsed configurations kept in memory in front of redis, shared by every
+# manager in the process so hot integrations need no redis round trips and no
+# re-parsing. Entries are dropped when config events arrive, and also expire
+# after a short TTL because config events only reach one instance of the service.
+_local_cache = LRUCache(
+    max_size=settings.CONFIG_LOCAL_CACHE_MAX_SIZE if settings.CONFIG_LOCAL_CACHE_TTL else 0,
+    ttl=settings.CONFIG_LOCAL_CACHE_TTL
+)
+_NOT_CACHED = object()
+
+# Reloads from the Gundi API in progress, by integration id. Concurrent cache
+# misses for the same integration wait for the same call (single-flight)
+# instead of stampeding the Gundi API, e.g. after a redis flush.
+_reloads_in_progress: Dict[str, asyncio.Future] = {}
 
 class IntegrationConfigurationManager:
     # ToDo: Add support for webhook configs
@@ -22,6 +39,7 @@ class IntegrationConfigurationManager:
         port = kwargs.get("port", settings.REDIS_PORT)
         db = kwargs.get("db", settings.REDIS_CONFIGS_DB)
         self.db_client = redis.Redis(host=host, port=port, db=db)
+        self._local_cache = _local_cache
 
     def _get_integration_key(self, integration_id: str) -> str:
         return f"integration.{integration_id}"
@@ -32,47 +50,101 @@ class IntegrationConfigurationManager:
     def _get_webhook_config_key(self, integration_id: str) -> str:
         return f"integrationconfig.{integration_id}.webhook"
 
+    def _get_from_local_cache(self, key: str):
+        value = self._local_cache.get(key, _NOT_CACHED)
+        # Callers get their own copy, so changes to it never leak into the cache
+        return value.copy(deep=True) if value is not None and value is not _NOT_CACHED else value
+
+    def _set_in_local_cache(self, key: str, value):
+        self._local_cache.set(key, value.copy(deep=True) if value is not None else None)
+
+    @staticmethod
+    def _parse_config(data, model):
+        if data in (_NO_CONFIG_SENTINEL, _NO_CONFIG_SENTINEL.encode()):
+            return None  # cached absence — there's no such configuration
+        return model.parse_raw(data)
+
+    def invalidate_local_cache(self, integration_id: str):
+        """Drop every in-memory entry of an integration, so the next read goes to redis."""
+        integration_id = str(integration_id)
+        for key in self._local_cache.keys():
+            if key == self._get_integration_key(integration_id) or key.startswith(f"integrationconfig.{integration_id}."):
+                self._local_cache.pop(key)
+
     async def _reload_integration_from_gundi(self, integration_id: str, ttl=None) -> Integration:
-        key = self._get_integration_key(integration_id)
-        async with GundiClient() as gundi:
-            async for attempt in stamina.retry_context(on=httpx.HTTPError, wait_initial=1.0, wait_jitter=5.0,  wait_max=32.0):
-                with attempt:
-                    integration_details = await gundi.get_integration_details(integration_id)
-            integration = IntegrationSummary.from_integration(integration_details)
-            await self.db_client.set(key, integration.json(), ttl)
-            # Save configurations for individual actions
-            for config in integration_details.configurations:
-                config_key = self._get_action_config_key(integration_id, config.action.value)
-                await self.db_client.set(config_key, config.json(), ttl)
-            # Save the webhook configuration — or a sentinel marking its absence, so
-            # integrations without one don't reload from the Gundi API on every lookup
-            webhook_key = self._get_webhook_config_key(integration_id)
-            if webhook_configuration := integration_details.webhook_configuration:
-                await self.db_client.set(webhook_key, webhook_configuration.json(), ttl)
-            else:
-                await self.db_client.set(webhook_key, _NO_WEBHOOK_CONFIG_SENTINEL, ttl)
-            return integration_details
+        integration_id = str(integration_id)
+        reload = _reloads_in_progress.get(integration_id)
+        if reload is None or reload.get_loop() is not asyncio.get_running_loop():
+            reload = asyncio.ensure_future(self._load_integration_from_gundi(integration_id, ttl))
+            _reloads_in_progress[integration_id] = reload
+
+            def _on_reload_done(future):
+                if _reloads_in_progress.get(integration_id) is future:
+                    del _reloads_in_progress[integration_id]
+                if not future.cancelled():
+                    future.exception()  # Retrieved by the waiters, avoid warnings if there are none left
+
+            reload.add_done_callback(_on_reload_done)
+        # Shielded so a cancelled caller doesn't cancel the reload for the others
+        integration_details = await asyncio.shield(reload)
+        return integration_details.copy(deep=True)
+
+    async def _load_integration_from_gundi(self, integration_id: str, ttl=None) -> Integration:
+        gundi = get_gundi_client()
+        async for attempt in stamina.retry_context(on=httpx.HTTPError, wait_initial=1.0, wait_jitter=5.0,  wait_max=32.0):
+            with attempt:
+                integration_details = await gundi.get_integration_details(integration_id)
+        # Keys and values to save, in the local cache and in redis
+        integration_key = self._get_integration_key(integration_id)
+        entries = {integration_key: IntegrationSummary.from_integration(integration_details)}
+        # Configurations for individual actions
+        for config in integration_details.configurations:
+            entries[self._get_action_config_key(integration_id, config.action.value)] = config
+        # Mark the actions of the integration type which aren't configured
+        configured_actions = {config.action.value for config in integration_details.configurations}
+        for action in integration_details.type.actions:
+            if action.value not in configured_actions:
+                entries[self._get_action_config_key(integration_id, action.value)] = None
+        # The webhook configuration — or a sentinel marking its absence, so
+        # integrations without one don't reload from the Gundi API on every lookup
+        entries[self._get_webhook_config_key(integration_id)] = integration_details.webhook_configuration
+        # All the keys are written in one transaction, so readers never see a half-written integration
+        for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
+            with attempt:
+                async with self.db_client.pipeline(transaction=True) as pipe:
+                    for key, value in entries.items():
+                        pipe.set(key, value.json() if value is not None else _NO_CONFIG_SENTINEL, ttl)
+                    await pipe.execute()
+        for key, value in entries.items():
+            self._set_in_local_cache(key, value)
+        return integration_details
 
     async def get_action_configuration(self, integration_id: str, action_id: str, ttl=None) -> Optional[IntegrationActionConfiguration]:
         key = self._get_action_config_key(integration_id, action_id)
+        if (config := self._get_from_local_cache(key)) is not _NOT_CACHED:
+            return config
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
                 data = await self.db_client.get(key)
         if data:
-            return IntegrationActionConfiguration.parse_raw(data)
-        # If not found in the redis db, try reloading data from Gundi API
-        integration_details = await self._reload_integration_from_gundi(integration_id, ttl)
-        return integration_details.get_action_config(action_id)
+            config = self._parse_config(data, IntegrationActionConfiguration)
+        else:  # If not found in the redis db, try reloading data from Gundi API
+            integration_details = await self._reload_integration_from_gundi(integration_id, ttl)
+            config = integration_details.get_action_config(action_id)
+        self._set_in_local_cache(key, config)
+        return config
 
     async def get_webhook_configuration(self, integration_id: str, ttl=None) -> Optional[WebhookConfiguration]:
         key = self._get_webhook_config_key(integration_id)
+        if (webhook_config := self._get_from_local_cache(key)) is not _NOT_CACHED:
+            return webhook_config
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
                 data = await self.db_client.get(key)
         if data:
-            if data in (_NO_WEBHOOK_CONFIG_SENTINEL, _NO_WEBHOOK_CONFIG_SENTINEL.encode()):
-                return None  # cached absence — this integration has no webhook config
-            return WebhookConfiguration.parse_raw(data)
+            webhook_config = self._parse_config(data, WebhookConfiguration)
+            self._set_in_local_cache(key, webhook_config)
+            return webhook_config
         # If not found in the redis db, try reloading data from Gundi API
         integration_details = await self._reload_integration_from_gundi(integration_id, ttl)
         return integration_details.webhook_configuration
@@ -80,48 +152,89 @@ class IntegrationConfigurationManager:
 
     async def set_action_configuration(self, integration_id: str, action_id: str, config: IntegrationActionConfiguration, ttl=None):
         key = self._get_action_config_key(integration_id, action_id)
+        self._local_cache.pop(key)
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
                 await self.db_client.set(key, config.json(), ttl)
+        self._local_cache.pop(key)  # In case a read during the write cached the old value
 
     async def delete_action_configuration(self, integration_id: str, action_id: str):
         key = self._get_action_config_key(integration_id, action_id)
+        self._local_cache.pop(key)
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
-                return await self.db_client.delete(key)
+                deleted = await self.db_client.delete(key)
+        self._local_cache.pop(key)  # In case a read during the delete cached the old value
+        return deleted
 
     async def get_integration(self, integration_id: str, ttl=None) -> IntegrationSummary:
         key = self._get_integration_key(integration_id)
+        if (integration := self._get_from_local_cache(key)) is not _NOT_CACHED:
+            return integration
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
                 integration_data = await self.db_client.get(key)
         if integration_data:
             # Looks for configurations
-            return IntegrationSummary.parse_raw(integration_data)
+            integration = IntegrationSummary.parse_raw(integration_data)
+            self._set_in_local_cache(key, integration)
+            return integration
         # If not found in cache, reload from Gundi
         integration_details = await self._reload_integration_from_gundi(integration_id, ttl)
         return IntegrationSummary.from_integration(integration_details)
 
     async def set_integration(self, integration: IntegrationSummary, ttl=None):
         key = self._get_integration_key(integration.id)
+        self._local_cache.pop(key)
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
                 await self.db_client.set(key, integration.json(), ttl)
+        self._local_cache.pop(key)  # In case a read during the write cached the old value
 
     async def delete_integration(self, integration_id: str):
         key = self._get_integration_key(integration_id)
+        self._local_cache.pop(key)
         for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
             with attempt:
                 await self.db_client.delete(key)
+        self._local_cache.pop(key)  # In case a read during the delete cached the old value
+
+    async def _get_configurations(self, integration_id: str, action_ids: List[str], ttl=None):
+        """
+        Get the configurations of several actions plus the webhook configuration,
+        reading whatever isn't cached in memory with a single MGET.
+        Falls back to one reload from the Gundi API if any of them isn't in redis.
+        """
+        keys = [self._get_action_config_key(integration_id, action_id) for action_id in action_ids]
+        keys.append(self._get_webhook_config_key(integration_id))
+        values = {key: self._get_from_local_cache(key) for key in keys}
+        if missing_keys := [key for key, value in values.items() if value is _NOT_CACHED]:
+            for attempt in stamina.retry_context(on=redis.RedisError, attempts=5, wait_initial=1.0, wait_max=30, wait_jitter=3.0):
+                with attempt:
+                    results = await self.db_client.mget(missing_keys)
+            if not all(results):
+                # If not found in the redis db, reload data from Gundi API once for all of them
+                integration_details = await self._reload_integration_from_gundi(integration_id, ttl)
+                configurations = [
+                    config for action_id in action_ids
+                    if (config := integration_details.get_action_config(action_id))
+                ]
+                return configurations, integration_details.webhook_configuration
+            webhook_key = keys[-1]
+            for key, data in zip(missing_keys, results):
+                model = WebhookConfiguration if key == webhook_key else IntegrationActionConfiguration
+                values[key] = self._parse_config(data, model)
+                self._set_in_local_cache(key, values[key])
+        *action_configs, webhook_configuration = values.values()
+        return [config for config in action_configs if config], webhook_configuration
 
     async def get_integration_details(self, integration_id: str, ttl=None) -> Integration:
         integration_summary = await self.get_integration(integration_id, ttl)
-        configurations = []
-        for action in integration_summary.type.actions:
-            config = await self.get_action_configuration(integration_id, action.value, ttl)
-            if config:
-                configurations.append(config)
-        webhook_configuration = await self.get_webhook_configuration(integration_id, ttl)
+        configurations, webhook_configuration = await self._get_configurations(
+            integration_id=integration_id,
+            action_ids=[action.value for action in integration_summary.type.actions],
+            ttl=ttl
+        )
         return Integration(
             id=integration_summary.id,
             name=integration_summary.name,
@@ -133,4 +246,4 @@ class IntegrationConfigurationManager:
             additional=integration_summary.additional,
             configurations=configurations,
             webhook_configuration=webhook_configuration
-        )
\ No newline at end of file
+        )
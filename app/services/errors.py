@@ -1,4 +1,6 @@
 import asyncio
+import datetime
+from email.utils import parsedate_to_datetime
 from typing import NamedTuple, Optional
 
 import aiohttp
@@ -55,9 +57,24 @@ class IntegrationConnectionError(IntegrationError):
 
 
 class IntegrationRateLimitError(IntegrationError):
+    """Raise it with `retry_after` (seconds) when the provider tells how long to wait,
+    e.g. in a Retry-After header, so rate limiters hold the requests until then."""
     error_type = "rate_limit"
     default_title = "Rate limited by the provider"
 
+    def __init__(self, message: str = "", status_code: Optional[int] = None, retry_after: Optional[float] = None):
+        super().__init__(message, status_code=status_code)
+        if retry_after is not None:
+            self.retry_after = retry_after
+        elif not hasattr(self, "retry_after"):
+            self.retry_after = None
+
+
+class RateLimiterWaitExceededError(IntegrationRateLimitError):
+    """Raised by a RateLimiter when its next turn is further away than it may wait.
+    It comes from our own limits, not from the provider, so other limiters don't hold requests for it."""
+    default_title = "Rate limit of the provider reached"
+
 
 class IntegrationBadResponseError(IntegrationError):
     error_type = "bad_response"
@@ -69,6 +86,24 @@ class ClassifiedError(NamedTuple):
     title: str
     message: str
     status_code: Optional[int]
+    retry_after: Optional[float] = None  # Seconds to wait before retrying, for rate limit errors
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header, in seconds or as an HTTP date, into seconds from now."""
+    if value is None:
+        return None
+    try:
+        return max(float(value), 0.0)
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(str(value))
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=datetime.timezone.utc)
+    return max((retry_at - datetime.datetime.now(datetime.timezone.utc)).total_seconds(), 0.0)
 
 
 # Exceptions that mean the provider could not be reached at all.
@@ -95,10 +130,12 @@ def classify_error(exc: Exception) -> Optional[ClassifiedError]:
             title=exc.default_title,
             message=getattr(exc, "message", None) or "",
             status_code=getattr(exc, "status_code", None),
+            retry_after=getattr(exc, "retry_after", None),
         )
 
     # getattr chain: non-HTTP exceptions have no .response attribute.
-    status_code = getattr(getattr(exc, "response", None), "status_code", None)
+    response = getattr(exc, "response", None)
+    status_code = getattr(response, "status_code", None)
     # httpx.HTTPStatusError from raise_for_status() stringifies to multi-line
     # text (URL plus a "For more information check: ..." line) — only the
     # first line is useful as a short, human-first message.
@@ -106,7 +143,11 @@ def classify_error(exc: Exception) -> Optional[ClassifiedError]:
     if status_code in (401, 403):
         return ClassifiedError("auth", IntegrationAuthError.default_title, first_line, status_code)
     if status_code == 429:
-        return ClassifiedError("rate_limit", IntegrationRateLimitError.default_title, first_line, status_code)
+        headers = getattr(response, "headers", None) or {}
+        return ClassifiedError(
+            "rate_limit", IntegrationRateLimitError.default_title, first_line, status_code,
+            retry_after=parse_retry_after(headers.get("Retry-After")),
+        )
     if status_code is not None and status_code >= 500:
         return ClassifiedError("bad_response", IntegrationBadResponseError.default_title, first_line, status_code)
     if isinstance(exc, CONNECTIVITY_EXCEPTIONS):
@@ -124,8 +165,13 @@ def format_classified_error(classified: ClassifiedError) -> str:
     text = classified.title
     if classified.message and classified.message != classified.title:
         text = f"{text} — {classified.message}"
+    details = []
     if classified.status_code:
-        text = f"{text} (HTTP {classified.status_code})"
+        details.append(f"HTTP {classified.status_code}")
+    if classified.retry_after is not None:
+        details.append(f"retry after {classified.retry_after:g}s")
+    if details:
+        text = f"{text} ({', '.join(details)})"
     return text
 
 
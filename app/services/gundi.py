@@ -1,25 +1,60 @@
+import asyncio
 import datetime
-from typing import List
+import itertools
+import logging
+from contextlib import contextmanager
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterable, List, NamedTuple, Optional, Union
 import httpx
 import stamina
-from gundi_client_v2.client import GundiClient, GundiDataSenderClient
+from gundi_client_v2.client import GundiDataSenderClient
+from app import settings
+from app.services.clients import get_gundi_client
+from app.services.utils import LRUCache, generate_batches_async
+
+
+logger = logging.getLogger(__name__)
+
+# API keys by integration id, so sending many batches doesn't fetch the API key for each of them.
+# Entries expire so rotated keys are picked up, and are dropped on 401 responses.
+_api_keys = LRUCache(max_size=settings.GUNDI_API_KEYS_CACHE_MAX_SIZE, ttl=settings.GUNDI_API_KEYS_CACHE_TTL)
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
 async def _get_gundi_api_key(integration_id):
-    async with GundiClient() as gundi_client:
-        return await gundi_client.get_integration_api_key(
-            integration_id=integration_id
-        )
+    gundi_client = get_gundi_client()
+    return await gundi_client.get_integration_api_key(
+        integration_id=integration_id
+    )
 
 
 async def _get_sensors_api_client(integration_id):
-    gundi_api_key = await _get_gundi_api_key(integration_id=integration_id)
-    assert gundi_api_key, f"Cannot get a valid API Key for integration {integration_id}"
-    sensors_api_client = GundiDataSenderClient(
+    if not (gundi_api_key := _api_keys.get(integration_id)):
+        gundi_api_key = await _get_gundi_api_key(integration_id=integration_id)
+        assert gundi_api_key, f"Cannot get a valid API Key for integration {integration_id}"
+        _api_keys.set(integration_id, gundi_api_key)
+    # The client opens a new connection per request, there's nothing to gain from keeping it
+    return GundiDataSenderClient(
         integration_api_key=gundi_api_key
     )
-    return sensors_api_client
+
+
+def invalidate_api_key(integration_id):
+    """Forget the cached API key of an integration"""
+    _api_keys.pop(str(integration_id))
+
+
+@contextmanager
+def _invalidate_api_key_on_unauthorized(integration_id):
+    try:
+        yield
+    except httpx.HTTPStatusError as e:
+        if e.response.status_code == 401:  # The key was revoked or rotated, fetch it again on retry
+            invalidate_api_key(integration_id)
+        raise
+
+
+def clear_api_keys():
+    _api_keys.clear()
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -48,7 +83,8 @@ async def send_events_to_gundi(events: List[dict], **kwargs) -> dict:
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
     sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_events(data=events)
+    with _invalidate_api_key_on_unauthorized(integration_id):
+        return await sensors_api_client.post_events(data=events)
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -66,7 +102,8 @@ async def send_event_attachments_to_gundi(event_id: str, attachments: List[tuple
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
     sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_event_attachments(event_id=event_id, attachments=attachments)
+    with _invalidate_api_key_on_unauthorized(integration_id):
+        return await sensors_api_client.post_event_attachments(event_id=event_id, attachments=attachments)
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -96,7 +133,8 @@ async def send_observations_to_gundi(observations: List[dict], **kwargs) -> dict
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
     sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_observations(data=observations)
+    with _invalidate_api_key_on_unauthorized(integration_id):
+        return await sensors_api_client.post_observations(data=observations)
 
 
 @stamina.retry(on=httpx.HTTPError, wait_initial=10.0, wait_jitter=10.0, wait_max=300.0)
@@ -134,4 +172,60 @@ async def send_messages_to_gundi(messages: List[dict], **kwargs) -> dict:
     integration_id = kwargs.get("integration_id")
     assert integration_id, "integration_id is required"
     sensors_api_client = await _get_sensors_api_client(integration_id=str(integration_id))
-    return await sensors_api_client.post_messages(data=messages)
+    with _invalidate_api_key_on_unauthorized(integration_id):
+        return await sensors_api_client.post_messages(data=messages)
+
+
+class BatchResult(NamedTuple):
+    index: int  # Position of the batch, starting at 0
+    size: int  # Number of records in the batch
+    response: Optional[Any]  # Response of the API, None if the batch failed
+    error: Optional[Exception]  # Why the batch failed, after retries
+
+
+async def send_batches_to_gundi(
+        records: Union[Iterable[dict], AsyncIterable[dict]],
+        send: Callable[..., Awaitable[Any]] = send_observations_to_gundi,
+        batch_size: int = 200,
+        max_concurrency: int = 5,
+        max_batch_bytes: Optional[int] = None,
+        **kwargs
+) -> List[BatchResult]:
+    """
+    Send a large amount of records to Gundi in batches, sending up to `max_concurrency` batches at a time.
+    Each batch is retried on its own by the send function, and a batch failing doesn't stop the others.
+    :param records: A list or an async iterator of observations, events or messages
+    :param send: The function used to send each batch, send_observations_to_gundi by default
+    :param batch_size: Max number of records per batch
+    :param max_concurrency: Max number of batches being sent at the same time
+    :param max_batch_bytes: Optional max size of a batch, with its records serialized as JSON
+    :param kwargs: integration_id: The UUID of the related integration, and any other arg for the send function
+    :return: A list of BatchResult, one per batch and in the order of the batches
+    """
+    batches = generate_batches_async(records, batch_size, max_batch_bytes)
+    batch_indexes = itertools.count()
+    # Records are consumed lazily, so an async source is read as batches are sent, not all at once
+    next_batch_lock = asyncio.Lock()
+    results = []
+
+    async def _send_batches():
+        while True:
+            async with next_batch_lock:
+                try:
+                    batch = await batches.__anext__()
+                except StopAsyncIteration:
+                    return
+                index = next(batch_indexes)
+            try:
+                response = await send(batch, **kwargs)
+            except Exception as e:
+                logger.exception(
+                    f"Error sending batch {index} ({len(batch)} records) to Gundi: {type(e).__name__}: {e}",
+                    extra={"integration_id": kwargs.get("integration_id")}
+                )
+                results.append(BatchResult(index=index, size=len(batch), response=None, error=e))
+            else:
+                results.append(BatchResult(index=index, size=len(batch), response=response, error=None))
+
+    await asyncio.gather(*[_send_batches() for _ in range(max(1, max_concurrency))])
+    return sorted(results, key=lambda result: result.index)
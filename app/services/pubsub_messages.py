@@ -0,0 +1,217 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+from typing import Awaitable, Callable, List, Optional, Tuple
+from fastapi import Response, status
+from fastapi.responses import JSONResponse
+from app import settings
+from app.services.action_runner import execute_action
+from app.services.config_events_consumer import process_config_event
+from app.services.state import IntegrationStateManager, MESSAGE_DONE
+from app.services.task_executor import BoundedTaskExecutor, ExecutorUnavailableError
+
+
+logger = logging.getLogger(__name__)
+state_manager = IntegrationStateManager()
+
+ACK = "ack"
+NACK = "nack"
+
+
+class RetryLaterResponse(JSONResponse):
+    """A client error response for a message that must be redelivered later, e.g. one that is in progress"""
+
+
+def get_message(item: dict) -> dict:
+    """Accept PubSub push envelopes ({"message": {...}, "subscription": ...}) or bare messages"""
+    return item.get("message", item) if isinstance(item, dict) else {}
+
+
+def get_message_id(message: dict):
+    return message.get("messageId") or message.get("message_id")
+
+
+def decode_message_data(message: dict) -> dict:
+    data = base64.b64decode(message.get("data", "")).decode("utf-8").strip()
+    return json.loads(data) if data else {}
+
+
+async def run_action_message(message: dict):
+    """Run the action requested in a PubSub message, e.g. a pull action scheduled by the portal"""
+    json_payload = decode_message_data(message)
+    return await execute_action(
+        integration_id=json_payload.get("integration_id"),
+        action_id=json_payload.get("action_id"),
+        config_overrides=json_payload.get("config_overrides"),
+        triggered_by=json_payload.get("triggered_by"),
+    )
+
+
+def get_push_message_key(message: dict) -> str:
+    """Redeliveries of a message keep its id. Messages without one are identified by a hash of their data."""
+    message_id = get_message_id(message)
+    if message_id:
+        return str(message_id)
+    return hashlib.sha256(str(message.get("data", "")).encode("utf-8")).hexdigest()
+
+
+async def _claim_message(destination_id: str, message_key: str) -> Optional[str]:
+    """Returns None if the message was claimed, or the mark of the run that has it ("in_progress" or "done")"""
+    try:
+        return await state_manager.claim_message(
+            destination_id, message_key, ttl_seconds=settings.MAX_ACTION_EXECUTION_TIME
+        )
+    except Exception as e:  # Fail open, processing a message twice is better than losing it
+        logger.warning(f"Couldn't claim message '{message_key}': {type(e).__name__}: {e}")
+        return None
+
+
+async def _set_message_processed(destination_id: str, message_key: str):
+    try:
+        await state_manager.set_message_processed(
+            destination_id, message_key, ttl_seconds=settings.PUSH_DATA_IDEMPOTENCY_TTL
+        )
+    except Exception as e:
+        logger.warning(f"Couldn't mark message '{message_key}' as processed: {type(e).__name__}: {e}")
+
+
+async def _release_message(destination_id: str, message_key: str):
+    try:
+        await state_manager.release_message(destination_id, message_key)
+    except Exception as e:  # The claim expires after MAX_ACTION_EXECUTION_TIME anyway
+        logger.warning(f"Couldn't release message '{message_key}': {type(e).__name__}: {e}")
+
+
+async def execute_push_action_once(destination_id: str, data: dict, attributes: dict, message_key: str = None):
+    """
+    Run the push action for a message, unless it was processed successfully already or is in progress.
+    A message is processed again when PubSub redelivers it, e.g. if the ack was lost, so it's claimed
+    atomically before running, and successful messages are remembered for PUSH_DATA_IDEMPOTENCY_TTL seconds.
+    Redeliveries of messages in progress get a 409, so PubSub retries them later if the first run fails.
+    """
+    remember = bool(message_key and settings.PUSH_DATA_IDEMPOTENCY_TTL)
+    if remember and (mark := await _claim_message(destination_id, message_key)):
+        if mark == MESSAGE_DONE:
+            logger.info(f"Message '{message_key}' for destination '{destination_id}' was processed already. Skipped.")
+            return {"skipped": True, "reason": "already_processed"}
+        logger.info(f"Message '{message_key}' for destination '{destination_id}' is being processed. Skipped.")
+        return RetryLaterResponse(status_code=status.HTTP_409_CONFLICT, content={"skipped": True, "reason": "in_progress"})
+    try:
+        result = await execute_action(
+            integration_id=destination_id,
+            data=data,
+            metadata=attributes
+        )
+    except Exception:
+        if remember:
+            await _release_message(destination_id, message_key)
+        raise
+    if remember:
+        if is_failed_result(result):
+            await _release_message(destination_id, message_key)
+        else:
+            await _set_message_processed(destination_id, message_key)
+    return result
+
+
+async def run_push_data_message(message: dict):
+    """Run the push action for the data in a PubSub message"""
+    json_payload = decode_message_data(message)
+    attributes = message.get("attributes") or {}
+    destination_id = attributes.get("destination_id")
+    if not destination_id:
+        # Ack malformed messages, they can never succeed. Log attribute keys only; the values may carry sensitive data.
+        logger.error(
+            f"PubSub message missing required attribute 'destination_id'. "
+            f"Attribute keys: {sorted(attributes.keys())}"
+        )
+        return {"skipped": True, "reason": "missing_destination_id"}
+    return await execute_push_action_once(
+        destination_id=destination_id,
+        data=json_payload,
+        attributes=attributes,
+        message_key=get_push_message_key(message),
+    )
+
+
+async def run_config_event_message(message: dict):
+    """Process a configuration event sent by the portal"""
+    event_data = decode_message_data(message)
+    return await process_config_event(event_data, message.get("attributes"))
+
+
+def is_failed_result(result) -> bool:
+    """execute_action returns error responses instead of raising, so they are checked by status code"""
+    return isinstance(result, Response) and result.status_code >= 400
+
+
+def is_retryable_result(result) -> bool:
+    """
+    Server errors (5xx) may succeed on a retry. Client errors (4xx), like an unsupported action or a missing
+    configuration, would fail the same way again, unless the response asks to retry later.
+    """
+    return isinstance(result, RetryLaterResponse) or (isinstance(result, Response) and result.status_code >= 500)
+
+
+async def run_message_for_ack(run_message: Callable[[dict], Awaitable], message: dict) -> Tuple[str, Optional[str]]:
+    """
+    Run a message and tell whether it must be acked or nacked, with the error if any.
+    Only exceptions and server errors are nacked. Messages that can't be decoded, and actions
+    that fail with a client error (4xx), are acked, as retrying them would never succeed.
+    Note the `/` endpoint acks every pull command, even failed ones, while `/batch` (which
+    uses this) nacks server errors so PubSub retries those commands.
+    """
+    message_id = get_message_id(message)
+    try:
+        response = await run_message(message)
+    except (binascii.Error, UnicodeDecodeError, json.JSONDecodeError) as e:  # Malformed data
+        logger.error(f"Malformed PubSub message '{message_id}' acked without processing: {e}")
+        return ACK, f"Malformed message: {type(e).__name__}: {e}"
+    except Exception as e:
+        logger.exception(f"Error processing PubSub message '{message_id}': {e}")
+        return NACK, f"{type(e).__name__}: {e}"
+    if is_retryable_result(response):
+        return NACK, f"Action failed with status {response.status_code}"
+    if is_failed_result(response):
+        logger.warning(
+            f"PubSub message '{message_id}' acked without retrying. Action failed with status {response.status_code}"
+        )
+        return ACK, f"Action failed with status {response.status_code}, not retried"
+    return ACK, None
+
+
+async def process_messages_batch(
+        items: List[dict],
+        run_message: Callable[[dict], Awaitable],
+        executor: BoundedTaskExecutor,
+        max_concurrency: int = None,
+) -> List[dict]:
+    """
+    Run many PubSub messages concurrently, up to `max_concurrency` at a time, through the given executor.
+    Returns an ack or nack result per message, in the same order, so only the failed ones are redelivered.
+    """
+    max_concurrency = max_concurrency or settings.PUBSUB_BATCH_MAX_CONCURRENCY
+    semaphore = asyncio.Semaphore(max_concurrency)
+
+    async def _process(message, result):
+        async with semaphore:
+            ack_status, error = await run_message_for_ack(run_message, message)
+        result["status"] = ack_status
+        if error:
+            result["error"] = error
+
+    results, tasks = [], []
+    for item in items:  # Start tasks for the whole batch first, messages that don't fit are nacked
+        message = get_message(item)
+        result = {"message_id": get_message_id(message), "status": ACK}
+        results.append(result)
+        try:
+            tasks.append(executor.submit(_process, message, result))
+        except ExecutorUnavailableError as e:
+            result.update(status=NACK, error=str(e))
+    if tasks:
+        await asyncio.wait(tasks)
+    return results
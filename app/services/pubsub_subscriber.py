@@ -0,0 +1,219 @@
+import asyncio
+import base64
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from gcloud.aio.pubsub import SubscriberClient, SubscriberMessage
+from app import settings
+from app.services.pubsub_messages import run_message_for_ack, ACK
+
+
+logger = logging.getLogger(__name__)
+
+
+def get_subscription_path(subscription: str) -> str:
+    if subscription.startswith("projects/"):
+        return subscription
+    return f"projects/{settings.GCP_PROJECT_ID}/subscriptions/{subscription}"
+
+
+def to_push_message(message: SubscriberMessage) -> dict:
+    """Convert a pulled message to the format of push messages, so the same functions process both"""
+    return {
+        "data": base64.b64encode(message.data).decode("utf-8") if message.data else "",
+        "attributes": message.attributes or {},
+        "messageId": message.message_id,
+    }
+
+
+class StreamingPullSubscriber:
+    """Pulls messages from a PubSub subscription and runs them concurrently.
+
+    Flow control keeps up to `max_outstanding_messages` messages, or about
+    `max_outstanding_bytes` of data, being processed at the same time; pulling
+    waits until there's room for more. The leases of messages in progress are
+    extended every half `ack_deadline`, for up to `max_lease_duration` seconds,
+    so long actions aren't redelivered while they run. Acks and nacks are sent
+    in batches, every `ack_window` seconds or when `ack_batch_size` are pending.
+    Nacked messages are redelivered after `nack_delay` seconds rather than right
+    away, so a failing message isn't retried in a tight loop.
+    The `subscriber_client` can be a gcloud-aio SubscriberClient (which honors
+    PUBSUB_EMULATOR_HOST) or any object with the same pull and ack methods.
+    """
+
+    def __init__(
+            self, subscription: str, run_message: Callable[[dict], Awaitable], subscriber_client: SubscriberClient,
+            max_outstanding_messages: int = 100, max_outstanding_bytes: int = 100 * 1024 * 1024,
+            ack_deadline: float = 60, max_lease_duration: Optional[float] = None,
+            ack_batch_size: int = 100, ack_window: float = 0.5, pull_error_backoff: float = 1.0,
+            nack_delay: int = 10,
+    ):
+        self.subscription = get_subscription_path(subscription)
+        self.run_message = run_message
+        self.subscriber_client = subscriber_client
+        self.max_outstanding_messages = max_outstanding_messages
+        self.max_outstanding_bytes = max_outstanding_bytes
+        self.ack_deadline = ack_deadline
+        self.max_lease_duration = settings.MAX_ACTION_EXECUTION_TIME if max_lease_duration is None else max_lease_duration
+        self.ack_batch_size = ack_batch_size
+        self.ack_window = ack_window
+        self.pull_error_backoff = pull_error_backoff
+        self.nack_delay = nack_delay
+        self._outstanding: Dict[str, Tuple[float, int]] = {}  # ack_id -> (received at, size)
+        self._outstanding_bytes = 0
+        self._handlers = set()
+        self._acks: List[str] = []
+        self._nacks: List[str] = []
+        self._puller: Optional[asyncio.Task] = None
+        self._background: List[asyncio.Task] = []
+        self._capacity_available: Optional[asyncio.Event] = None
+        self._acks_ready: Optional[asyncio.Event] = None
+        # Counters to help sizing the flow control
+        self.received = 0
+        self.acked = 0
+        self.nacked = 0
+        self.lease_extensions = 0
+        self.pull_errors = 0
+
+    @property
+    def is_running(self) -> bool:
+        return self._puller is not None and not self._puller.done()
+
+    def start(self):
+        if self.is_running:
+            return
+        self._capacity_available = asyncio.Event()
+        self._acks_ready = asyncio.Event()
+        self._puller = asyncio.create_task(self._pull())
+        self._background = [asyncio.create_task(self._extend_leases()), asyncio.create_task(self._send_acks())]
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Stop pulling, wait for the messages in progress and send their acks."""
+        if self._puller is None:
+            return
+        self._puller.cancel()
+        await asyncio.gather(self._puller, return_exceptions=True)
+        if self._handlers:
+            done, pending = await asyncio.wait(set(self._handlers), timeout=timeout)
+            if pending:
+                logger.warning(
+                    f"{len(pending)} messages from {self.subscription} were still in progress on shutdown. "
+                    "They will be redelivered."
+                )
+        for task in self._background:
+            task.cancel()
+        await asyncio.gather(*self._background, return_exceptions=True)
+        await self._flush_acks()
+        self._puller = None
+        self._background = []
+
+    def stats(self) -> dict:
+        return {
+            "outstanding_messages": len(self._outstanding),
+            "outstanding_bytes": self._outstanding_bytes,
+            "received": self.received,
+            "acked": self.acked,
+            "nacked": self.nacked,
+            "lease_extensions": self.lease_extensions,
+            "pull_errors": self.pull_errors,
+        }
+
+    def _has_capacity(self) -> bool:
+        return (
+            len(self._outstanding) < self.max_outstanding_messages
+            and self._outstanding_bytes < self.max_outstanding_bytes
+        )
+
+    async def _pull(self):
+        while True:
+            while not self._has_capacity():
+                self._capacity_available.clear()
+                await self._capacity_available.wait()
+            try:
+                messages = await self.subscriber_client.pull(
+                    self.subscription, max_messages=self.max_outstanding_messages - len(self._outstanding)
+                )
+            except Exception as e:
+                self.pull_errors += 1
+                logger.warning(f"Error pulling messages from {self.subscription}: {type(e).__name__}: {e}")
+                await asyncio.sleep(self.pull_error_backoff)
+                continue
+            for message in messages:
+                self._dispatch(message)
+
+    def _dispatch(self, message: SubscriberMessage):
+        size = len(message.data or b"")
+        self.received += 1
+        self._outstanding[message.ack_id] = (time.monotonic(), size)
+        self._outstanding_bytes += size
+        task = asyncio.create_task(self._handle(message))
+        self._handlers.add(task)
+        task.add_done_callback(self._handlers.discard)
+
+    async def _handle(self, message: SubscriberMessage):
+        try:
+            ack_status, _ = await run_message_for_ack(self.run_message, to_push_message(message))
+        finally:
+            _, size = self._outstanding.pop(message.ack_id, (None, 0))
+            self._outstanding_bytes -= size
+            self._capacity_available.set()
+        if ack_status == ACK:
+            self._acks.append(message.ack_id)
+        else:
+            self._nacks.append(message.ack_id)
+        if len(self._acks) + len(self._nacks) >= self.ack_batch_size:
+            self._acks_ready.set()
+
+    async def _send_acks(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._acks_ready.wait(), timeout=self.ack_window)
+            except asyncio.TimeoutError:
+                pass
+            self._acks_ready.clear()
+            await self._flush_acks()
+
+    async def _flush_acks(self):
+        acks, self._acks = self._acks, []
+        nacks, self._nacks = self._nacks, []
+        for i in range(0, len(acks), self.ack_batch_size):
+            ack_ids = acks[i:i + self.ack_batch_size]
+            try:
+                await self.subscriber_client.acknowledge(self.subscription, ack_ids=ack_ids)
+            except Exception as e:  # The messages will be redelivered
+                logger.warning(f"Error acking {len(ack_ids)} messages from {self.subscription}: {type(e).__name__}: {e}")
+            else:
+                self.acked += len(ack_ids)
+        for i in range(0, len(nacks), self.ack_batch_size):
+            ack_ids = nacks[i:i + self.ack_batch_size]
+            try:  # The messages are redelivered when the new deadline expires
+                await self.subscriber_client.modify_ack_deadline(
+                    self.subscription, ack_ids=ack_ids, ack_deadline_seconds=self.nack_delay
+                )
+            except Exception as e:  # The messages will be redelivered when the lease expires
+                logger.warning(f"Error nacking {len(ack_ids)} messages from {self.subscription}: {type(e).__name__}: {e}")
+            else:
+                self.nacked += len(ack_ids)
+
+    async def _extend_leases(self):
+        while True:
+            await asyncio.sleep(self.ack_deadline / 2)
+            now = time.monotonic()
+            # Messages in progress for too long are left to expire, and redelivered
+            ack_ids = [
+                ack_id for ack_id, (received_at, _) in self._outstanding.items()
+                if now - received_at < self.max_lease_duration
+            ]
+            for i in range(0, len(ack_ids), self.ack_batch_size):
+                batch = ack_ids[i:i + self.ack_batch_size]
+                try:  # PubSub accepts deadlines of 10 seconds or more (0 is a nack)
+                    await self.subscriber_client.modify_ack_deadline(
+                        self.subscription, ack_ids=batch, ack_deadline_seconds=max(int(self.ack_deadline), 10)
+                    )
+                except Exception as e:
+                    logger.warning(
+                        f"Error extending the lease of {len(batch)} messages from {self.subscription}: "
+                        f"{type(e).__name__}: {e}"
+                    )
+                else:
+                    self.lease_extensions += len(batch)
@@ -0,0 +1,191 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Optional
+import redis.asyncio as redis
+from app import settings
+from app.services.errors import RateLimiterWaitExceededError, classify_error
+from app.services.utils import LRUCache
+
+
+logger = logging.getLogger(__name__)
+
+
+# GCRA (generic cell rate algorithm): each key stores the theoretical arrival time (TAT) of the next request.
+# A request is allowed if it doesn't arrive more than `burst_offset` seconds before its TAT.
+# Returns "0" when the request is allowed, or the seconds to wait otherwise (as strings, to keep decimals).
+# Uses the redis clock, so all the instances agree on the time.
+_ACQUIRE_SCRIPT = """
+local emission_interval = tonumber(ARGV[1])
+local burst_offset = tonumber(ARGV[2])
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local tat = tonumber(redis.call("GET", KEYS[1])) or now
+if tat < now then
+    tat = now
+end
+local allow_at = tat + emission_interval - burst_offset
+if allow_at > now then
+    return tostring(allow_at - now)
+end
+local new_tat = tat + emission_interval
+redis.call("SET", KEYS[1], tostring(new_tat), "PX", math.ceil((new_tat - now) * 1000) + 1)
+return "0"
+"""
+
+# Holds requests for `seconds`, e.g. when the provider answers with a Retry-After header
+_BLOCK_SCRIPT = """
+local emission_interval = tonumber(ARGV[1])
+local burst_offset = tonumber(ARGV[2])
+local seconds = tonumber(ARGV[3])
+local now_parts = redis.call("TIME")
+local now = tonumber(now_parts[1]) + tonumber(now_parts[2]) / 1000000
+local blocked_tat = now + seconds + burst_offset - emission_interval
+local tat = tonumber(redis.call("GET", KEYS[1])) or now
+if blocked_tat > tat then
+    redis.call("SET", KEYS[1], tostring(blocked_tat), "PX", math.ceil((blocked_tat - now) * 1000) + 1)
+end
+return "0"
+"""
+
+
+class InMemoryRateLimitBackend:
+    """Keeps the rate limits in the process. Good for a single instance, or for limits per instance."""
+
+    def __init__(self, max_size: int = 10000):
+        # Keys idle for long have a TAT in the past and behave as new ones, so evicting them is harmless
+        self._tats = LRUCache(max_size=max_size)
+
+    async def acquire(self, key: str, emission_interval: float, burst_offset: float) -> float:
+        now = time.monotonic()
+        tat = max(self._tats.get(key, now), now)
+        allow_at = tat + emission_interval - burst_offset
+        if allow_at > now:
+            return allow_at - now
+        self._tats.set(key, tat + emission_interval)
+        return 0.0
+
+    async def block(self, key: str, emission_interval: float, burst_offset: float, seconds: float):
+        now = time.monotonic()
+        blocked_tat = now + seconds + burst_offset - emission_interval
+        if blocked_tat > self._tats.get(key, now):
+            self._tats.set(key, blocked_tat)
+
+
+class RedisRateLimitBackend:
+    """Keeps the rate limits in redis, shared by all the instances of the service.
+    If redis is unavailable, it falls back to limits in memory, per instance."""
+
+    def __init__(self, **kwargs):
+        host = kwargs.get("host", settings.REDIS_HOST)
+        port = kwargs.get("port", settings.REDIS_PORT)
+        db = kwargs.get("db", settings.REDIS_STATE_DB)
+        self.db_client = redis.Redis(host=host, port=port, db=db)
+        self.fallback = InMemoryRateLimitBackend()
+
+    async def acquire(self, key: str, emission_interval: float, burst_offset: float) -> float:
+        try:
+            wait = await self.db_client.eval(
+                _ACQUIRE_SCRIPT, 1, f"rate_limit.{key}", repr(emission_interval), repr(burst_offset)
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit of '{key}' checked in memory, redis is unavailable: {type(e).__name__}: {e}")
+            return await self.fallback.acquire(key, emission_interval, burst_offset)
+        return float(wait)
+
+    async def block(self, key: str, emission_interval: float, burst_offset: float, seconds: float):
+        try:
+            await self.db_client.eval(
+                _BLOCK_SCRIPT, 1, f"rate_limit.{key}", repr(emission_interval), repr(burst_offset), repr(seconds)
+            )
+        except redis.RedisError as e:
+            logger.warning(f"Rate limit of '{key}' blocked in memory, redis is unavailable: {type(e).__name__}: {e}")
+            await self.fallback.block(key, emission_interval, burst_offset, seconds)
+
+
+_backends: Dict[str, object] = {}
+
+
+def get_rate_limit_backend(name: str = None):
+    """Get the shared backend by name ("redis" or "memory"). Defaults to the RATE_LIMITER_BACKEND setting."""
+    name = name or settings.RATE_LIMITER_BACKEND
+    if name not in _backends:
+        if name == "redis":
+            _backends[name] = RedisRateLimitBackend()
+        elif name == "memory":
+            _backends[name] = InMemoryRateLimitBackend()
+        else:
+            raise ValueError(f"Unknown rate limiter backend '{name}'. Use 'redis' or 'memory'.")
+    return _backends[name]
+
+
+class RateLimiter:
+    """
+    Limits requests to `rate` per `period` seconds, allowing bursts of up to `burst` requests.
+    Limits are kept per key, e.g. per integration, or with a single key for a whole provider account.
+    Waits for up to `max_wait` seconds for a turn, then raises RateLimiterWaitExceededError (an IntegrationRateLimitError).
+
+    Usage in an action handler:
+        provider_limiter = RateLimiter(name="my_provider", rate=10, period=1)
+
+        async with provider_limiter.limit(str(integration.id)):
+            response = await client.get(...)
+
+    Rate limit errors raised inside `limit()` with a retry time (e.g. from a Retry-After header)
+    hold the following requests for the same key until then, in all the instances.
+    Waits exceeded in other limiters (RateLimiterWaitExceededError) don't, so limiters can be nested.
+    """
+
+    def __init__(
+            self, name: str, rate: float, period: float = 1.0, burst: int = 1,
+            backend=None, max_wait: Optional[float] = None
+    ):
+        if rate <= 0 or period <= 0 or burst < 1:
+            raise ValueError("The rate and period must be positive, and the burst at least 1.")
+        self.name = name
+        self.emission_interval = period / rate
+        self.burst_offset = self.emission_interval * burst
+        self.max_wait = settings.RATE_LIMITER_MAX_WAIT if max_wait is None else max_wait
+        self._backend = backend
+
+    @property
+    def backend(self):
+        return self._backend or get_rate_limit_backend()
+
+    def _get_key(self, key: Optional[str]) -> str:
+        return f"{self.name}.{key}" if key else self.name
+
+    async def try_acquire(self, key: str = None) -> float:
+        """Take a turn if available. Returns 0 if taken, or the seconds to wait for the next turn."""
+        return await self.backend.acquire(self._get_key(key), self.emission_interval, self.burst_offset)
+
+    async def acquire(self, key: str = None, max_wait: Optional[float] = None):
+        """Wait for a turn, for up to `max_wait` seconds"""
+        max_wait = self.max_wait if max_wait is None else max_wait
+        deadline = time.monotonic() + max_wait
+        while (wait := await self.try_acquire(key)) > 0:
+            if time.monotonic() + wait > deadline:
+                raise RateLimiterWaitExceededError(
+                    f"Rate limit of '{self._get_key(key)}' exceeded, next turn in {wait:.1f} seconds",
+                    retry_after=wait,
+                )
+            await asyncio.sleep(wait)
+
+    async def block(self, seconds: float, key: str = None):
+        """Hold the requests for the key for `seconds`"""
+        logger.info(f"Holding requests to '{self._get_key(key)}' for {seconds:g} seconds.")
+        await self.backend.block(self._get_key(key), self.emission_interval, self.burst_offset, seconds)
+
+    @asynccontextmanager
+    async def limit(self, key: str = None, max_wait: Optional[float] = None):
+        await self.acquire(key, max_wait=max_wait)
+        try:
+            yield
+        except RateLimiterWaitExceededError:  # From a nested limiter, the provider didn't ask to wait
+            raise
+        except Exception as e:
+            classified = classify_error(e)
+            if classified and classified.error_type == "rate_limit" and classified.retry_after:
+                await self.block(classified.retry_after, key)
+            raise
@@ -1,10 +1,35 @@
 import json
+import uuid
 import stamina
 import httpx
 import redis.asyncio as redis
 from app import settings
 
 
+# Deletes the lease only if it's still held with the given token, so a run never releases a lease taken by another one
+_RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Sets the mark of a message unless it has one, returning the current mark (or nil if it was set), in one step.
+# With SET NX and then a GET, a mark that expired in between would read as claimed without being set.
+_CLAIM_MESSAGE_SCRIPT = """
+local mark = redis.call("get", KEYS[1])
+if mark then
+    return mark
+end
+redis.call("set", KEYS[1], ARGV[1], "EX", ARGV[2])
+return false
+"""
+
+# Marks of push data messages, to skip redeliveries of messages in progress or processed already
+MESSAGE_IN_PROGRESS = "in_progress"
+MESSAGE_DONE = "done"
+
+
 class IntegrationStateManager:
 
     def __init__(self, **kwargs):
@@ -55,6 +80,49 @@ class IntegrationStateManager:
                     f"integration_state.{integration_id}.{action_id}.{source_id}"
                 )
 
+    async def acquire_lease(self, integration_id: str, action_id: str, *, ttl_seconds: int):
+        """Take an exclusive lease on an action for an integration, for up to `ttl_seconds`.
+
+        Returns a token to release the lease with, or None if the lease is
+        held by another run. Redis errors are raised right away, without
+        retries, so callers can decide to go ahead without the lease.
+        """
+        token = uuid.uuid4().hex
+        acquired = await self.db_client.set(
+            f"integration_lease.{integration_id}.{action_id}",
+            token,
+            ex=ttl_seconds,
+            nx=True,
+        )
+        return token if acquired else None
+
+    async def release_lease(self, integration_id: str, action_id: str, token: str) -> bool:
+        """Release a lease taken with `acquire_lease`. Returns False if it had expired or was taken by another run."""
+        released = await self.db_client.eval(
+            _RELEASE_LEASE_SCRIPT, 1, f"integration_lease.{integration_id}.{action_id}", token
+        )
+        return bool(released)
+
+    async def claim_message(self, integration_id: str, message_key: str, *, ttl_seconds: int):
+        """Mark a message as in progress for the integration, for up to `ttl_seconds`, unless it's marked already.
+        Returns None if the message was claimed by this call, or its current mark: "in_progress" or "done".
+        Redis errors are raised right away, without retries."""
+        status = await self.db_client.eval(
+            _CLAIM_MESSAGE_SCRIPT, 1, f"processed_message.{integration_id}.{message_key}",
+            MESSAGE_IN_PROGRESS, ttl_seconds
+        )
+        return status.decode("utf-8") if isinstance(status, bytes) else status
+
+    async def set_message_processed(self, integration_id: str, message_key: str, *, ttl_seconds: int):
+        """Mark a message as processed successfully for the integration, for `ttl_seconds`.
+        Redis errors are raised right away, without retries."""
+        await self.db_client.set(f"processed_message.{integration_id}.{message_key}", MESSAGE_DONE, ex=ttl_seconds)
+
+    async def release_message(self, integration_id: str, message_key: str):
+        """Remove the mark of a message, so it can be processed again.
+        Redis errors are raised right away, without retries."""
+        await self.db_client.delete(f"processed_message.{integration_id}.{message_key}")
+
     def __str__(self):
         return f"IntegrationStateManager(host={self.db_client.host}, port={self.db_client.port}, db={self.db_client.db})"
 
@@ -0,0 +1,161 @@
+import asyncio
+import logging
+from typing import Optional, Set
+from fastapi import HTTPException, status
+from app import settings
+
+
+logger = logging.getLogger(__name__)
+
+
+class ExecutorUnavailableError(Exception):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
+
+class ExecutorSaturatedError(ExecutorUnavailableError):
+    # PubSub redelivers messages answered with a non-2xx status later, with backoff
+    status_code = status.HTTP_429_TOO_MANY_REQUESTS
+
+
+class BoundedTaskExecutor:
+    """
+    Bounds the work of one kind (e.g. webhooks) running in the service.
+    Up to `max_in_flight` tasks run at the same time, and up to `max_queue_size` more wait for a slot.
+    Callers start the work with `submit()`, which fails right away when the executor is saturated
+    or shutting down, so the request can be rejected instead of piling up.
+    The work runs in its own asyncio task, which releases its place when it finishes, whether
+    the caller awaits it inline or leaves it running after the response is sent.
+    """
+
+    def __init__(self, name: str, max_in_flight: int = 10, max_queue_size: int = 100):
+        self.name = name
+        self.max_in_flight = max_in_flight
+        self.max_queue_size = max_queue_size
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._closed = False
+        self._tasks: Set[asyncio.Task] = set()  # Queued or running
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._semaphore_loop: Optional[asyncio.AbstractEventLoop] = None
+
+    @property
+    def pending(self) -> int:
+        return len(self._tasks)
+
+    def _get_semaphore(self) -> asyncio.Semaphore:
+        # Created in the loop running the tasks, a semaphore can't be shared across event loops
+        loop = asyncio.get_running_loop()
+        if self._semaphore is None or self._semaphore_loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+            self._semaphore_loop = loop
+        return self._semaphore
+
+    def submit(self, func, *args, **kwargs) -> asyncio.Task:
+        """Start a task that waits for a free slot, or raise ExecutorUnavailableError if there's no room for it"""
+        if self._closed:
+            self.rejected += 1
+            raise ExecutorUnavailableError(f"The {self.name} executor is shutting down")
+        if self.pending >= self.max_in_flight + self.max_queue_size:
+            self.rejected += 1
+            raise ExecutorSaturatedError(
+                f"Too many {self.name} tasks in progress ({self.pending}). Please retry later."
+            )
+        task = asyncio.create_task(self._run(func, *args, **kwargs))
+        self._tasks.add(task)
+        task.add_done_callback(self._task_done)
+        return task
+
+    def _task_done(self, task: asyncio.Task):
+        self._tasks.discard(task)
+        if not task.cancelled() and task.exception() is not None:  # Retrieved, in case nobody awaits the task
+            logger.error(f"Error in {self.name} task: {type(task.exception()).__name__}: {task.exception()}")
+
+    async def _run(self, func, *args, **kwargs):
+        async with self._get_semaphore():
+            self.running += 1
+            try:
+                result = await func(*args, **kwargs)
+            except Exception:
+                self.failed += 1
+                raise
+            finally:
+                self.running -= 1
+            self.completed += 1
+            return result
+
+    async def drain(self, timeout: float = None):
+        """Stop accepting tasks, and wait up to `timeout` seconds for the ones in progress to finish"""
+        self._closed = True
+        timeout = settings.BACKGROUND_TASKS_DRAIN_TIMEOUT if timeout is None else timeout
+        loop = asyncio.get_running_loop()
+        tasks = [task for task in self._tasks if task.get_loop() is loop]
+        if not tasks:
+            return
+        _, pending = await asyncio.wait(tasks, timeout=timeout)
+        if pending:
+            logger.warning(f"{len(pending)} {self.name} tasks were still in progress after {timeout} seconds.")
+
+    def reopen(self):
+        self._closed = False
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "max_in_flight": self.max_in_flight,
+            "max_queue_size": self.max_queue_size,
+        }
+
+
+webhook_executor = BoundedTaskExecutor(
+    name="webhook",
+    max_in_flight=settings.WEBHOOKS_MAX_IN_FLIGHT,
+    max_queue_size=settings.WEBHOOKS_MAX_QUEUE_SIZE,
+)
+# Actions run by id, from PubSub commands or the API (pull, auth and other actions)
+pull_action_executor = BoundedTaskExecutor(
+    name="pull",
+    max_in_flight=settings.PULL_ACTIONS_MAX_IN_FLIGHT,
+    max_queue_size=settings.PULL_ACTIONS_MAX_QUEUE_SIZE,
+)
+push_action_executor = BoundedTaskExecutor(
+    name="push",
+    max_in_flight=settings.PUSH_ACTIONS_MAX_IN_FLIGHT,
+    max_queue_size=settings.PUSH_ACTIONS_MAX_QUEUE_SIZE,
+)
+executors = [webhook_executor, pull_action_executor, push_action_executor]
+
+
+def submit_or_reject(executor: BoundedTaskExecutor, func, *args, **kwargs) -> asyncio.Task:
+    """Start a task in the executor, or reject the request with a 429 or 503 response so it's retried later"""
+    try:
+        return executor.submit(func, *args, **kwargs)
+    except ExecutorUnavailableError as e:
+        logger.warning(str(e))
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+
+
+async def wait_for_task(task: asyncio.Task):
+    """
+    Wait for a submitted task without raising its errors (they are logged by the executor).
+    Used as a response background task: the task runs anyway, this keeps the request around until it's done.
+    """
+    await asyncio.wait([task])
+
+
+def start_executors():
+    for executor in executors:
+        executor.reopen()
+
+
+async def drain_executors(timeout: float = None):
+    await asyncio.gather(*[executor.drain(timeout=timeout) for executor in executors])
+
+
+def get_executors_stats() -> dict:
+    return {executor.name: executor.stats() for executor in executors}
@@ -1,5 +1,7 @@
 import base64
 import json
+import sys
+import types
 
 import httpx
 import pytest
@@ -10,6 +12,8 @@ from gundi_core.events import IntegrationActionFailed, IntegrationActionCustomLo
 from gundi_core.events.transformers import ObservationTransformedER
 
 from app import settings
+from app.actions import get_action_handler_by_data_type
+from app.actions.core import discover_actions, index_actions_by_data_type
 from app.conftest import MockSubActionConfiguration, MockPushActionConfiguration, async_return
 from app.main import app
 from app.services.action_scheduler import trigger_action
@@ -71,6 +75,7 @@ async def test_execute_push_action_from_pubsub(
 ):
     mocker.patch("app.services.action_runner.action_handlers", mock_action_handlers)
     mocker.patch("app.actions.action_handlers", mock_action_handlers)
+    mocker.patch("app.actions.action_handlers_by_data_type", index_actions_by_data_type(mock_action_handlers))
     mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2)
     mocker.patch("app.services.action_runner.config_manager", mock_config_manager)
     mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
@@ -290,6 +295,90 @@ async def test_scheduled_pull_action_with_invalid_config_is_skipped(
     assert "validation_error" in (skip_logs[0].payload.data or {})
 
 
+@pytest.mark.asyncio
+async def test_overlapping_pull_action_run_is_skipped(
+        mocker, mock_gundi_client_v2, mock_config_manager, mock_publish_event,
+        mock_action_handlers, mock_state_manager, integration_v2,
+):
+    # Another run of the same pull for the same integration holds the lease
+    # (e.g. a slow run or a redelivered command), so this one skips cleanly.
+    mocker.patch("app.services.action_runner.action_handlers", mock_action_handlers)
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager)
+    mocker.patch("app.services.action_runner.state_manager", mock_state_manager)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mock_state_manager.acquire_lease.return_value = async_return(None)  # lease taken
+
+    response = await execute_action(
+        integration_id=str(integration_v2.id),
+        action_id="pull_observations",
+    )
+
+    assert response == {"skipped": True, "reason": "already_running"}
+    mock_action_handler, _, _ = mock_action_handlers["pull_observations"]
+    assert not mock_action_handler.called
+    assert not mock_state_manager.release_lease.called
+    assert not _published_events_of_type(mock_publish_event, IntegrationActionFailed)
+
+
+@pytest.mark.asyncio
+async def test_overlapping_manual_pull_action_run_is_rejected(
+        mocker, mock_gundi_client_v2, mock_config_manager, mock_publish_event,
+        mock_action_handlers, mock_state_manager, integration_v2,
+):
+    # A manual run isn't skipped silently, the user who triggered it is told to try again later
+    mocker.patch("app.services.action_runner.action_handlers", mock_action_handlers)
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager)
+    mocker.patch("app.services.action_runner.state_manager", mock_state_manager)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mock_state_manager.acquire_lease.return_value = async_return(None)  # lease taken
+
+    response = await execute_action(
+        integration_id=str(integration_v2.id),
+        action_id="pull_observations",
+        triggered_by="manual",
+    )
+
+    assert response.status_code == status.HTTP_409_CONFLICT
+    assert json.loads(response.body)["reason"] == "already_running"
+    mock_action_handler, _, _ = mock_action_handlers["pull_observations"]
+    assert not mock_action_handler.called
+
+
+@pytest.mark.asyncio
+async def test_pull_action_lease_is_released_after_the_run_and_fails_open(
+        mocker, mock_gundi_client_v2, mock_config_manager, mock_publish_event,
+        mock_action_handlers, mock_state_manager, integration_v2,
+):
+    mocker.patch("app.services.action_runner.action_handlers", mock_action_handlers)
+    mocker.patch("app.services.action_runner._portal", mock_gundi_client_v2)
+    mocker.patch("app.services.action_runner.config_manager", mock_config_manager)
+    mocker.patch("app.services.action_runner.state_manager", mock_state_manager)
+    mocker.patch("app.services.activity_logger.publish_event", mock_publish_event)
+    mocker.patch("app.services.action_runner.publish_event", mock_publish_event)
+    mock_action_handler, _, _ = mock_action_handlers["pull_observations"]
+
+    await execute_action(integration_id=str(integration_v2.id), action_id="pull_observations")
+
+    assert mock_action_handler.called
+    mock_state_manager.release_lease.assert_called_once_with(
+        str(integration_v2.id), "pull_observations", "lease-token"
+    )
+
+    # If redis is unavailable, the run goes ahead without a lease
+    mock_action_handler.reset_mock()
+    mock_state_manager.release_lease.reset_mock()
+    mock_state_manager.acquire_lease.side_effect = Exception("redis unavailable")
+
+    await execute_action(integration_id=str(integration_v2.id), action_id="pull_observations")
+
+    assert mock_action_handler.called
+    assert not mock_state_manager.release_lease.called
+
+
 @pytest.mark.asyncio
 async def test_scheduled_pull_action_invalid_config_warning_is_throttled(
         mocker, mock_gundi_client_v2, mock_config_manager, mock_publish_event,
@@ -599,7 +688,7 @@ async def test_execute_action_with_handler_error(
 async def test_push_data_acks_message_without_destination_id(
         mocker, pubsub_message_request_headers, run_push_action_pubsub_payload
 ):
-    mock_execute_action = mocker.patch("app.main.execute_action")
+    mock_execute_action = mocker.patch("app.services.pubsub_messages.execute_action")
     payload = json.loads(json.dumps(run_push_action_pubsub_payload))
     payload["message"]["attributes"].pop("destination_id", None)
 
@@ -724,3 +813,57 @@ async def test_execute_action_handles_httpx_error_carrying_no_request(
     error_details = json.loads(response.body)["detail"]
     assert error_details["error"] == "Could not reach the provider — connection failed"
     assert error_details["error_type"] == "connectivity"
+
+
+def test_get_action_handler_by_data_type(mocker, mock_action_handlers, mock_push_observations_handler):
+    mocker.patch("app.actions.action_handlers_by_data_type", index_actions_by_data_type(mock_action_handlers))
+
+    action_id, handler, config_model, data_model = get_action_handler_by_data_type(" ObservationTransformedER ")
+
+    assert action_id == "push_observations"
+    assert handler is mock_push_observations_handler
+    assert config_model == MockPushActionConfiguration
+    assert data_model == ObservationTransformedER
+    with pytest.raises(ValueError):
+        get_action_handler_by_data_type("EventTransformedER")
+
+
+def test_discover_actions_rejects_push_actions_with_the_same_data_type(mocker):
+    handlers = types.ModuleType("mock_push_handlers")
+
+    async def action_push_observations(integration, action_config: MockPushActionConfiguration, data: ObservationTransformedER, metadata: dict):
+        pass
+
+    async def action_push_positions(integration, action_config: MockPushActionConfiguration, data: ObservationTransformedER, metadata: dict):
+        pass
+
+    handlers.action_push_observations = action_push_observations
+    handlers.action_push_positions = action_push_positions
+    mocker.patch.dict(sys.modules, {"mock_push_handlers": handlers})
+
+    with pytest.raises(ValueError, match="ObservationTransformedER"):
+        discover_actions(module_name="mock_push_handlers", prefix="action_")
+
+
+def test_list_actions_from_registry(mocker, mock_action_handlers):
+    mocker.patch("app.actions.action_handlers", mock_action_handlers)
+
+    response = api_client.get("/v1/actions/")
+
+    assert response.status_code == 200
+    assert response.json() == list(mock_action_handlers.keys())
+    etag = response.headers["ETag"]
+
+    # Clients can revalidate the list with the ETag
+    response = api_client.get("/v1/actions/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+
+    # The list follows the registry, and a changed list gets a new ETag
+    mocker.patch("app.actions.action_handlers", {"pull_positions": mock_action_handlers["pull_observations"]})
+    response = api_client.get("/v1/actions/", headers={"If-None-Match": etag})
+
+    assert response.status_code == 200
+    assert response.json() == ["pull_positions"]
+    assert response.headers["ETag"] != etag
@@ -1,3 +1,7 @@
+import asyncio
+import aiohttp
+import time
+
 import pytest
 from unittest.mock import ANY
 from gundi_core.events import (
@@ -11,7 +15,10 @@ from gundi_core.events import (
     IntegrationWebhookFailed
 )
 from app import settings
-from app.services.activity_logger import publish_event, activity_logger, webhook_activity_logger, log_activity
+from app.services.activity_logger import (
+    publish_event, activity_logger, webhook_activity_logger, log_activity, close_publisher_client,
+    EventBatchPublisher, start_event_publisher, stop_event_publisher,
+)
 from app.services.errors import IntegrationAuthError
 from app.webhooks import GenericJsonPayload, GenericJsonTransformConfig
 
@@ -46,6 +53,187 @@ async def test_publish_event(
     )
 
 
+@pytest.mark.asyncio
+async def test_publish_event_reuses_pooled_publisher_client(
+        mocker, mock_pubsub_client, action_started_event, action_complete_event
+):
+    mocker.patch("app.services.activity_logger.pubsub", mock_pubsub_client)
+    await close_publisher_client()
+
+    await publish_event(event=action_started_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC)
+    await publish_event(event=action_complete_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC)
+
+    # One publisher (and session) for the process, not one per event
+    assert mock_pubsub_client.PublisherClient.call_count == 1
+    assert mock_pubsub_client.PublisherClient.return_value.publish.call_count == 2
+    await close_publisher_client()
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_coalesces_events_per_topic(mocker):
+    mock_publish_messages = mocker.patch("app.services.activity_logger.send_messages", mocker.AsyncMock())
+    publisher = EventBatchPublisher(max_batch_size=10, max_linger_seconds=60)
+    publisher.start()
+
+    publisher.enqueue("topic-a", b"event-1")
+    publisher.enqueue("topic-b", b"event-2")
+    publisher.enqueue("topic-a", b"event-3")
+    await publisher.stop(timeout=5)
+
+    # Drained on stop: one multi-message publish call per topic
+    assert mock_publish_messages.call_count == 2
+    mock_publish_messages.assert_any_call(topic_name="topic-a", payloads=[b"event-1", b"event-3"])
+    mock_publish_messages.assert_any_call(topic_name="topic-b", payloads=[b"event-2"])
+    assert publisher.stats()["events_published"] == 3
+    assert publisher.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_flushes_on_batch_size(mocker):
+    mock_publish_messages = mocker.patch("app.services.activity_logger.send_messages", mocker.AsyncMock())
+    publisher = EventBatchPublisher(max_batch_size=2, max_linger_seconds=60)
+    publisher.start()
+
+    for i in range(5):
+        publisher.enqueue("topic-a", f"event-{i}".encode())
+    await publisher.stop(timeout=5)
+
+    assert [len(c.kwargs["payloads"]) for c in mock_publish_messages.call_args_list] == [2, 2, 1]
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_flushes_after_linger_time(mocker):
+    mock_publish_messages = mocker.patch("app.services.activity_logger.send_messages", mocker.AsyncMock())
+    publisher = EventBatchPublisher(max_batch_size=100, max_linger_seconds=0.01)
+    publisher.start()
+
+    publisher.enqueue("topic-a", b"event-1")
+    await asyncio.sleep(0.1)
+
+    mock_publish_messages.assert_called_once_with(topic_name="topic-a", payloads=[b"event-1"])
+    await publisher.stop(timeout=5)
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_isnt_stalled_by_a_slow_topic(mocker):
+    slow_topic_released = asyncio.Event()
+
+    async def send_messages(topic_name, payloads):
+        if topic_name == "slow-topic":
+            await slow_topic_released.wait()
+
+    mock_send_messages = mocker.patch("app.services.activity_logger.send_messages", side_effect=send_messages)
+    publisher = EventBatchPublisher(max_batch_size=1, max_linger_seconds=60)
+    publisher.start()
+
+    publisher.enqueue("slow-topic", b"event-1")
+    publisher.enqueue("topic-a", b"event-2")
+    await asyncio.sleep(0.05)
+
+    mock_send_messages.assert_any_call(topic_name="topic-a", payloads=[b"event-2"])
+    assert publisher.stats()["events_published"] == 1
+    slow_topic_released.set()
+    await publisher.stop(timeout=5)
+    assert publisher.stats()["events_published"] == 2
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_retries_failed_batches(mocker):
+    mock_send_messages = mocker.patch(
+        "app.services.activity_logger.send_messages",
+        mocker.AsyncMock(side_effect=[aiohttp.ClientError("Unavailable"), None]),
+    )
+    publisher = EventBatchPublisher(max_batch_size=1, max_linger_seconds=60, max_attempts=1)
+    publisher.start()
+
+    publisher.enqueue("topic-a", b"event-1")
+    await asyncio.sleep(0.05)
+    await publisher.stop(timeout=5)
+
+    assert mock_send_messages.call_count == 2
+    assert publisher.stats()["events_retried"] == 1
+    assert publisher.stats()["events_published"] == 1
+    assert publisher.stats()["events_failed"] == 0
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_retries_failed_events_before_newer_ones(mocker):
+    mock_send_messages = mocker.patch(
+        "app.services.activity_logger.send_messages",
+        mocker.AsyncMock(side_effect=[aiohttp.ClientError("Unavailable"), None, None]),
+    )
+    publisher = EventBatchPublisher(max_batch_size=2, max_linger_seconds=0.05, max_attempts=1)
+    publisher.start()
+
+    publisher.enqueue("topic-a", b"started")
+    publisher.enqueue("topic-a", b"complete")
+    await asyncio.sleep(0.01)  # The first batch fails
+    publisher.enqueue("topic-a", b"started-2")
+    await asyncio.sleep(0.2)
+    await publisher.stop(timeout=5)
+
+    sent = [event for call in mock_send_messages.call_args_list[1:] for event in call.kwargs["payloads"]]
+    assert sent == [b"started", b"complete", b"started-2"]
+    assert publisher.stats()["events_published"] == 3
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_doesnt_block_the_event_loop_while_retrying(mocker):
+    mocker.patch(
+        "app.services.activity_logger.send_messages",
+        mocker.AsyncMock(side_effect=aiohttp.ClientError("Unavailable")),
+    )
+    publisher = EventBatchPublisher(max_batch_size=1, max_linger_seconds=60, max_attempts=3, max_retry_wait=0.1)
+    publisher.start()
+    ticks = []
+
+    async def tick():
+        while True:
+            ticks.append(time.monotonic())
+            await asyncio.sleep(0.01)
+
+    ticker = asyncio.create_task(tick())
+    publisher.enqueue("topic-a", b"event-1")
+    await asyncio.sleep(0.3)  # The batch is retried meanwhile
+    ticker.cancel()
+    await publisher.stop(timeout=5)
+
+    assert max(later - earlier for earlier, later in zip(ticks, ticks[1:])) < 0.08
+
+
+@pytest.mark.asyncio
+async def test_event_batch_publisher_stops_with_a_full_queue(mocker):
+    mocker.patch("app.services.activity_logger.send_messages", mocker.AsyncMock())
+    publisher = EventBatchPublisher(max_batch_size=100, max_linger_seconds=60, max_queue_size=2)
+    publisher.start()
+    publisher.enqueue("topic-a", b"event-1")
+    publisher.enqueue("topic-a", b"event-2")
+
+    await publisher.stop(timeout=5)
+
+    assert publisher.stats()["events_published"] == 2
+    assert not publisher.enqueue("topic-a", b"event-3")
+
+
+@pytest.mark.asyncio
+async def test_publish_event_is_queued_when_background_publisher_is_running(
+        mocker, action_started_event
+):
+    mocker.patch("app.services.activity_logger.settings.PUBLISH_EVENTS_IN_BACKGROUND", True)
+    mock_publish_messages = mocker.patch("app.services.activity_logger.send_messages", mocker.AsyncMock())
+    start_event_publisher()
+
+    response = await publish_event(event=action_started_event, topic_name=settings.INTEGRATION_EVENTS_TOPIC)
+
+    # The caller isn't blocked on the network
+    assert response is None
+    assert not mock_publish_messages.called
+    await stop_event_publisher()
+    mock_publish_messages.assert_called_once_with(
+        topic_name=settings.INTEGRATION_EVENTS_TOPIC, payloads=[mocker.ANY]
+    )
+
+
 @pytest.mark.asyncio
 async def test_activity_logger_decorator(
         mocker, mock_publish_event, integration_v2, pull_observations_config
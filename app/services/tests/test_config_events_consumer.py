@@ -116,3 +116,21 @@ async def test_process_event_action_config_deleted_from_pubsub(
     assert response.status_code == 200
     assert mock_config_manager.delete_action_configuration.called
 
+
+@pytest.mark.asyncio
+async def test_process_event_action_config_updated_invalidates_local_cache(
+        mocker, mock_gundi_client_v2, mock_publish_event, mock_action_handlers, mock_config_manager,
+        pubsub_message_request_headers, action_config_updated_event_as_pubsub_message
+):
+    mocker.patch("app.services.config_events_consumer.config_manager", mock_config_manager)
+
+    response = api_client.post(
+        "/config-events/",
+        headers=pubsub_message_request_headers,
+        json=action_config_updated_event_as_pubsub_message,
+    )
+
+    assert response.status_code == 200
+    # The in-memory copy is dropped before the read-modify-write
+    assert mock_config_manager.invalidate_local_cache.called
+    assert mock_config_manager.set_action_configuration.called
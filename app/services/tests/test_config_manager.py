@@ -1,5 +1,9 @@
+import asyncio
+
 import pytest
 
+from app.conftest import async_return
+
 from gundi_core.schemas.v2 import IntegrationSummary, IntegrationActionConfiguration, Integration, WebhookConfiguration
 from app.services.config_manager import IntegrationConfigurationManager
 
@@ -9,7 +13,7 @@ async def test_get_integration_from_redis(
         mocker, mock_redis_with_integration_config, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_with_integration_config)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
 
@@ -27,7 +31,7 @@ async def test_get_integration_from_gundi(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
 
@@ -43,7 +47,7 @@ async def test_get_integration_from_gundi(
 @pytest.mark.asyncio
 async def test_set_integration(mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
 
     await config_manager.set_integration(integration_v2)
@@ -60,7 +64,7 @@ async def test_get_action_configuration_from_redis(
         mocker, mock_redis_with_action_config, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_with_action_config)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
     action_v2 = integration_v2.configurations[0].action
@@ -78,7 +82,7 @@ async def test_get_action_configuration_from_gundi(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
     action_v2 = integration_v2.configurations[0].action
@@ -97,7 +101,7 @@ async def test_get_integration_details_with_empty_redis_db(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
 
@@ -108,9 +112,11 @@ async def test_get_integration_details_with_empty_redis_db(
     assert len(integration.configurations) == len(integration_v2.configurations)
     assert integration.id == integration_v2.id
     mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_with(integration_id)
+    # The reload keeps the parsed configurations in memory, so they aren't read back from redis
+    mock_redis_empty.Redis.return_value.get.assert_any_call(f"integration.{integration_id}")
     for config in integration_v2.configurations:
         action_id = config.action.value
-        mock_redis_empty.Redis.return_value.get.assert_any_call(f"integrationconfig.{integration_id}.{action_id}")
+        assert mocker.call(f"integrationconfig.{integration_id}.{action_id}") not in mock_redis_empty.Redis.return_value.get.mock_calls
 
 
 # TTL Feature Tests
@@ -120,7 +126,7 @@ async def test_get_integration_with_ttl(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
     ttl = 3600
@@ -143,7 +149,7 @@ async def test_get_action_configuration_with_ttl(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
     action_v2 = integration_v2.configurations[0].action
@@ -173,7 +179,7 @@ async def test_set_action_configuration_with_ttl(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
     action_v2 = integration_v2.configurations[0]
@@ -194,7 +200,7 @@ async def test_set_integration_with_ttl(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     ttl = 900
 
@@ -214,7 +220,7 @@ async def test_get_webhook_configuration_from_redis(
         mocker, mock_redis_with_webhook_config, mock_gundi_client_v2_class, integration_v2_with_webhook,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_with_webhook_config)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2_with_webhook.id)
 
@@ -233,7 +239,7 @@ async def test_get_webhook_configuration_from_gundi(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2_with_webhook,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     # Override the get_integration_details method to return webhook integration
     mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(return_value=integration_v2_with_webhook)
     
@@ -255,7 +261,7 @@ async def test_get_webhook_configuration_with_ttl(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2_with_webhook,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     # Override the get_integration_details method to return webhook integration
     mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(return_value=integration_v2_with_webhook)
     
@@ -280,7 +286,7 @@ async def test_get_integration_details_with_webhook_configuration(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2_with_webhook,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     # Override the get_integration_details method to return webhook integration
     mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(return_value=integration_v2_with_webhook)
     
@@ -293,9 +299,11 @@ async def test_get_integration_details_with_webhook_configuration(
     assert isinstance(integration, Integration)
     assert integration.webhook_configuration is not None
     assert isinstance(integration.webhook_configuration, WebhookConfiguration)
-    # Verify webhook config was fetched
-    mock_redis_empty.Redis.return_value.get.assert_any_call(
-        f"integrationconfig.{integration_id}.webhook"
+    # Verify webhook config was saved
+    mock_redis_empty.Redis.return_value.set.assert_any_call(
+        f"integrationconfig.{integration_id}.webhook",
+        integration_v2_with_webhook.webhook_configuration.json(),
+        None
     )
 
 
@@ -304,7 +312,7 @@ async def test_get_integration_details_with_ttl(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2_with_webhook,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     # Override the get_integration_details method to return webhook integration
     mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(return_value=integration_v2_with_webhook)
     
@@ -328,7 +336,7 @@ async def test_get_webhook_configuration_caches_absence_sentinel(
         mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
 ):
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
     integration_id = str(integration_v2.id)
 
@@ -350,7 +358,7 @@ async def test_get_webhook_configuration_reads_cached_absence_sentinel(
     fut.set_result(b"null")
     mock_redis_empty.Redis.return_value.get.return_value = fut
     mocker.patch("app.services.config_manager.redis", mock_redis_empty)
-    mocker.patch("app.services.config_manager.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     config_manager = IntegrationConfigurationManager()
 
     webhook_config = await config_manager.get_webhook_configuration(str(integration_v2.id))
@@ -358,3 +366,241 @@ async def test_get_webhook_configuration_reads_cached_absence_sentinel(
     assert webhook_config is None
     # Sentinel hit — no reload from the Gundi API.
     assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
+
+
+# In-process cache tests
+
+@pytest.mark.asyncio
+async def test_get_integration_details_served_from_local_cache(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+    await config_manager.get_integration_details(integration_id)
+    mock_redis_empty.Redis.return_value.get.reset_mock()
+    mock_gundi_client_v2_class.return_value.get_integration_details.reset_mock()
+
+    integration = await config_manager.get_integration_details(integration_id)
+
+    assert integration.id == integration_v2.id
+    assert len(integration.configurations) == len(integration_v2.configurations)
+    # Hot integrations need no redis round trips and no reloads
+    assert not mock_redis_empty.Redis.return_value.get.called
+    assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
+
+
+@pytest.mark.asyncio
+async def test_local_cache_returns_copies(
+        mocker, mock_redis_with_action_config, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_with_action_config)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+    action_id = integration_v2.configurations[0].action.value
+
+    action_config = await config_manager.get_action_configuration(integration_id, action_id)
+    action_config.data.update({"lookback_days": 1})  # e.g. config overrides
+    cached_config = await config_manager.get_action_configuration(integration_id, action_id)
+
+    assert "lookback_days" not in cached_config.data
+    mock_redis_with_action_config.Redis.return_value.get.assert_called_once()
+
+
+@pytest.mark.asyncio
+async def test_set_action_configuration_invalidates_local_cache(
+        mocker, mock_redis_with_action_config, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_with_action_config)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+    action_config = integration_v2.configurations[0]
+    action_id = action_config.action.value
+    await config_manager.get_action_configuration(integration_id, action_id)
+
+    await config_manager.set_action_configuration(integration_id, action_id, action_config)
+    await config_manager.get_action_configuration(integration_id, action_id)
+
+    assert mock_redis_with_action_config.Redis.return_value.get.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_read_during_set_action_configuration_doesnt_keep_the_old_value(
+        mocker, mock_redis_with_action_config, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_with_action_config)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+    action_config = integration_v2.configurations[0]
+    action_id = action_config.action.value
+
+    async def set_racing_with_a_read(*args, **kwargs):
+        # Another request reads the old value from redis while the new one is being written
+        await config_manager.get_action_configuration(integration_id, action_id)
+
+    mock_redis_with_action_config.Redis.return_value.set.side_effect = set_racing_with_a_read
+    await config_manager.set_action_configuration(integration_id, action_id, action_config)
+    await config_manager.get_action_configuration(integration_id, action_id)
+
+    assert mock_redis_with_action_config.Redis.return_value.get.call_count == 2  # Not served the old value from memory
+
+
+@pytest.mark.asyncio
+async def test_invalidate_local_cache(
+        mocker, mock_redis_with_integration_config, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_with_integration_config)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+    await config_manager.get_integration(integration_id)
+
+    config_manager.invalidate_local_cache(integration_id)
+    await config_manager.get_integration(integration_id)
+
+    assert mock_redis_with_integration_config.Redis.return_value.get.call_count == 2
+
+
+# Bulk read tests
+
+@pytest.mark.asyncio
+async def test_get_integration_details_reads_configurations_with_one_mget(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    integration_id = str(integration_v2.id)
+    stored_configs = {
+        f"integrationconfig.{integration_id}.{config.action.value}": config.json()
+        for config in integration_v2.configurations
+    }
+    redis_client = mock_redis_empty.Redis.return_value
+    redis_client.get.return_value = async_return(IntegrationSummary.from_integration(integration_v2).json())
+    redis_client.mget.side_effect = lambda keys: async_return([stored_configs.get(k, "null") for k in keys])
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+
+    integration = await config_manager.get_integration_details(integration_id)
+
+    assert len(integration.configurations) == len(integration_v2.configurations)
+    assert integration.webhook_configuration is None
+    redis_client.get.assert_called_once_with(f"integration.{integration_id}")
+    redis_client.mget.assert_called_once()
+    requested_keys = redis_client.mget.call_args.args[0]
+    assert len(requested_keys) == len(integration_v2.type.actions) + 1
+    assert f"integrationconfig.{integration_id}.webhook" in requested_keys
+    assert not mock_gundi_client_v2_class.return_value.get_integration_details.called
+
+
+@pytest.mark.asyncio
+async def test_get_integration_details_reloads_once_when_keys_are_missing(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    integration_id = str(integration_v2.id)
+    redis_client = mock_redis_empty.Redis.return_value
+    redis_client.get.return_value = async_return(IntegrationSummary.from_integration(integration_v2).json())
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+
+    integration = await config_manager.get_integration_details(integration_id)
+
+    assert len(integration.configurations) == len(integration_v2.configurations)
+    redis_client.mget.assert_called_once()
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+
+
+@pytest.mark.asyncio
+async def test_reload_caches_absence_of_unconfigured_actions(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+
+    action_config = await config_manager.get_action_configuration(integration_id, "push_events")
+
+    assert action_config is None
+    mock_redis_empty.Redis.return_value.set.assert_any_call(
+        f"integrationconfig.{integration_id}.push_events", "null", None
+    )
+
+
+@pytest.mark.asyncio
+async def test_concurrent_cache_misses_share_one_reload(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+    action_id = integration_v2.configurations[0].action.value
+
+    results = await asyncio.gather(
+        config_manager.get_integration(integration_id),
+        config_manager.get_action_configuration(integration_id, action_id),
+        config_manager.get_webhook_configuration(integration_id),
+        IntegrationConfigurationManager().get_integration(integration_id),
+    )
+
+    assert results[0].id == integration_v2.id
+    assert results[1].action.value == action_id
+    mock_gundi_client_v2_class.return_value.get_integration_details.assert_called_once_with(integration_id)
+
+
+@pytest.mark.asyncio
+async def test_failed_reload_is_not_shared_with_later_calls(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    mock_gundi_client_v2_class.return_value.get_integration_details = mocker.AsyncMock(
+        side_effect=[ValueError("Not found"), integration_v2]
+    )
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+
+    with pytest.raises(ValueError):
+        await config_manager.get_integration(integration_id)
+    integration = await config_manager.get_integration(integration_id)
+
+    assert integration.id == integration_v2.id
+    assert mock_gundi_client_v2_class.return_value.get_integration_details.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_reload_writes_integration_in_one_transaction(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    config_manager = IntegrationConfigurationManager()
+    integration_id = str(integration_v2.id)
+
+    await config_manager.get_integration(integration_id)
+
+    redis_client = mock_redis_empty.Redis.return_value
+    redis_client.pipeline.assert_called_once_with(transaction=True)
+    redis_client.execute.assert_called_once()
+    # The summary, every action of the type and the webhook key, in the same transaction
+    assert redis_client.set.call_count == 2 + len(integration_v2.type.actions)
+
+
+@pytest.mark.asyncio
+async def test_reloads_reuse_shared_gundi_client(
+        mocker, mock_redis_empty, mock_gundi_client_v2_class, integration_v2,
+):
+    mocker.patch("app.services.config_manager.redis", mock_redis_empty)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    integration_id = str(integration_v2.id)
+
+    await IntegrationConfigurationManager().get_integration(integration_id)
+    IntegrationConfigurationManager().invalidate_local_cache(integration_id)
+    await IntegrationConfigurationManager().get_webhook_configuration(integration_id)
+
+    assert mock_gundi_client_v2_class.return_value.get_integration_details.call_count == 2
+    mock_gundi_client_v2_class.assert_called_once()
@@ -171,3 +171,30 @@ def test_classify_builtin_timeout_as_connectivity():
         classified = classify_error(exc)
         assert classified is not None
         assert classified.error_type == "connectivity"
+
+
+@pytest.mark.parametrize(
+    "retry_after,expected_seconds",
+    [
+        ("30", 30.0),
+        ("Wed, 21 Oct 2015 07:28:00 GMT", 0.0),  # A date in the past means retry now
+        ("soon", None),
+        (None, None),
+    ],
+)
+def test_classify_rate_limit_reads_retry_after_header(retry_after, expected_seconds):
+    request = httpx.Request("GET", "https://api.example.com/data")
+    headers = {"Retry-After": retry_after} if retry_after else {}
+    response = httpx.Response(429, request=request, headers=headers)
+
+    classified = classify_error(httpx.HTTPStatusError("HTTP 429", request=request, response=response))
+
+    assert classified.error_type == "rate_limit"
+    assert classified.retry_after == expected_seconds
+
+
+def test_format_rate_limit_error_with_retry_after():
+    exc = IntegrationRateLimitError("Quota exceeded", status_code=429, retry_after=30)
+
+    assert exc.retry_after == 30
+    assert format_error_message(exc) == "Rate limited by the provider — Quota exceeded (HTTP 429, retry after 30s)"
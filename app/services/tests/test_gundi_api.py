@@ -1,5 +1,11 @@
+import asyncio
+
+import httpx
 import pytest
-from app.services.gundi import send_events_to_gundi, send_observations_to_gundi, send_event_attachments_to_gundi
+import stamina
+from app.conftest import async_return
+from app.services.gundi import send_events_to_gundi, send_observations_to_gundi, send_event_attachments_to_gundi, \
+    send_batches_to_gundi
 
 
 @pytest.mark.asyncio
@@ -7,7 +13,7 @@ async def test_send_events_to_gundi(
         mocker, mock_gundi_client_v2_class, mock_gundi_sensors_client_class,
         mock_get_gundi_api_key, integration_v2
 ):
-    mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     events = [
@@ -54,7 +60,7 @@ async def test_send_event_attachments_to_gundi(
         mocker, mock_gundi_client_v2_class, mock_gundi_sensors_client_class,
         mock_get_gundi_api_key, integration_v2
 ):
-    mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     attachments = [
@@ -81,7 +87,7 @@ async def test_send_observations_to_gundi(
         mocker, mock_gundi_client_v2_class, mock_gundi_sensors_client_class,
         mock_get_gundi_api_key, integration_v2
 ):
-    mocker.patch("app.services.gundi.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
     mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
     mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
     observations = [
@@ -121,3 +127,102 @@ async def test_send_observations_to_gundi(
     assert len(response) == 2
     assert mock_gundi_sensors_client_class.called
     mock_gundi_sensors_client_class.return_value.post_observations.assert_called_once_with(data=observations)
+
+
+@pytest.mark.asyncio
+async def test_send_observations_to_gundi_reuses_api_key(
+        mocker, mock_gundi_client_v2_class, mock_gundi_sensors_client_class,
+        mock_get_gundi_api_key, integration_v2
+):
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
+    observations = [{"source": "device-xy123", "recorded_at": "2024-01-24 09:03:00-0300"}]
+
+    for _ in range(3):
+        await send_observations_to_gundi(observations=observations, integration_id=str(integration_v2.id))
+
+    mock_get_gundi_api_key.assert_called_once()
+    assert mock_gundi_sensors_client_class.return_value.post_observations.call_count == 3
+
+
+@pytest.mark.asyncio
+async def test_send_observations_to_gundi_refreshes_api_key_on_unauthorized(
+        mocker, mock_gundi_client_v2_class, mock_gundi_sensors_client_class,
+        mock_get_gundi_api_key, observations_created_response, integration_v2
+):
+    mocker.patch("app.services.clients.GundiClient", mock_gundi_client_v2_class)
+    mocker.patch("app.services.gundi.GundiDataSenderClient", mock_gundi_sensors_client_class)
+    mocker.patch("app.services.gundi._get_gundi_api_key", mock_get_gundi_api_key)
+    request = httpx.Request("POST", "https://sensors.api.test/v2/observations/")
+    unauthorized = httpx.HTTPStatusError(
+        "Unauthorized", request=request, response=httpx.Response(401, request=request)
+    )
+    mock_get_gundi_api_key.side_effect = lambda **kwargs: async_return("MockAP1K3y")
+    mock_gundi_sensors_client_class.return_value.post_observations.side_effect = [
+        unauthorized, async_return(observations_created_response)
+    ]
+    observations = [{"source": "device-xy123", "recorded_at": "2024-01-24 09:03:00-0300"}]
+
+    stamina.set_active(False)  # A single attempt per call, no backoff waits
+    try:
+        with pytest.raises(httpx.HTTPStatusError):
+            await send_observations_to_gundi(observations=observations, integration_id=str(integration_v2.id))
+        response = await send_observations_to_gundi(observations=observations, integration_id=str(integration_v2.id))
+    finally:
+        stamina.set_active(True)
+
+    assert response == observations_created_response
+    # The cached key is dropped on the 401 and fetched again for the next request
+    assert mock_get_gundi_api_key.call_count == 2
+    assert mock_gundi_sensors_client_class.call_count == 2
+
+
+@pytest.mark.asyncio
+async def test_send_batches_to_gundi_with_bounded_concurrency(integration_v2):
+    in_flight = 0
+    max_in_flight = 0
+    sent_batches = []
+
+    async def send(observations, **kwargs):
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+        sent_batches.append(observations)
+        return {"created": len(observations)}
+
+    observations = [{"source": f"device-{i}"} for i in range(25)]
+    results = await send_batches_to_gundi(
+        observations, send=send, batch_size=3, max_concurrency=4, integration_id=str(integration_v2.id)
+    )
+
+    assert max_in_flight == 4
+    assert len(results) == len(sent_batches) == 9
+    assert [result.index for result in results] == list(range(9))
+    assert sum(result.size for result in results) == 25
+    assert all(result.error is None for result in results)
+    assert results[-1].response == {"created": 1}
+
+
+@pytest.mark.asyncio
+async def test_send_batches_to_gundi_from_async_iterator_reports_partial_failures(integration_v2):
+    async def read_observations():
+        for i in range(10):
+            yield {"source": f"device-{i}"}
+
+    async def send(observations, **kwargs):
+        if observations[0]["source"] == "device-4":
+            raise httpx.ConnectError("Connection refused")
+        return {"created": len(observations)}
+
+    results = await send_batches_to_gundi(
+        read_observations(), send=send, batch_size=4, max_concurrency=2, integration_id=str(integration_v2.id)
+    )
+
+    assert [result.size for result in results] == [4, 4, 2]
+    assert results[0].response == {"created": 4}
+    assert results[1].response is None
+    assert isinstance(results[1].error, httpx.ConnectError)
+    assert results[2].response == {"created": 2}
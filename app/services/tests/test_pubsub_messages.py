@@ -0,0 +1,187 @@
+import base64
+import json
+
+import pytest
+from fastapi import status
+from fastapi.responses import JSONResponse
+from fastapi.testclient import TestClient
+
+from app import settings
+from app.conftest import async_return
+from app.main import app
+from app.services.pubsub_messages import process_messages_batch, run_action_message, run_push_data_message, ACK, NACK
+from app.services.task_executor import BoundedTaskExecutor
+
+api_client = TestClient(app)
+
+
+def _action_message(message_id, integration_id, action_id="pull_observations"):
+    data = json.dumps({"integration_id": integration_id, "action_id": action_id}).encode("utf-8")
+    return {"message": {"data": base64.b64encode(data).decode("utf-8"), "messageId": message_id, "attributes": {}}}
+
+
+def test_batch_endpoint_acks_and_nacks_per_message(mocker, pubsub_message_request_headers):
+    async def execute_action(integration_id, **kwargs):
+        if integration_id == "failing-integration":
+            return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={})
+        return {"observations_extracted": 1}
+
+    mock_execute_action = mocker.patch("app.services.pubsub_messages.execute_action", side_effect=execute_action)
+    messages = [
+        _action_message("1", "integration-1"),
+        _action_message("2", "failing-integration"),
+        {"message": {"data": "not base64 json!", "messageId": "3"}},
+        _action_message("4", "integration-4"),
+    ]
+
+    response = api_client.post("/batch", headers=pubsub_message_request_headers, json={"messages": messages})
+
+    assert response.status_code == 200
+    body = response.json()
+    assert [r["message_id"] for r in body["results"]] == ["1", "2", "3", "4"]
+    assert [r["status"] for r in body["results"]] == [ACK, NACK, ACK, ACK]  # Malformed messages are acked
+    assert body["acked"] == 3
+    assert body["nacked"] == 1
+    assert mock_execute_action.await_count == 3
+
+
+@pytest.mark.asyncio
+async def test_batch_acks_actions_that_fail_with_client_errors(mocker):
+    async def execute_action(integration_id, **kwargs):
+        status_codes = {
+            "unsupported-action": status.HTTP_422_UNPROCESSABLE_ENTITY,
+            "missing-configuration": status.HTTP_404_NOT_FOUND,
+            "already-running": status.HTTP_409_CONFLICT,
+            "timed-out": status.HTTP_504_GATEWAY_TIMEOUT,
+        }
+        return JSONResponse(status_code=status_codes[integration_id], content={})
+
+    mocker.patch("app.services.pubsub_messages.execute_action", side_effect=execute_action)
+    integration_ids = ["unsupported-action", "missing-configuration", "already-running", "timed-out"]
+
+    results = await process_messages_batch(
+        items=[_action_message(str(i), integration_id) for i, integration_id in enumerate(integration_ids)],
+        run_message=run_action_message,
+        executor=BoundedTaskExecutor(name="test", max_in_flight=4, max_queue_size=4),
+    )
+
+    assert [r["status"] for r in results] == [ACK, ACK, ACK, NACK]  # Only server errors are retried
+    assert results[0]["error"] == "Action failed with status 422, not retried"
+
+
+@pytest.mark.asyncio
+async def test_push_data_batch_nacks_messages_in_progress(mocker, mock_state_manager, run_push_action_pubsub_payload):
+    mocker.patch("app.services.pubsub_messages.state_manager", mock_state_manager)
+    mock_state_manager.claim_message.side_effect = lambda *args, **kwargs: async_return("in_progress")
+    mocker.patch("app.services.pubsub_messages.execute_action", return_value={})
+
+    results = await process_messages_batch(
+        items=[run_push_action_pubsub_payload],
+        run_message=run_push_data_message,
+        executor=BoundedTaskExecutor(name="test", max_in_flight=1, max_queue_size=1),
+    )
+
+    assert [r["status"] for r in results] == [NACK]  # Redelivered after the first run ends, in case it fails
+
+
+def test_push_data_batch_acks_messages_without_destination_id(
+        mocker, mock_state_manager, pubsub_message_request_headers, run_push_action_pubsub_payload
+):
+    mocker.patch("app.services.pubsub_messages.state_manager", mock_state_manager)
+    mock_execute_action = mocker.patch("app.services.pubsub_messages.execute_action", return_value={})
+    malformed = json.loads(json.dumps(run_push_action_pubsub_payload))
+    malformed["message"]["attributes"].pop("destination_id", None)
+
+    response = api_client.post(
+        "/push-data/batch",
+        headers=pubsub_message_request_headers,
+        json=[run_push_action_pubsub_payload, malformed],
+    )
+
+    assert response.status_code == 200
+    assert [r["status"] for r in response.json()["results"]] == [ACK, ACK]
+    mock_execute_action.assert_awaited_once()
+    assert mock_execute_action.call_args.kwargs["integration_id"] == \
+           run_push_action_pubsub_payload["message"]["attributes"]["destination_id"]
+
+
+def test_batch_endpoint_rejects_too_many_messages(mocker, pubsub_message_request_headers):
+    mocker.patch("app.settings.PUBSUB_BATCH_MAX_MESSAGES", 1)
+    messages = [_action_message("1", "integration-1"), _action_message("2", "integration-2")]
+
+    response = api_client.post("/batch", headers=pubsub_message_request_headers, json={"messages": messages})
+
+    assert response.status_code == status.HTTP_413_REQUEST_ENTITY_TOO_LARGE
+
+
+@pytest.mark.asyncio
+async def test_batch_nacks_messages_over_executor_capacity(mocker):
+    mocker.patch("app.services.pubsub_messages.execute_action", return_value={})
+    executor = BoundedTaskExecutor(name="test", max_in_flight=1, max_queue_size=1)
+
+    results = await process_messages_batch(
+        items=[_action_message(str(i), f"integration-{i}") for i in range(3)],
+        run_message=run_action_message,
+        executor=executor,
+        max_concurrency=2,
+    )
+
+    assert [r["status"] for r in results] == [ACK, ACK, NACK]
+    assert executor.stats()["rejected"] == 1
+    assert executor.pending == 0
+
+
+def test_push_data_redelivery_is_acked_without_running_the_action(
+        mocker, mock_state_manager, pubsub_message_request_headers, run_push_action_pubsub_payload
+):
+    mocker.patch("app.services.pubsub_messages.state_manager", mock_state_manager)
+    mock_execute_action = mocker.patch("app.services.pubsub_messages.execute_action", return_value={})
+    destination_id = run_push_action_pubsub_payload["message"]["attributes"]["destination_id"]
+    message_id = run_push_action_pubsub_payload["message"]["messageId"]
+
+    response = api_client.post("/push-data", headers=pubsub_message_request_headers, json=run_push_action_pubsub_payload)
+
+    assert response.status_code == 200
+    mock_execute_action.assert_awaited_once()
+    mock_state_manager.set_message_processed.assert_called_once_with(
+        destination_id, message_id, ttl_seconds=settings.PUSH_DATA_IDEMPOTENCY_TTL
+    )
+
+    # PubSub redelivers the message, e.g. because the ack was lost
+    mock_state_manager.claim_message.side_effect = lambda *args, **kwargs: async_return("done")
+    response = api_client.post("/push-data", headers=pubsub_message_request_headers, json=run_push_action_pubsub_payload)
+
+    assert response.status_code == 200
+    assert response.json() == {"skipped": True, "reason": "already_processed"}
+    mock_execute_action.assert_awaited_once()
+
+
+def test_failed_push_data_message_is_not_remembered(
+        mocker, mock_state_manager, pubsub_message_request_headers, run_push_action_pubsub_payload
+):
+    mocker.patch("app.services.pubsub_messages.state_manager", mock_state_manager)
+    mocker.patch(
+        "app.services.pubsub_messages.execute_action",
+        return_value=JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={}),
+    )
+
+    response = api_client.post("/push-data", headers=pubsub_message_request_headers, json=run_push_action_pubsub_payload)
+
+    assert response.status_code == status.HTTP_500_INTERNAL_SERVER_ERROR  # So PubSub redelivers it
+    assert not mock_state_manager.set_message_processed.called
+    # The claim is released, so the redelivery runs the action again
+    mock_state_manager.release_message.assert_called_once()
+
+
+def test_push_data_redelivery_while_in_progress_is_retried_later(
+        mocker, mock_state_manager, pubsub_message_request_headers, run_push_action_pubsub_payload
+):
+    mocker.patch("app.services.pubsub_messages.state_manager", mock_state_manager)
+    mock_state_manager.claim_message.side_effect = lambda *args, **kwargs: async_return("in_progress")
+    mock_execute_action = mocker.patch("app.services.pubsub_messages.execute_action", return_value={})
+
+    response = api_client.post("/push-data", headers=pubsub_message_request_headers, json=run_push_action_pubsub_payload)
+
+    assert response.status_code == status.HTTP_409_CONFLICT  # Nacked, PubSub retries it after the first run ends
+    assert response.json() == {"skipped": True, "reason": "in_progress"}
+    assert not mock_execute_action.called
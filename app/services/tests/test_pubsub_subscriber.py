@@ -0,0 +1,130 @@
+import asyncio
+import datetime
+import json
+
+import pytest
+from fastapi import status
+from fastapi.responses import JSONResponse
+from gcloud.aio.pubsub import SubscriberMessage
+
+from app.services.pubsub_messages import run_action_message
+from app.services.pubsub_subscriber import StreamingPullSubscriber
+
+
+class FakeSubscriberClient:
+    """In-memory stand-in for gcloud-aio's SubscriberClient"""
+
+    def __init__(self, messages):
+        self.messages = list(messages)
+        self.acked = []
+        self.nacked = []
+        self.nack_deadlines = {}
+        self.lease_extensions = []
+        self.max_messages_requested = []
+
+    async def pull(self, subscription, max_messages, **kwargs):
+        self.max_messages_requested.append(max_messages)
+        batch, self.messages = self.messages[:max_messages], self.messages[max_messages:]
+        if not batch:
+            await asyncio.sleep(0.01)
+        return batch
+
+    async def acknowledge(self, subscription, ack_ids, **kwargs):
+        self.acked.extend(ack_ids)
+
+    async def modify_ack_deadline(self, subscription, ack_ids, ack_deadline_seconds, **kwargs):
+        if ack_deadline_seconds < 10:  # Leases are extended by 10 seconds or more, the tests nack with less
+            self.nacked.extend(ack_ids)
+            self.nack_deadlines.update((ack_id, ack_deadline_seconds) for ack_id in ack_ids)
+        else:
+            self.lease_extensions.extend(ack_ids)
+
+
+def _subscriber_message(n, integration_id):
+    data = json.dumps({"integration_id": integration_id, "action_id": "pull_observations"}).encode("utf-8")
+    return SubscriberMessage(
+        ack_id=f"ack-{n}", message_id=str(n), publish_time=datetime.datetime.now(), data=data, attributes={}
+    )
+
+
+async def _wait_for(condition, timeout=2.0):
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not condition() and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_subscriber_acks_succeeded_and_nacks_failed_messages(mocker):
+    async def execute_action(integration_id, **kwargs):
+        if integration_id == "failing-integration":
+            return JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={})
+        return {}
+
+    mock_execute_action = mocker.patch("app.services.pubsub_messages.execute_action", side_effect=execute_action)
+    messages = [_subscriber_message(n, "failing-integration" if n == 2 else f"integration-{n}") for n in range(5)]
+    client = FakeSubscriberClient(messages)
+    subscriber = StreamingPullSubscriber(
+        "actions-sub", run_action_message, client, ack_batch_size=10, ack_window=0.05, nack_delay=5
+    )
+
+    subscriber.start()
+    await _wait_for(lambda: len(client.acked) + len(client.nacked) == 5)
+    await subscriber.stop(timeout=1)
+
+    assert sorted(client.acked) == ["ack-0", "ack-1", "ack-3", "ack-4"]
+    assert client.nacked == ["ack-2"]
+    assert mock_execute_action.await_count == 5
+    assert mock_execute_action.call_args_list[0].kwargs["integration_id"] == "integration-0"
+    assert subscriber.stats()["outstanding_messages"] == 0
+
+
+@pytest.mark.asyncio
+async def test_subscriber_flow_control_and_lease_extension(mocker):
+    release = asyncio.Event()
+    running = []
+
+    async def execute_action(integration_id, **kwargs):
+        running.append(integration_id)
+        await release.wait()
+        return {}
+
+    mocker.patch("app.services.pubsub_messages.execute_action", side_effect=execute_action)
+    client = FakeSubscriberClient([_subscriber_message(n, f"integration-{n}") for n in range(5)])
+    subscriber = StreamingPullSubscriber(
+        "projects/test/subscriptions/actions-sub", run_action_message, client,
+        max_outstanding_messages=2, ack_deadline=0.1, ack_window=0.05,
+    )
+
+    subscriber.start()
+    await _wait_for(lambda: len(client.lease_extensions) >= 2)
+    # No more than two messages are pulled while they are in progress, and their leases are extended
+    assert len(running) == 2
+    assert set(client.lease_extensions) == {"ack-0", "ack-1"}
+    release.set()
+    await _wait_for(lambda: len(client.acked) == 5)
+    await subscriber.stop(timeout=1)
+
+    assert len(running) == 5
+    assert max(client.max_messages_requested) == 2
+    assert subscriber.subscription == "projects/test/subscriptions/actions-sub"
+
+
+@pytest.mark.asyncio
+async def test_subscriber_delays_the_redelivery_of_failed_action_messages(mocker):
+    mocker.patch(
+        "app.services.pubsub_messages.execute_action",
+        return_value=JSONResponse(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, content={}),
+    )
+    client = FakeSubscriberClient([_subscriber_message(0, "failing-integration")])
+    subscriber = StreamingPullSubscriber(
+        "actions-sub", run_action_message, client, ack_window=0.05, nack_delay=5
+    )
+
+    subscriber.start()
+    await _wait_for(lambda: client.nacked)
+    await subscriber.stop(timeout=1)
+
+    # A deadline of 0 would have PubSub redeliver it right away, in a tight loop
+    assert client.nack_deadlines == {"ack-0": 5}
+    assert not client.acked
+    assert subscriber.stats()["nacked"] == 1
@@ -0,0 +1,129 @@
+import fakeredis
+import httpx
+import pytest
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from app.conftest import async_return
+from app.services.errors import IntegrationRateLimitError
+from app.services.rate_limiter import RateLimiter, InMemoryRateLimitBackend, RedisRateLimitBackend
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_allows_bursts_and_then_spaces_requests():
+    limiter = RateLimiter(name="provider", rate=10, period=1, burst=3, backend=InMemoryRateLimitBackend())
+
+    waits = [await limiter.try_acquire("integration-1") for _ in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert 0 < waits[3] <= 0.1
+    # Limits are kept per key
+    assert await limiter.try_acquire("integration-2") == 0
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_raises_when_the_wait_is_too_long():
+    limiter = RateLimiter(name="provider", rate=1, period=60, backend=InMemoryRateLimitBackend(), max_wait=0.1)
+
+    await limiter.acquire()
+    with pytest.raises(IntegrationRateLimitError) as exc_info:
+        await limiter.acquire()
+
+    assert 59 < exc_info.value.retry_after <= 60
+
+
+@pytest.mark.asyncio
+async def test_rate_limiter_honors_retry_after_of_rate_limit_errors():
+    limiter = RateLimiter(name="provider", rate=100, period=1, backend=InMemoryRateLimitBackend(), max_wait=0)
+    request = httpx.Request("GET", "https://provider.example.com/api")
+    response = httpx.Response(429, request=request, headers={"Retry-After": "30"})
+
+    with pytest.raises(httpx.HTTPStatusError):
+        async with limiter.limit("integration-1"):
+            response.raise_for_status()
+
+    # The following requests are held until the provider allows them again
+    assert 29 < await limiter.try_acquire("integration-1") <= 30
+    with pytest.raises(IntegrationRateLimitError):
+        async with limiter.limit("integration-1"):
+            pass
+    # Explicit errors with a retry time are honored too
+    with pytest.raises(IntegrationRateLimitError):
+        async with limiter.limit("integration-2"):
+            raise IntegrationRateLimitError("Quota exceeded", status_code=429, retry_after=5)
+    assert 4 < await limiter.try_acquire("integration-2") <= 5
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_shares_limits_and_falls_back_to_memory(mocker, mock_redis):
+    mocker.patch("app.services.rate_limiter.redis.Redis", mock_redis.Redis)
+    redis_client = mock_redis.Redis.return_value
+    redis_client.eval.side_effect = [async_return("0"), async_return("0.25")]
+    limiter = RateLimiter(name="provider", rate=4, period=1, backend=RedisRateLimitBackend())
+
+    assert await limiter.try_acquire("integration-1") == 0
+    assert await limiter.try_acquire("integration-1") == 0.25
+    _, _, key, emission_interval, burst_offset = redis_client.eval.call_args.args
+    assert key == "rate_limit.provider.integration-1"
+    assert float(emission_interval) == 0.25
+    assert float(burst_offset) == 0.25
+
+    redis_client.eval.side_effect = RedisConnectionError("redis unavailable")
+    assert await limiter.try_acquire("integration-1") == 0  # Limited in memory meanwhile
+    assert await limiter.try_acquire("integration-1") > 0
+
+
+@pytest.fixture
+def fake_redis_backend():
+    # Runs the GCRA scripts for real, in an in-process redis with Lua support
+    backend = RedisRateLimitBackend()
+    backend.db_client = fakeredis.FakeAsyncRedis()
+    return backend
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_scripts_allow_bursts_then_deny_with_the_wait(fake_redis_backend):
+    limiter = RateLimiter(name="provider", rate=10, period=1, burst=3, backend=fake_redis_backend)
+
+    waits = [await limiter.try_acquire("integration-1") for _ in range(4)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert 0 < waits[3] <= 0.1
+    # Limits are kept per key
+    assert await limiter.try_acquire("integration-2") == 0
+    # Keys expire once their turns are back
+    ttl_ms = await fake_redis_backend.db_client.pttl("rate_limit.provider.integration-1")
+    assert 0 < ttl_ms <= 401
+
+
+@pytest.mark.asyncio
+async def test_redis_rate_limiter_scripts_block_for_the_retry_after(fake_redis_backend):
+    limiter = RateLimiter(name="provider", rate=100, period=1, burst=5, backend=fake_redis_backend)
+
+    await limiter.block(30, key="integration-1")
+    wait = await limiter.try_acquire("integration-1")
+
+    assert 29.9 < wait <= 30
+    # A shorter block doesn't shorten the current one
+    await limiter.block(5, key="integration-1")
+    assert 29.9 < await limiter.try_acquire("integration-1") <= 30
+
+
+@pytest.mark.asyncio
+async def test_nested_limiters_dont_hold_the_account_when_an_integration_runs_out_of_turns():
+    account_limiter = RateLimiter(name="acct", rate=100, period=1, burst=10, backend=InMemoryRateLimitBackend())
+    integration_limiter = RateLimiter(
+        name="integration", rate=1, period=30, backend=InMemoryRateLimitBackend(), max_wait=0
+    )
+
+    async with account_limiter.limit(), integration_limiter.limit("a"):
+        pass
+    with pytest.raises(IntegrationRateLimitError) as exc_info:
+        async with account_limiter.limit(), integration_limiter.limit("a"):
+            pass
+
+    assert 29 < exc_info.value.retry_after <= 30
+    # Other integrations of the account aren't held
+    assert await account_limiter.try_acquire() == 0
+    async with account_limiter.limit(), integration_limiter.limit("b"):
+        pass
@@ -1,6 +1,7 @@
 import datetime
 import json
 
+import fakeredis
 import pytest
 from app.conftest import async_return
 from app.services.state import IntegrationStateManager
@@ -185,3 +186,47 @@ async def test_delete_state_source_state(mocker, mock_redis, integration_v2, moc
     mock_redis.Redis.return_value.delete.assert_called_once_with(
         f"integration_state.{integration_id}.pull_observations.{source_id}"
     )
+
+
+@pytest.mark.asyncio
+async def test_action_lease_is_exclusive_and_released_with_its_token(mocker, mock_redis, integration_v2):
+    mocker.patch("app.services.state.redis", mock_redis)
+    redis_client = mock_redis.Redis.return_value
+    redis_client.set.side_effect = [async_return(True), async_return(None)]  # The second run finds the lease taken
+    redis_client.eval.return_value = async_return(1)
+    state_manager = IntegrationStateManager()
+    integration_id = str(integration_v2.id)
+
+    token = await state_manager.acquire_lease(integration_id, "pull_observations", ttl_seconds=600)
+    duplicate_token = await state_manager.acquire_lease(integration_id, "pull_observations", ttl_seconds=600)
+    released = await state_manager.release_lease(integration_id, "pull_observations", token)
+
+    assert token
+    assert duplicate_token is None
+    assert released
+    redis_client.set.assert_any_call(
+        f"integration_lease.{integration_id}.pull_observations", token, ex=600, nx=True
+    )
+    _, _, key, released_token = redis_client.eval.call_args.args
+    assert key == f"integration_lease.{integration_id}.pull_observations"
+    assert released_token == token
+
+
+@pytest.mark.asyncio
+async def test_message_is_claimed_once(integration_v2):
+    state_manager = IntegrationStateManager()
+    state_manager.db_client = fakeredis.FakeAsyncRedis()  # Runs the claim script for real
+    integration_id = str(integration_v2.id)
+
+    first_mark = await state_manager.claim_message(integration_id, "message-1", ttl_seconds=600)
+    second_mark = await state_manager.claim_message(integration_id, "message-1", ttl_seconds=600)
+    await state_manager.set_message_processed(integration_id, "message-1", ttl_seconds=600)
+    done_mark = await state_manager.claim_message(integration_id, "message-1", ttl_seconds=600)
+    await state_manager.release_message(integration_id, "message-1")
+    released_mark = await state_manager.claim_message(integration_id, "message-1", ttl_seconds=600)
+
+    assert first_mark is None
+    assert second_mark == "in_progress"
+    assert done_mark == "done"
+    assert released_mark is None  # Claimed again
+    assert 0 < await state_manager.db_client.ttl(f"processed_message.{integration_id}.message-1") <= 600
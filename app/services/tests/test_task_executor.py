@@ -0,0 +1,102 @@
+import asyncio
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.main import app
+from app.services.task_executor import BoundedTaskExecutor, ExecutorSaturatedError, ExecutorUnavailableError
+
+
+api_client = TestClient(app)
+
+
+@pytest.mark.asyncio
+async def test_executor_bounds_tasks_in_flight():
+    executor = BoundedTaskExecutor(name="test", max_in_flight=2, max_queue_size=3)
+    in_flight = 0
+    max_in_flight = 0
+
+    async def task():
+        nonlocal in_flight, max_in_flight
+        in_flight += 1
+        max_in_flight = max(max_in_flight, in_flight)
+        await asyncio.sleep(0.01)
+        in_flight -= 1
+
+    tasks = [executor.submit(task) for _ in range(5)]
+    with pytest.raises(ExecutorSaturatedError):
+        executor.submit(task)
+    await asyncio.gather(*tasks)
+
+    assert max_in_flight == 2
+    assert executor.stats() == {
+        "pending": 0, "running": 0, "completed": 5, "failed": 0, "rejected": 1, "max_in_flight": 2, "max_queue_size": 3
+    }
+
+
+@pytest.mark.asyncio
+async def test_executor_drains_tasks_on_shutdown():
+    executor = BoundedTaskExecutor(name="test", max_in_flight=2, max_queue_size=3)
+    finished = []
+
+    async def task():
+        await asyncio.sleep(0.2)
+        finished.append(True)
+
+    running_task = executor.submit(task)
+    await executor.drain(timeout=5)
+
+    assert finished == [True]
+    assert running_task.done()
+    with pytest.raises(ExecutorUnavailableError):
+        executor.submit(task)
+
+
+@pytest.mark.asyncio
+async def test_executor_releases_places_of_tasks_nobody_awaits():
+    # e.g. a response background task that never runs because an earlier one failed
+    executor = BoundedTaskExecutor(name="test", max_in_flight=1, max_queue_size=0)
+
+    async def failing_task():
+        raise ValueError("boom")
+
+    async def task():
+        return "done"
+
+    executor.submit(failing_task)
+    await asyncio.sleep(0.01)
+
+    assert executor.pending == 0
+    assert await executor.submit(task) == "done"
+    assert executor.stats()["failed"] == 1
+
+
+def test_pubsub_action_is_rejected_when_executor_is_saturated(
+        mocker, pubsub_message_request_headers, run_pull_action_pubsub_payload
+):
+    executor = BoundedTaskExecutor(name="pull", max_in_flight=0, max_queue_size=0)  # No room for tasks
+    mocker.patch("app.main.pull_action_executor", executor)
+    mock_execute_action = mocker.patch("app.main.execute_action")
+
+    response = api_client.post(
+        "/",
+        headers=pubsub_message_request_headers,
+        json=run_pull_action_pubsub_payload,
+    )
+
+    assert response.status_code == 429
+    assert not mock_execute_action.called
+
+
+def test_inline_api_action_runs_through_executor(mocker, integration_v2):
+    executor = BoundedTaskExecutor(name="pull", max_in_flight=0, max_queue_size=0)  # No room for tasks
+    mocker.patch("app.routers.actions.pull_action_executor", executor)
+    mock_execute_action = mocker.patch("app.routers.actions.execute_action")
+
+    response = api_client.post(
+        "/v1/actions/execute",
+        json={"integration_id": str(integration_v2.id), "action_id": "pull_observations", "run_in_background": False},
+    )
+
+    assert response.status_code == 429
+    assert not mock_execute_action.called
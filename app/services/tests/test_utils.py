@@ -0,0 +1,142 @@
+import json
+
+import pytest
+
+from app.services.utils import generate_batches, generate_batches_async, StructHexString, decode_hex_strings, \
+    get_struct_hex_decoder
+
+
+def test_generate_batches_from_list():
+    records = list(range(7))
+
+    batches = list(generate_batches(records, 3))
+
+    assert batches == [[0, 1, 2], [3, 4, 5], [6]]
+
+
+def test_generate_batches_from_generator_is_lazy():
+    consumed = []
+
+    def read_records():
+        for i in range(7):
+            consumed.append(i)
+            yield i
+
+    batches = generate_batches(read_records(), 3)
+
+    assert next(batches) == [0, 1, 2]
+    assert consumed == [0, 1, 2]  # Only what's needed to complete the first batch
+    assert list(batches) == [[3, 4, 5], [6]]
+
+
+def test_generate_batches_with_max_batch_bytes():
+    records = [{"source": f"device-{i}", "data": "x" * 50} for i in range(6)]
+    record_bytes = len(json.dumps(records[0]).encode())
+
+    batches = list(generate_batches(records, 10, max_batch_bytes=record_bytes * 2 + 1))
+
+    assert [len(batch) for batch in batches] == [2, 2, 2]
+    assert [record for batch in batches for record in batch] == records
+
+
+def test_generate_batches_sends_oversized_records_alone():
+    records = [{"data": "x"}, {"data": "x" * 100}, {"data": "x"}]
+
+    batches = list(generate_batches(records, 10, max_batch_bytes=50))
+
+    assert batches == [[records[0]], [records[1]], [records[2]]]
+
+
+@pytest.mark.asyncio
+async def test_generate_batches_async_yields_full_batches_right_away():
+    consumed = []
+
+    async def read_records():
+        for i in range(7):
+            consumed.append(i)
+            yield i
+
+    batches = generate_batches_async(read_records(), 3)
+
+    assert await batches.__anext__() == [0, 1, 2]
+    assert consumed == [0, 1, 2]
+    assert [batch async for batch in batches] == [[3, 4, 5], [6]]
+
+
+@pytest.mark.asyncio
+async def test_generate_batches_async_from_async_generator():
+    async def read_pages():
+        for page in range(3):
+            for i in range(4):
+                yield {"page": page, "index": i}
+
+    batches = [batch async for batch in generate_batches_async(read_pages(), 5)]
+
+    assert [len(batch) for batch in batches] == [5, 5, 2]
+
+
+@pytest.mark.asyncio
+async def test_generate_batches_async_from_list():
+    batches = [batch async for batch in generate_batches_async(list(range(5)), 2)]
+
+    assert batches == [[0, 1], [2, 3], [4]]
+
+
+@pytest.fixture
+def meter_hex_format():
+    return {
+        "byte_order": ">",
+        "fields": [
+            {"name": "start_bit", "format": "B", "output_type": "int"},
+            {"name": "v", "format": "I"},
+            {"name": "interval", "format": "H", "output_type": "int"},
+            {"name": "meter_state_1", "format": "B"},
+            {
+                "name": "meter_state_2",
+                "format": "B",
+                "bit_fields": [
+                    {"name": "meter_batter_alarm", "end_bit": 0, "start_bit": 0, "output_type": "bool"},
+                    {"name": "empty_pipe_alarm", "end_bit": 1, "start_bit": 1, "output_type": "bool"},
+                    {"name": "temp_alarm", "end_bit": 7, "start_bit": 4, "output_type": "int"},
+                ]
+            },
+            {"name": "crc", "format": "B", "output_type": "hex"},
+        ]
+    }
+
+
+@pytest.fixture
+def meter_data():
+    return {
+        "start_bit": 104, "v": 2170755328, "interval": 60, "meter_state_1": 32, "meter_state_2": 2, "crc": "0xc3",
+        "meter_batter_alarm": False, "empty_pipe_alarm": True, "temp_alarm": 0
+    }
+
+
+def test_struct_hex_string_unpacks_fields_and_bit_fields(meter_hex_format, meter_data):
+    hex_string = StructHexString("6881631900003c2002c3", meter_hex_format)
+
+    assert hex_string.format_spec == ">BIHBBB"
+    assert hex_string.unpacked_data == meter_data
+
+
+def test_struct_hex_string_with_invalid_length(meter_hex_format):
+    with pytest.raises(ValueError, match="expected length"):
+        StructHexString.validate("6881631900003c20", {"hex_format": meter_hex_format}, None)
+
+
+def test_struct_hex_decoder_is_compiled_once_per_format(meter_hex_format):
+    decoder = get_struct_hex_decoder(meter_hex_format)
+
+    StructHexString("6881631900003c2002c3", meter_hex_format)
+
+    assert get_struct_hex_decoder(dict(reversed(list(meter_hex_format.items())))) is decoder
+
+
+def test_decode_hex_strings_in_bulk(meter_hex_format, meter_data):
+    decoded = decode_hex_strings(["6881631900003c2002c3", "6881631900003c2013c3"], meter_hex_format)
+
+    assert decoded[0] == meter_data
+    assert decoded[1] == {**meter_data, "meter_state_2": 0x13, "meter_batter_alarm": True, "temp_alarm": 1}
+    with pytest.raises(ValueError, match="index 1"):
+        decode_hex_strings(["6881631900003c2002c3", "68816319"], meter_hex_format)
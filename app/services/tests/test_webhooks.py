@@ -0,0 +1,366 @@
+import importlib
+import json
+import logging
+
+import pyjq
+import pytest
+from unittest.mock import MagicMock
+from fastapi.testclient import TestClient
+
+from gundi_core.events import IntegrationWebhookFailed
+from app.services.utils import DyntamicFactory
+from app.conftest import async_return
+from app.main import app
+from app.services.webhooks import get_dynamic_payload_model, get_list_payload_model, parse_payload_list, process_webhook, iter_json_array, \
+    process_webhook_stream, WebhookPayloadTooLarge, WebhookPayloadInvalid, log_webhook_request, start_webhook_body_logger, \
+    stop_webhook_body_logger
+from app.webhooks.core import get_webhook_handler, reload_webhook_handler, GenericJsonPayload, \
+    GenericJsonTransformConfig, jq_transform, get_jq_cache_stats
+
+
+@pytest.fixture
+def webhook_handler_module(mocker):
+    async def webhook_handler(payload: GenericJsonPayload, integration=None, webhook_config: GenericJsonTransformConfig = None):
+        pass
+
+    mocker.patch("app.webhooks.handlers.webhook_handler", webhook_handler, create=True)
+    reload_webhook_handler()
+    yield webhook_handler
+    reload_webhook_handler()
+
+
+def test_get_webhook_handler_is_resolved_once(mocker, webhook_handler_module):
+    import_module = mocker.spy(importlib, "import_module")
+
+    handler, payload_model, config_model = get_webhook_handler()
+    assert get_webhook_handler() == (handler, payload_model, config_model)
+
+    assert handler is webhook_handler_module
+    assert payload_model is GenericJsonPayload
+    assert config_model is GenericJsonTransformConfig
+    assert import_module.call_count == 1
+
+
+def test_reload_webhook_handler(mocker, webhook_handler_module):
+    get_webhook_handler()
+
+    async def webhook_handler(payload, integration=None, webhook_config=None):
+        pass
+
+    mocker.patch("app.webhooks.handlers.webhook_handler", webhook_handler)
+    reload_webhook_handler()
+
+    assert get_webhook_handler() == (webhook_handler, None, None)
+
+
+@pytest.fixture
+def device_json_schema():
+    return {
+        "type": "object",
+        "title": "DevicePayload",
+        "required": ["device_id"],
+        "properties": {
+            "device_id": {"type": "string"},
+            "lat": {"type": "number"},
+            "lon": {"type": "number"},
+        },
+    }
+
+
+def test_get_dynamic_payload_model_is_built_once_per_schema(mocker, device_json_schema):
+    make = mocker.spy(DyntamicFactory, "make")
+
+    model = get_dynamic_payload_model(json_schema=device_json_schema, base_model=GenericJsonPayload)
+    # Same schema, with keys in a different order
+    same_schema = dict(reversed(list(device_json_schema.items())))
+    assert get_dynamic_payload_model(json_schema=same_schema, base_model=GenericJsonPayload) is model
+
+    assert make.call_count == 1
+    assert issubclass(model, GenericJsonPayload)
+    payload = model.parse_obj({"device_id": "collar-1", "lat": -51.7, "lon": -72.7})
+    assert payload.device_id == "collar-1"
+
+
+def test_get_dynamic_payload_model_for_changed_schema(device_json_schema):
+    model = get_dynamic_payload_model(json_schema=device_json_schema, base_model=GenericJsonPayload)
+    device_json_schema["properties"]["speed_kmph"] = {"type": "number"}
+
+    new_model = get_dynamic_payload_model(json_schema=device_json_schema, base_model=GenericJsonPayload)
+
+    assert new_model is not model
+    assert "speed_kmph" in new_model.__fields__
+
+
+def test_jq_transform_reuses_compiled_filters(mocker):
+    jq_filter = '.[] | {"source": .device_id, "location": {"lat": .lat, "lon": .lon}}'
+    data = [{"device_id": "collar-1", "lat": -51.7, "lon": -72.7}, {"device_id": "collar-2", "lat": -51.8, "lon": -72.8}]
+    expected_data = pyjq.all(jq_filter, data)
+    compile_jq = mocker.spy(pyjq, "compile")
+
+    for _ in range(3):
+        transformed_data = jq_transform(jq_filter, data)
+
+    assert transformed_data == expected_data
+    assert compile_jq.call_count == 1
+    assert get_jq_cache_stats() == {"size": 1, "hits": 2, "misses": 1}
+
+
+def test_parse_payload_list_collects_errors_by_index(device_json_schema):
+    model = get_dynamic_payload_model(json_schema=device_json_schema, base_model=GenericJsonPayload)
+    records = [
+        {"device_id": "collar-1", "lat": -51.7, "lon": -72.7},
+        {"lat": -51.7, "lon": -72.7},  # Missing device id
+        {"device_id": "collar-3", "lat": "north", "lon": -72.7},
+        {"device_id": "collar-4", "lat": -51.9, "lon": -72.9},
+    ]
+
+    parsed_records, errors = parse_payload_list(model, records)
+
+    assert [record.device_id for record in parsed_records] == ["collar-1", "collar-4"]
+    assert all(isinstance(record, model) for record in parsed_records)
+    assert list(errors) == [1, 2]
+    assert errors[1][0]["loc"] == ("device_id",)
+    assert errors[2][0]["loc"] == ("lat",)
+
+
+def test_parse_payload_list_validates_each_record_once(mocker, device_json_schema):
+    model = get_dynamic_payload_model(json_schema=device_json_schema, base_model=GenericJsonPayload)
+    records = [
+        {"device_id": "collar-1", "lat": -51.7, "lon": -72.7},
+        {"lat": -51.7, "lon": -72.7},  # Missing device id
+        {"device_id": "collar-3", "lat": -51.9, "lon": -72.9},
+    ]
+    parse_obj = mocker.spy(model, "parse_obj")
+
+    parsed_records, errors = parse_payload_list(model, records)
+
+    assert [record.device_id for record in parsed_records] == ["collar-1", "collar-3"]
+    assert list(errors) == [1]
+    assert parse_obj.call_count == len(records)
+    assert get_list_payload_model(model) is get_list_payload_model(model)
+
+
+@pytest.mark.asyncio
+async def test_process_webhook_forwards_valid_records_of_a_list(
+        mocker, mock_publish_event, mock_webhook_handler, mock_get_webhook_handler_for_generic_json_payload,
+        integration_v2_with_webhook_generic, mock_webhook_request_payload_for_dynamic_schema
+):
+    mocker.patch("app.services.webhooks.get_integration", return_value=integration_v2_with_webhook_generic)
+    mocker.patch("app.services.webhooks.get_webhook_handler", mock_get_webhook_handler_for_generic_json_payload)
+    mocker.patch("app.services.webhooks.publish_event", mock_publish_event)
+    mock_log_webhook_activity = mocker.patch("app.services.webhooks.log_webhook_activity")
+    invalid_record = {**mock_webhook_request_payload_for_dynamic_schema, "received_at": {"not": "a date"}}
+    request = MagicMock()
+    request.json.return_value = async_return(
+        [mock_webhook_request_payload_for_dynamic_schema, invalid_record, mock_webhook_request_payload_for_dynamic_schema]
+    )
+
+    await process_webhook(request=request)
+
+    assert mock_webhook_handler.call_count == 1
+    payload = mock_webhook_handler.call_args.kwargs["payload"]
+    assert len(payload) == 2
+    assert mock_log_webhook_activity.call_count == 1
+    log_data = mock_log_webhook_activity.call_args.kwargs["data"]
+    assert log_data["invalid_records"] == 1
+    assert list(log_data["errors"]) == ["1"]
+
+
+api_client = TestClient(app)
+
+
+async def _stream_bytes(data: bytes, chunk_size: int):
+    for i in range(0, len(data), chunk_size):
+        yield data[i: i + chunk_size]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 100000])
+async def test_iter_json_array_parses_items_across_chunks(chunk_size):
+    items = [{"device_id": f"collar-{i}", "lat": -51.7 + i, "tags": ["a", "ü"]} for i in range(20)] + [12345, "text", None]
+    items += [{"note": 'quoted \\"}] and \\\\', "nested": [[{}], {"a": "]"}]}, ["\\", "[{"], "\\"]
+    data = json.dumps(items, indent=2, ensure_ascii=False).encode("utf-8")
+
+    parsed_items = [item async for item in iter_json_array(_stream_bytes(data, chunk_size))]
+
+    assert parsed_items == items
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("data", [b'{"device_id": "collar-1"}', b'[{"a": 1}, ]', b'[{"a": 1} {"b": 2}]', b'[{"a": 1}', b'[1] 2'])
+async def test_iter_json_array_with_invalid_arrays(data):
+    with pytest.raises(ValueError):
+        [item async for item in iter_json_array(_stream_bytes(data, 4))]
+
+
+@pytest.mark.asyncio
+async def test_iter_json_array_with_max_size():
+    data = json.dumps([{"device_id": f"collar-{i}"} for i in range(100)]).encode()
+
+    with pytest.raises(WebhookPayloadTooLarge):
+        [item async for item in iter_json_array(_stream_bytes(data, 64), max_size=1000)]
+
+
+@pytest.mark.asyncio
+async def test_iter_json_array_decodes_each_item_once(mocker):
+    items = [{"device_id": f"collar-{i}", "history": [{"lat": -51.7, "lon": -72.7}] * 50} for i in range(3)]
+    data = json.dumps(items).encode()
+    raw_decode = mocker.spy(json.JSONDecoder, "raw_decode")
+
+    parsed_items = [item async for item in iter_json_array(_stream_bytes(data, 16))]
+
+    assert parsed_items == items
+    assert raw_decode.call_count == len(items)
+
+
+@pytest.fixture
+def mock_get_webhook_handler_for_raw_payload(mocker, mock_webhook_handler):
+    mock_get_webhook_handler = mocker.MagicMock()
+    mock_get_webhook_handler.return_value = (mock_webhook_handler, None, None)
+    return mock_get_webhook_handler
+
+
+@pytest.mark.asyncio
+async def test_process_webhook_stream_passes_records_in_chunks(
+        mocker, mock_webhook_handler, mock_get_webhook_handler_for_raw_payload, integration_v2_with_webhook_generic
+):
+    mock_get_integration = mocker.patch(
+        "app.services.webhooks.get_integration", return_value=integration_v2_with_webhook_generic
+    )
+    mocker.patch("app.services.webhooks.get_webhook_handler", mock_get_webhook_handler_for_raw_payload)
+    records = [{"device_id": f"collar-{i}"} for i in range(25)]
+    request = MagicMock()
+    request.headers = {}
+    request.stream.return_value = _stream_bytes(b"  " + json.dumps(records).encode(), 50)
+
+    await process_webhook_stream(request=request, chunk_size=10, max_size=0)
+
+    payloads = [call.kwargs["payload"] for call in mock_webhook_handler.call_args_list]
+    assert [len(payload) for payload in payloads] == [10, 10, 5]
+    assert [record for payload in payloads for record in payload] == records
+    # The integration and the webhook config are resolved once for the whole stream
+    assert mock_get_integration.call_count == 1
+    assert mock_get_webhook_handler_for_raw_payload.call_count == 1
+
+
+@pytest.mark.asyncio
+async def test_process_webhook_stream_with_a_json_object(mocker):
+    mock_process_webhook = mocker.patch("app.services.webhooks.process_webhook")
+    request = MagicMock()
+    request.headers = {}
+    request.stream.return_value = _stream_bytes(b'{"device_id": "collar-1"}', 4)
+
+    await process_webhook_stream(request=request, chunk_size=10, max_size=0)
+
+    mock_process_webhook.assert_called_once_with(request=request, body=b'{"device_id": "collar-1"}')
+
+
+@pytest.mark.asyncio
+async def test_process_webhook_stream_buffers_arrays_for_handlers_without_lists(
+        mocker, mock_webhook_handler, mock_get_webhook_handler_for_fixed_json_payload, integration_v2_with_webhook
+):
+    mocker.patch("app.services.webhooks.get_integration", return_value=integration_v2_with_webhook)
+    mocker.patch("app.services.webhooks.get_webhook_handler", mock_get_webhook_handler_for_fixed_json_payload)
+    mock_process_webhook = mocker.patch("app.services.webhooks.process_webhook")
+    data = json.dumps([{"device_id": f"collar-{i}"} for i in range(25)]).encode()
+    request = MagicMock()
+    request.headers = {}
+    request.stream.return_value = _stream_bytes(data, 50)
+
+    await process_webhook_stream(request=request, chunk_size=10, max_size=0)
+
+    mock_process_webhook.assert_called_once_with(request=request, body=data, integration=integration_v2_with_webhook)
+    assert not mock_webhook_handler.called
+
+
+@pytest.mark.asyncio
+async def test_process_webhook_stream_with_invalid_json_reports_the_error(
+        mocker, mock_publish_event, mock_webhook_handler, mock_get_webhook_handler_for_raw_payload,
+        integration_v2_with_webhook_generic
+):
+    mocker.patch("app.services.webhooks.get_integration", return_value=integration_v2_with_webhook_generic)
+    mocker.patch("app.services.webhooks.get_webhook_handler", mock_get_webhook_handler_for_raw_payload)
+    mocker.patch("app.services.webhooks.publish_event", mock_publish_event)
+    data = json.dumps([{"device_id": f"collar-{i}"} for i in range(15)]).encode()[:-1] + b', {"device_id": }]'
+    request = MagicMock()
+    request.headers = {}
+    request.stream.return_value = _stream_bytes(data, 50)
+
+    with pytest.raises(WebhookPayloadInvalid):
+        await process_webhook_stream(request=request, chunk_size=10, max_size=0)
+
+    # Records before the error were processed
+    assert len(mock_webhook_handler.call_args.kwargs["payload"]) == 10
+    assert mock_publish_event.call_count == 1
+    event = mock_publish_event.call_args.kwargs["event"]
+    assert isinstance(event, IntegrationWebhookFailed)
+    assert "after 10 records" in event.payload.error
+
+
+def test_webhook_stream_with_invalid_json_is_rejected(
+        mocker, mock_publish_event, mock_get_webhook_handler_for_raw_payload, integration_v2_with_webhook_generic
+):
+    mocker.patch("app.settings.WEBHOOKS_STREAMING_ENABLED", True)
+    mocker.patch("app.services.webhooks.get_integration", return_value=integration_v2_with_webhook_generic)
+    mocker.patch("app.services.webhooks.get_webhook_handler", mock_get_webhook_handler_for_raw_payload)
+    mocker.patch("app.services.webhooks.publish_event", mock_publish_event)
+
+    response = api_client.post("/webhooks", content=b'[{"device_id": "collar-1"}, {"device_id": ]')
+
+    assert response.status_code == 400
+
+
+def test_webhook_request_too_large(mocker):
+    mocker.patch("app.settings.WEBHOOKS_MAX_BODY_SIZE", 100)
+    mock_process_webhook = mocker.patch("app.routers.webhooks.process_webhook")
+
+    response = api_client.post("/webhooks", json=[{"device_id": f"collar-{i}"} for i in range(10)])
+
+    assert response.status_code == 413
+    assert not mock_process_webhook.called
+
+
+def test_log_webhook_request_truncates_body_and_redacts_headers(mocker, caplog):
+    mocker.patch("app.settings.WEBHOOKS_LOG_BODY_MAX_LENGTH", 10)
+    request = MagicMock()
+    request.headers = {"apikey": "secret-key", "content-type": "application/json"}
+    body = json.dumps({"device_id": "collar-1", "lat": -51.7}).encode()
+
+    with caplog.at_level(logging.DEBUG, logger="app.services.webhooks"):
+        log_webhook_request(request=request, body=body)
+
+    assert f"Size: {len(body)} bytes" in caplog.text
+    assert '{"device_i...' in caplog.text
+    assert "collar-1" not in caplog.text
+    assert "secret-key" not in caplog.text
+    assert "[REDACTED]" in caplog.text
+
+
+def test_log_webhook_request_without_debug_doesnt_log_body(caplog):
+    request = MagicMock()
+    request.headers = {"apikey": "secret-key"}
+
+    with caplog.at_level(logging.INFO, logger="app.services.webhooks"):
+        log_webhook_request(request=request, body=b'{"device_id": "collar-1"}')
+
+    assert "Webhook request received" in caplog.text
+    assert "collar-1" not in caplog.text
+
+
+def test_log_webhook_request_samples_full_bodies(mocker):
+    mocker.patch("app.settings.WEBHOOKS_LOG_BODY_SAMPLE_RATE", 1.0)
+    handler = MagicMock(level=logging.NOTSET)
+    mocker.patch.object(logging.getLogger(), "handlers", [handler])
+    request = MagicMock()
+    request.headers = {"apikey": "secret-key"}
+
+    start_webhook_body_logger()
+    try:
+        log_webhook_request(request=request, body=b'{"device_id": "collar-1"}')
+    finally:
+        stop_webhook_body_logger()  # Waits for the queued records to be written
+
+    records = [call.args[0] for call in handler.handle.call_args_list if call.args[0].name.endswith(".bodies")]
+    assert len(records) == 1
+    assert "collar-1" in records[0].getMessage()
+    assert records[0].headers == {"apikey": "[REDACTED]"}
@@ -1,8 +1,13 @@
+import json
 import struct
+import time
 import typing
+from collections import OrderedDict
+from collections.abc import Sequence
 from pydantic import create_model, BaseModel
 from pydantic.fields import Field, FieldInfo, Undefined, NoArgAnyCallable
 from typing import Any, Dict, Optional, Union, List, Annotated
+from app import settings
 
 
 def find_config_for_action(configurations, action_id):
@@ -15,12 +20,158 @@ def find_config_for_action(configurations, action_id):
     )
 
 
+class LRUCache:
+    """
+    Bounded in-memory cache with least-recently-used eviction.
+    Entries expire after `ttl` seconds when set. A `max_size` of 0 disables the cache.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def get(self, key, default=None):
+        try:
+            expires_at, value = self._data[key]
+        except KeyError:
+            self.misses += 1
+            return default
+        if expires_at is not None and expires_at <= time.monotonic():
+            del self._data[key]
+            self.misses += 1
+            return default
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def set(self, key, value):
+        if self.max_size <= 0:
+            return
+        expires_at = time.monotonic() + self.ttl if self.ttl else None
+        self._data[key] = (expires_at, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.max_size:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        entry = self._data.pop(key, None)
+        return entry[1] if entry else default
+
+    def keys(self):
+        return list(self._data.keys())
+
+    def clear(self):
+        self._data.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+
+def _get_hex_format_spec(hex_format: dict) -> str:
+    return hex_format.get("byte_order", "<") + ''.join(f["format"] for f in hex_format["fields"])
+
+
+def _get_output_cast(output_type="hex"):
+    if output_type == "bool":
+        return bool
+    elif output_type == "int":
+        return int
+    else:  # hex string by default
+        return hex
+
+
+class StructHexDecoder:
+    """
+    Decoder of hex strings with the structure defined in a `hex_format`, compiled once:
+    a precompiled struct, and the masks and output casts of every field and bit field.
+    """
+
+    def __init__(self, hex_format: dict):
+        self.format_spec = _get_hex_format_spec(hex_format)
+        self.struct = struct.Struct(self.format_spec)
+        fields = hex_format["fields"]
+        self.field_names = [f["name"] for f in fields]
+        self._field_casts = [_get_output_cast(f.get("output_type", "int")) for f in fields]
+        # (index of the unpacked value, shift, mask, cast) for each bit field, in output order
+        self._bit_fields = []
+        for index, field in enumerate(fields):
+            for bit_field in field.get("bit_fields", []):
+                start_bit, end_bit = bit_field["start_bit"], bit_field["end_bit"]
+                mask = 2 ** (end_bit - start_bit + 1) - 1
+                cast = _get_output_cast(bit_field.get("output_type", "bool"))
+                self._bit_fields.append((index, start_bit, mask, cast))
+                self.field_names.append(bit_field["name"])
+
+    def _decode_values(self, unpacked_fields: tuple) -> dict:
+        field_values = [cast(value) for cast, value in zip(self._field_casts, unpacked_fields)]
+        field_values.extend(
+            cast((unpacked_fields[index] >> shift) & mask) for index, shift, mask, cast in self._bit_fields
+        )
+        return dict(zip(self.field_names, field_values))
+
+    def decode(self, hex_string: str) -> dict:
+        bytes_data = bytes.fromhex(hex_string)
+        if len(bytes_data) != self.struct.size:
+            raise ValueError("Hex string does not match the expected length for format")
+        return self._decode_values(self.struct.unpack(bytes_data))
+
+    def decode_many(self, hex_strings: typing.Iterable[str]) -> List[dict]:
+        """Decode many hex strings at once, unpacking all of them in a single pass"""
+        chunks = []
+        for index, hex_string in enumerate(hex_strings):
+            chunk = bytes.fromhex(hex_string)
+            if len(chunk) != self.struct.size:
+                raise ValueError(f"Hex string at index {index} does not match the expected length for format")
+            chunks.append(chunk)
+        return [self._decode_values(values) for values in self.struct.iter_unpack(b"".join(chunks))]
+
+
+# Compiled decoders by hex format, shared by all the payloads with the same format
+_struct_hex_decoders = LRUCache(max_size=settings.STRUCT_HEX_DECODERS_CACHE_MAX_SIZE)
+
+
+def _get_hex_format_key(hex_format: dict) -> tuple:
+    """A hashable key with the parts of the format that the decoder uses"""
+    return (
+        hex_format.get("byte_order", "<"),
+        tuple(
+            (
+                f["name"], f["format"], f.get("output_type", "int"),
+                tuple(
+                    (b["name"], b["start_bit"], b["end_bit"], b.get("output_type", "bool"))
+                    for b in f.get("bit_fields", [])
+                )
+            )
+            for f in hex_format["fields"]
+        )
+    )
+
+
+def get_struct_hex_decoder(hex_format: dict) -> StructHexDecoder:
+    key = _get_hex_format_key(hex_format)
+    if (decoder := _struct_hex_decoders.get(key)) is None:
+        decoder = StructHexDecoder(hex_format)
+        _struct_hex_decoders.set(key, decoder)
+    return decoder
+
+
+def decode_hex_strings(hex_strings: typing.Iterable[str], hex_format: dict) -> List[dict]:
+    """Decode many hex strings with the same format, e.g. a batch of frames, into dicts with their fields"""
+    return get_struct_hex_decoder(hex_format).decode_many(hex_strings)
+
+
 class StructHexString:
     def __init__(self, value: str, hex_format):
         self.value = value
         self.hex_format = hex_format
-        self.format_spec = hex_format.get("byte_order", "<") + ''.join(f["format"] for f in hex_format["fields"])
-        self.unpacked_data = self._unpack_data()
+        decoder = get_struct_hex_decoder(hex_format)
+        self.format_spec = decoder.format_spec
+        self.unpacked_data = decoder.decode(value)
 
     @classmethod
     def __get_validators__(cls):
@@ -29,46 +180,15 @@ class StructHexString:
     @classmethod
     def validate(cls, v: str, values, field):
         hex_format = values['hex_format']  # Assumes format is already set in the parent model
-        format_spec = hex_format.get("byte_order", "<") + ''.join(d["format"] for d in hex_format["fields"])
         try:
-            bytes_data = bytes.fromhex(v)
-            if len(bytes_data) != struct.calcsize(format_spec):
-                raise ValueError("Hex string does not match the expected length for format")
+            return cls(v, hex_format)
         except (ValueError, struct.error) as e:
-            raise ValueError(f"Invalid hex string for format '{format_spec}': {str(e)}")
-
-        return cls(v, hex_format)
+            raise ValueError(f"Invalid hex string for format '{_get_hex_format_spec(hex_format)}': {str(e)}")
 
     @classmethod
     def __modify_schema__(cls, field_schema):
         field_schema.update(type="hex_string", example="123456789ABCDEF", description="Hex string data")
 
-    def _unpack_data(self):
-        field_values = []
-        unpacked_fields = struct.unpack(self.format_spec, bytes.fromhex(self.value))
-        for s, v in zip(self.hex_format["fields"], unpacked_fields):
-            field_values.append(self._cast_output(value=v, output_type=s.get("output_type", "int")))
-        field_names = [f["name"] for f in self.hex_format["fields"]]
-        fields_with_bitfields = [f for f in self.hex_format["fields"] if "bit_fields" in f]
-        for field in fields_with_bitfields:
-            bit_fields = field["bit_fields"]
-            for bit_field in bit_fields:
-                start_bit = bit_field["start_bit"]
-                end_bit = bit_field["end_bit"]
-                field_value = unpacked_fields[field_names.index(field["name"])]
-                bits_value = (field_value >> start_bit) & (2 ** (end_bit - start_bit + 1) - 1)
-                field_values.append(self._cast_output(value=bits_value, output_type=bit_field.get("output_type", "bool")))
-                field_names.append(bit_field["name"])
-        return dict(zip(field_names, field_values))
-
-    def _cast_output(self, value, output_type="hex"):
-        if output_type == "bool":
-            return bool(value)
-        elif output_type == "int":
-            return int(value)
-        else:  # hex string by default
-            return hex(value)
-
     def __repr__(self) -> str:
         return f"StructHexString(value={self.value}, hex_format={self.hex_format})"
 
@@ -398,7 +518,67 @@ class OptionalStringType(str):
         field_schema["type"] = ["string", "null"]
 
 
-def generate_batches(iterable, batch_size):
-    for i in range(0, len(iterable), batch_size):
-        yield iterable[i: i + batch_size]
+def _get_record_size(record) -> int:
+    # Size of the record once serialized as JSON, as sent to the Gundi API
+    return len(json.dumps(record, default=str).encode("utf-8"))
+
+
+class _BatchBuilder:
+    """Accumulates items into batches for `generate_batches` and `generate_batches_async`"""
+
+    def __init__(self, batch_size: int, max_batch_bytes: Optional[int] = None):
+        self.batch_size = batch_size
+        self.max_batch_bytes = max_batch_bytes
+        self.batch, self.batch_bytes = [], 0
+
+    def add(self, item) -> List[list]:
+        """Add an item, and return the batches completed by it, if any"""
+        completed = []
+        item_bytes = _get_record_size(item) if self.max_batch_bytes else 0
+        if self.batch and self.max_batch_bytes and self.batch_bytes + item_bytes > self.max_batch_bytes:
+            completed.append(self.flush())
+        self.batch.append(item)
+        self.batch_bytes += item_bytes
+        if len(self.batch) >= self.batch_size:  # Full, sent without waiting for the next item
+            completed.append(self.flush())
+        return completed
+
+    def flush(self) -> list:
+        batch, self.batch, self.batch_bytes = self.batch, [], 0
+        return batch
+
+
+def generate_batches(iterable, batch_size, max_batch_bytes: Optional[int] = None):
+    """
+    Split a list, or any iterable (e.g. a generator), into batches of up to `batch_size` items.
+    Iterables are consumed lazily, so sources of unknown length don't need to be loaded in memory.
+    If `max_batch_bytes` is set, batches are also cut before their records (serialized as JSON)
+    exceed that size. A record bigger than the limit is sent in a batch on its own.
+    """
+    if max_batch_bytes is None and isinstance(iterable, Sequence):
+        for i in range(0, len(iterable), batch_size):
+            yield iterable[i: i + batch_size]
+        return
+    builder = _BatchBuilder(batch_size, max_batch_bytes)
+    for item in iterable:
+        yield from builder.add(item)
+    if batch := builder.flush():
+        yield batch
+
+
+async def generate_batches_async(iterable, batch_size, max_batch_bytes: Optional[int] = None):
+    """
+    Async variant of `generate_batches`, which also accepts async iterables (e.g. an async
+    generator reading pages from a provider's API), consuming them lazily.
+    """
+    if not hasattr(iterable, "__aiter__"):
+        for batch in generate_batches(iterable, batch_size, max_batch_bytes):
+            yield batch
+        return
+    builder = _BatchBuilder(batch_size, max_batch_bytes)
+    async for item in iterable:
+        for batch in builder.add(item):
+            yield batch
+    if batch := builder.flush():
+        yield batch
 
@@ -1,23 +1,38 @@
 import asyncio
+import codecs
 import datetime
+import hashlib
 import importlib
 import ipaddress
+import json
 import logging
+import logging.handlers
+import queue
+import random
+import re
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, NamedTuple, Optional, Tuple
 from urllib.parse import urlparse
 import httpx
+import pydantic
 import stamina
 from fastapi import Request
 from app import settings
-from app.services.activity_logger import log_activity, publish_event
+from app.services.activity_logger import log_activity, log_webhook_activity, publish_event
 from gundi_client_v2 import GundiClient
-from gundi_core.events import IntegrationWebhookFailed, WebhookExecutionFailed
-from app.services.utils import DyntamicFactory
+from gundi_core.events import IntegrationWebhookFailed, WebhookExecutionFailed, LogLevel
+from app.services.utils import DyntamicFactory, LRUCache, generate_batches_async
 from app.webhooks.core import get_webhook_handler, DynamicSchemaConfig, HexStringConfig, GenericJsonPayload
 from app.services.config_manager import IntegrationConfigurationManager
 
 config_manager = IntegrationConfigurationManager()
 logger = logging.getLogger(__name__)
 _diagnostic_client: httpx.AsyncClient | None = None
+# Payload models built from json schemas, keyed by a hash of the schema and the base model.
+# A webhook config with a changed schema gets a new key, and stale models are evicted over time.
+_dynamic_payload_models = LRUCache(max_size=settings.DYNAMIC_PAYLOAD_MODELS_CACHE_MAX_SIZE)
+# Models wrapping lists of payloads, keyed by the payload model. One per model above, at most
+_list_payload_models = LRUCache(max_size=settings.DYNAMIC_PAYLOAD_MODELS_CACHE_MAX_SIZE)
 
 
 def _get_diagnostic_client() -> httpx.AsyncClient:
@@ -51,33 +66,22 @@ _BLOCKED_NETWORKS = [
 ]
 
 
-async def _validate_diagnostic_url(url: str) -> None:
-    """Raise ValueError if url fails SSRF safety checks.
+# Results of validating diagnostic hostnames, keyed by hostname: the address to connect to, or the error.
+# Short lived, so DNS changes are picked up soon while bursts of webhooks don't resolve the name every time.
+_validated_diagnostic_hosts = LRUCache(
+    max_size=settings.DIAGNOSTIC_DNS_CACHE_MAX_SIZE, ttl=settings.DIAGNOSTIC_DNS_CACHE_TTL
+)
 
-    Note: this validation is a best-effort defence. Because DNS is re-resolved
-    by httpx at request time, a DNS-rebinding attack could cause the actual
-    connection to reach a private address even after this check passes (TOCTOU).
-    Operators should also restrict outbound network access at the infrastructure
-    level for a complete mitigation.
-    """
-    parsed = urlparse(url)
-    if parsed.scheme != "https":
-        raise ValueError(
-            f"Diagnostic URL scheme '{parsed.scheme}' is not allowed; only 'https' is permitted."
-        )
-    hostname = (parsed.hostname or "").rstrip(".").lower()
-    if not hostname:
-        raise ValueError("Diagnostic URL has no hostname.")
-    allowlist = settings.DIAGNOSTIC_URL_ALLOWLIST
-    if allowlist and hostname not in [h.rstrip(".").lower() for h in allowlist]:
-        raise ValueError(
-            f"Diagnostic URL hostname '{hostname}' is not in the configured allowlist."
-        )
+
+async def _resolve_diagnostic_hostname(hostname: str) -> str:
+    """Resolve the hostname and return the first address, raising ValueError if any address is blocked."""
     loop = asyncio.get_running_loop()
     try:
         addr_infos = await loop.getaddrinfo(hostname, None)
     except OSError as e:
         raise ValueError(f"Cannot resolve diagnostic URL hostname '{hostname}': {e}")
+    if not addr_infos:
+        raise ValueError(f"Cannot resolve diagnostic URL hostname '{hostname}': no addresses found.")
     for _, _, _, _, sockaddr in addr_infos:
         ip = ipaddress.ip_address(sockaddr[0])
         # An IPv4-mapped IPv6 address (::ffff:a.b.c.d) parses as IPv6 and would
@@ -89,6 +93,60 @@ async def _validate_diagnostic_url(url: str) -> None:
                 f"Diagnostic URL resolves to a private or reserved address ({ip}), "
                 "which is blocked to prevent SSRF."
             )
+    return addr_infos[0][4][0]
+
+
+async def _validate_diagnostic_url(url: str) -> str:
+    """Raise ValueError if url fails SSRF safety checks.
+    Returns the validated address of the host, which the request must connect to.
+
+    Connecting to the validated address instead of letting httpx resolve the
+    hostname again closes the DNS-rebinding window (TOCTOU) between the check
+    and the request. Resolutions are cached for DIAGNOSTIC_DNS_CACHE_TTL seconds.
+    Operators should still restrict outbound network access at the infrastructure
+    level for a complete mitigation.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme != "https":
+        raise ValueError(
+            f"Diagnostic URL scheme '{parsed.scheme}' is not allowed; only 'https' is permitted."
+        )
+    hostname = (parsed.hostname or "").rstrip(".").lower()
+    if not hostname:
+        raise ValueError("Diagnostic URL has no hostname.")
+    allowlist = settings.DIAGNOSTIC_URL_ALLOWLIST
+    if allowlist and hostname not in [h.rstrip(".").lower() for h in allowlist]:
+        raise ValueError(
+            f"Diagnostic URL hostname '{hostname}' is not in the configured allowlist."
+        )
+    result = _validated_diagnostic_hosts.get(hostname)
+    if result is None:
+        try:
+            result = (await _resolve_diagnostic_hostname(hostname), None)
+        except ValueError as e:
+            result = (None, str(e))
+        _validated_diagnostic_hosts.set(hostname, result)
+    address, error = result
+    if error:
+        raise ValueError(error)
+    return address
+
+
+def _pin_url_to_address(url: str, address: str) -> Tuple[str, dict, dict]:
+    """
+    Rewrite the url to connect to the given address.
+    Returns the url, the headers and the request extensions, so the Host header
+    and the TLS certificate checks still use the original hostname.
+    """
+    parsed = urlparse(url)
+    hostname = parsed.hostname
+    host = f"[{address}]" if ":" in address else address
+    host_header = hostname if not parsed.port else f"{hostname}:{parsed.port}"
+    netloc = host if not parsed.port else f"{host}:{parsed.port}"
+    if "@" in parsed.netloc:  # Keep the credentials, if any
+        netloc = f"{parsed.netloc.rsplit('@', 1)[0]}@{netloc}"
+    pinned_url = parsed._replace(netloc=netloc).geturl()
+    return pinned_url, {"Host": host_header}, {"sni_hostname": hostname}
 
 
 def _redact_url(url: str) -> str:
@@ -104,22 +162,22 @@ def _redact_url(url: str) -> str:
         return "<unparseable url>"
 
 
-async def forward_payload_to_diagnostic_url(
-    destination_url: str,
-    integration_id: str,
-    json_content,
-):
+def _build_diagnostic_body(integration_id: str, json_content):
+    metadata = {
+        "integration_id": integration_id,
+        "received_at": datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
+    }
+    if isinstance(json_content, dict):
+        return {**json_content, "__gundi_diagnostic_metadata": metadata}
+    return {"payload": json_content, "__gundi_diagnostic_metadata": metadata}
+
+
+async def _post_diagnostic_payload(destination_url: str, integration_id: str, body) -> bool:
+    """Post the body to the diagnostic url. Errors are logged, and False is returned."""
     try:
-        await _validate_diagnostic_url(destination_url)
-        metadata = {
-            "integration_id": integration_id,
-            "received_at": datetime.datetime.now(datetime.timezone.utc).isoformat().replace("+00:00", "Z"),
-        }
-        if isinstance(json_content, dict):
-            body = {**json_content, "__gundi_diagnostic_metadata": metadata}
-        else:
-            body = {"payload": json_content, "__gundi_diagnostic_metadata": metadata}
-        response = await _get_diagnostic_client().post(destination_url, json=body)
+        address = await _validate_diagnostic_url(destination_url)
+        url, headers, extensions = _pin_url_to_address(destination_url, address)
+        response = await _get_diagnostic_client().post(url, json=body, headers=headers, extensions=extensions)
         response.raise_for_status()
         logger.debug(
             f"Diagnostic payload forwarded to '{_redact_url(destination_url)}' "
@@ -130,6 +188,158 @@ async def forward_payload_to_diagnostic_url(
             f"Diagnostic forwarding to '{_redact_url(destination_url)}' failed for integration "
             f"'{integration_id}': {type(e).__name__}: {e}"
         )
+        return False
+    return True
+
+
+async def forward_payload_to_diagnostic_url(
+    destination_url: str,
+    integration_id: str,
+    json_content,
+):
+    body = _build_diagnostic_body(integration_id=integration_id, json_content=json_content)
+    await _post_diagnostic_payload(destination_url=destination_url, integration_id=integration_id, body=body)
+
+
+class DiagnosticForwarder:
+    """Forwards webhook payloads to diagnostic urls in the background.
+
+    Payloads are queued by `enqueue` and sent by a fixed pool of worker tasks,
+    with up to `max_per_destination` requests in flight per destination host,
+    so a slow diagnostic endpoint can't pile up tasks in the service.
+    Payloads for a host that has no free slot wait in a list of that host, and
+    are sent by the workers already sending to it, so the other workers keep
+    serving the other hosts. Waiting payloads count towards `max_queue_size`,
+    and when it's reached, payloads are dropped and counted.
+    `stop()` sends whatever is still queued, up to a timeout.
+    """
+
+    _STOP = object()
+
+    def __init__(self, workers: int = 4, max_queue_size: int = 1000, max_per_destination: int = 2):
+        self.workers = workers
+        self.max_queue_size = max_queue_size
+        self.max_per_destination = max_per_destination
+        self._queue = asyncio.Queue(maxsize=max_queue_size)
+        self._workers: List[asyncio.Task] = []
+        # Only hosts with requests in flight have entries, so these don't grow with every host seen
+        self._destination_in_flight: Dict[str, int] = {}
+        self._destination_waiting: Dict[str, Deque[tuple]] = {}
+        # Counters to help sizing the queue and workers
+        self.forwarded = 0
+        self.failed = 0
+        self.dropped = 0
+
+    @property
+    def queue_depth(self) -> int:
+        return self._queue.qsize() + sum(len(waiting) for waiting in self._destination_waiting.values())
+
+    @property
+    def is_running(self) -> bool:
+        return any(
+            not worker.done() and worker.get_loop() is asyncio.get_running_loop()
+            for worker in self._workers
+        )
+
+    def start(self):
+        if not self.is_running:
+            self._destination_in_flight.clear()
+            self._destination_waiting.clear()
+            self._workers = [asyncio.create_task(self._run()) for _ in range(self.workers)]
+
+    def enqueue(self, destination_url: str, integration_id: str, json_content) -> bool:
+        """Queue a payload to be forwarded. Returns False if it was dropped because the queue is full."""
+        # The body is built now, as the handler may change the payload afterwards
+        body = _build_diagnostic_body(integration_id=integration_id, json_content=json_content)
+        try:
+            if self.queue_depth >= self.max_queue_size:
+                raise asyncio.QueueFull
+            self._queue.put_nowait((destination_url, integration_id, body))
+        except asyncio.QueueFull:
+            self.dropped += 1
+            logger.warning(
+                f"Diagnostic forwarding queue is full. Payload for integration '{integration_id}' "
+                f"to '{_redact_url(destination_url)}' was dropped ({self.dropped} dropped so far)."
+            )
+            return False
+        return True
+
+    async def stop(self, timeout: Optional[float] = None):
+        """Send the queued payloads and stop the workers."""
+        if not self._workers:
+            return
+        for _ in self._workers:
+            await self._queue.put(self._STOP)
+        try:
+            await asyncio.wait_for(asyncio.gather(*self._workers), timeout=timeout)
+        except asyncio.TimeoutError:
+            logger.error(
+                f"Timed out forwarding diagnostic payloads on shutdown. {self.queue_depth} queued payload(s) were dropped."
+            )
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "queue_depth": self.queue_depth,
+            "forwarded": self.forwarded,
+            "failed": self.failed,
+            "dropped": self.dropped,
+        }
+
+    async def _run(self):
+        while True:
+            item = await self._queue.get()
+            if item is self._STOP:
+                break
+            destination = (urlparse(item[0]).hostname or "").lower()
+            if self._destination_in_flight.get(destination, 0) >= self.max_per_destination:
+                # Left for the workers sending to that host, instead of waiting for it here
+                self._destination_waiting.setdefault(destination, deque()).append(item)
+                continue
+            self._destination_in_flight[destination] = self._destination_in_flight.get(destination, 0) + 1
+            try:
+                while item:
+                    await self._forward(*item)
+                    item = self._next_waiting(destination)
+            finally:
+                self._destination_in_flight[destination] -= 1
+                if not self._destination_in_flight[destination]:
+                    del self._destination_in_flight[destination]
+
+    def _next_waiting(self, destination: str) -> Optional[tuple]:
+        waiting = self._destination_waiting.get(destination)
+        if not waiting:
+            return None
+        item = waiting.popleft()
+        if not waiting:
+            del self._destination_waiting[destination]
+        return item
+
+    async def _forward(self, destination_url: str, integration_id: str, body):
+        if await _post_diagnostic_payload(destination_url, integration_id, body):
+            self.forwarded += 1
+        else:
+            self.failed += 1
+
+
+diagnostic_forwarder = DiagnosticForwarder(
+    workers=settings.DIAGNOSTIC_FORWARDING_WORKERS,
+    max_queue_size=settings.DIAGNOSTIC_FORWARDING_MAX_QUEUE_SIZE,
+    max_per_destination=settings.DIAGNOSTIC_FORWARDING_MAX_PER_DESTINATION,
+)
+
+
+def start_diagnostic_forwarder():
+    diagnostic_forwarder.start()
+
+
+async def stop_diagnostic_forwarder():
+    await diagnostic_forwarder.stop(timeout=settings.DIAGNOSTIC_FORWARDING_DRAIN_TIMEOUT)
+
+
+def get_diagnostic_forwarder_stats() -> dict:
+    return {**diagnostic_forwarder.stats(), "dns_cache_hits": _validated_diagnostic_hosts.hits,
+            "dns_cache_misses": _validated_diagnostic_hosts.misses}
 
 
 async def get_integration(request):
@@ -162,49 +372,428 @@ async def get_integration(request):
     return integration
 
 
-async def process_webhook(request: Request):
+_REDACTED_HEADERS = {"authorization", "proxy-authorization", "apikey", "x-api-key", "cookie"}
+# Full bodies of sampled webhook requests are logged apart, through a bounded queue
+# and a background thread, so writing them never blocks the event loop
+body_logger = logging.getLogger(f"{__name__}.bodies")
+_body_log_listener: logging.handlers.QueueListener | None = None
+
+
+class _DroppingQueueHandler(logging.handlers.QueueHandler):
+    dropped = 0
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:  # Drop the body rather than waiting
+            self.dropped += 1
+
+
+def start_webhook_body_logger():
+    global _body_log_listener
+    if not settings.WEBHOOKS_LOG_BODY_SAMPLE_RATE or _body_log_listener is not None:
+        return
+    log_queue = queue.Queue(maxsize=1000)
+    _body_log_listener = logging.handlers.QueueListener(
+        log_queue, *logging.getLogger().handlers, respect_handler_level=True
+    )
+    body_logger.addHandler(_DroppingQueueHandler(log_queue))
+    body_logger.propagate = False
+    _body_log_listener.start()
+
+
+def stop_webhook_body_logger():
+    global _body_log_listener
+    if _body_log_listener is None:
+        return
+    _body_log_listener.stop()  # Writes the bodies still in the queue
+    for handler in list(body_logger.handlers):
+        if isinstance(handler, _DroppingQueueHandler):
+            body_logger.removeHandler(handler)
+    body_logger.propagate = True
+    _body_log_listener = None
+
+
+def _redact_headers(headers) -> dict:
+    return {name: "[REDACTED]" if name.lower() in _REDACTED_HEADERS else value for name, value in headers.items()}
+
+
+def log_webhook_request(request: Request, body: bytes = None):
+    """Log the metadata of a webhook request, and depending on the settings, part or all of its body"""
+    size = len(body) if body is not None else request.headers.get("content-length")
+    logger.info(
+        f"Webhook request received. Size: {size} bytes.",
+        extra={
+            "content_type": request.headers.get("content-type"),
+            "consumer_username": request.headers.get("x-consumer-username"),
+            "integration_id": request.headers.get("x-gundi-integration-id") or request.query_params.get("integration_id"),
+        }
+    )
+    if body is None:  # Streamed, the body isn't available
+        return
+    if logger.isEnabledFor(logging.DEBUG):
+        max_length = settings.WEBHOOKS_LOG_BODY_MAX_LENGTH
+        preview = body[:max_length].decode("utf-8", errors="replace")
+        truncated = f"... ({len(body) - max_length} more bytes)" if len(body) > max_length else ""
+        logger.debug(f"Webhook body: {preview}{truncated}. Headers: {_redact_headers(request.headers)}")
+    if _body_log_listener is not None and random.random() < settings.WEBHOOKS_LOG_BODY_SAMPLE_RATE:
+        body_logger.info(
+            f"Sampled webhook body: {body.decode('utf-8', errors='replace')}",
+            extra={"headers": _redact_headers(request.headers)}
+        )
+
+
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# Tokens that matter to find the end of a JSON value: escapes (skipped as a pair), quotes and brackets
+_JSON_TOKEN = re.compile(r'\\.|["\[\]{}]', re.DOTALL)
+_JSON_SCALAR_END = re.compile(r"[ \t\n\r,\]]")
+
+
+class WebhookPayloadTooLarge(Exception):
+    pass
+
+
+class WebhookPayloadInvalid(Exception):
+    pass
+
+
+async def _read_chunks(chunks, max_size: int = None) -> bytes:
+    body, size = [], 0
+    async for chunk in chunks:
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise WebhookPayloadTooLarge(f"The request body exceeds the limit of {max_size} bytes")
+        body.append(chunk)
+    return b"".join(body)
+
+
+async def read_webhook_body(request: Request, max_size: int = None) -> bytes:
+    """Read the whole body of a webhook request, failing as soon as it's bigger than `max_size` bytes."""
+    max_size = settings.WEBHOOKS_MAX_BODY_SIZE if max_size is None else max_size
+    if max_size and int(request.headers.get("content-length") or 0) > max_size:
+        raise WebhookPayloadTooLarge(f"The request body exceeds the limit of {max_size} bytes")
+    return await _read_chunks(request.stream(), max_size=max_size)
+
+
+def _find_json_value_end(text: str, start: int, state: tuple = None):
+    """
+    Find where the JSON value starting at `start` ends, without parsing it.
+    Returns the end, or None and the state to resume the scan from once more text arrives,
+    so a value spanning many chunks is scanned once instead of parsed again on every chunk.
+    """
+    offset, depth, in_string = state or (0, 0, False)
+    if text[start] not in '[{"':  # Numbers and literals end at the next delimiter
+        match = _JSON_SCALAR_END.search(text, start + offset)
+        return (match.start(), None) if match else (None, (len(text) - start, 0, False))
+    position = start + offset
+    for match in _JSON_TOKEN.finditer(text, position):
+        token, position = match.group(), match.end()
+        if in_string:
+            if token == '"':
+                in_string = False
+                if depth == 0:
+                    return position, None
+        elif token == '"':
+            in_string = True
+        elif token in "[{":
+            depth += 1
+        elif token in "]}":
+            depth -= 1
+            if depth == 0:
+                return position, None
+    if position < len(text) and text[-1] == "\\":  # An escape cut by the chunk, scan it again with the next char
+        position = len(text) - 1
+    else:
+        position = len(text)
+    return None, (position - start, depth, in_string)
+
+
+async def iter_json_array(byte_stream, max_size: int = None):
+    """
+    Parse the items of a JSON array incrementally from an async iterator of bytes, yielding each
+    item as soon as it's complete, so the whole document is never loaded in memory at once.
+    Raises ValueError if the document isn't a valid JSON array, and WebhookPayloadTooLarge past `max_size` bytes.
+    """
+    decoder = json.JSONDecoder()
+    text_decoder = codecs.getincrementaldecoder("utf-8")()
+    buffer, size = "", 0
+    started = closed = finished = False
+    after_value = after_comma = False
+    scan_state = None  # Where the scan of an incomplete item stopped
+    chunks = byte_stream.__aiter__()
+    while not finished:
+        try:
+            chunk = await chunks.__anext__()
+        except StopAsyncIteration:
+            chunk, finished = b"", True
+        size += len(chunk)
+        if max_size and size > max_size:
+            raise WebhookPayloadTooLarge(f"The request body exceeds the limit of {max_size} bytes")
+        buffer += text_decoder.decode(chunk, final=finished)
+        position = 0
+        while (position := _JSON_WHITESPACE.match(buffer, position).end()) < len(buffer):
+            char = buffer[position]
+            if not started:
+                if char != "[":
+                    raise ValueError("The body is not a JSON array")
+                started = True
+                position += 1
+            elif closed:
+                raise ValueError("Extra data after the JSON array")
+            elif char == "]" and not after_comma:
+                closed = True
+                position += 1
+            elif char == "," and after_value:
+                after_value, after_comma = False, True
+                position += 1
+            elif not after_value:
+                end, scan_state = _find_json_value_end(buffer, position, scan_state)
+                if end is None and not finished:
+                    break  # Incomplete item, wait for more data
+                item, position = decoder.raw_decode(buffer, position)
+                yield item
+                after_value, after_comma = True, False
+            else:
+                raise ValueError(f"Unexpected {char!r} in the JSON array")
+        buffer = buffer[position:]
+    if not closed:
+        raise ValueError("Incomplete JSON array")
+
+
+def _accepts_records_list(payload_model, config_model) -> bool:
+    """Handlers get lists of records when they take the raw payload, or payloads with a dynamic schema"""
+    if config_model and issubclass(config_model, HexStringConfig):  # The hex settings are set in a single payload
+        return False
+    if not payload_model:
+        return True
+    return issubclass(payload_model, GenericJsonPayload) and bool(config_model) and issubclass(config_model, DynamicSchemaConfig)
+
+
+async def process_webhook_stream(request: Request, chunk_size: int = None, max_size: int = None):
+    """
+    Process a webhook request while its body arrives. The records of a JSON array are passed
+    to the webhook handler in chunks of up to `chunk_size` records, if the handler accepts lists.
+    Other documents are read (up to `max_size` bytes) and processed as usual.
+    Raises WebhookPayloadInvalid if the array turns out to be invalid JSON, after processing the records before the error.
+    """
+    chunk_size = chunk_size or settings.WEBHOOKS_STREAMING_CHUNK_SIZE
+    max_size = settings.WEBHOOKS_MAX_BODY_SIZE if max_size is None else max_size
+    if max_size and int(request.headers.get("content-length") or 0) > max_size:
+        raise WebhookPayloadTooLarge(f"The request body exceeds the limit of {max_size} bytes")
+    # Look at the first bytes to know whether it's an array
+    stream = request.stream().__aiter__()
+    head = b""
+    async for chunk in stream:
+        head += chunk
+        if head.lstrip():
+            break
+
+    async def _read_body():
+        yield head
+        async for chunk in stream:
+            yield chunk
+
+    if not head.lstrip().startswith(b"["):
+        return await process_webhook(request=request, body=await _read_chunks(_read_body(), max_size=max_size))
+    integration = await get_integration(request=request)
+    if not integration:
+        _log_integration_not_found(request)
+        return {}
     try:
-        # Try to relate the request to an integration
-        integration = await get_integration(request=request)
-        if not integration:
-            logger.warning(
-                "No integration found for webhook request: "
-                f"consumer_username: {request.headers.get('x-consumer-username')}, "
-                f"integration_id header: {request.headers.get('x-gundi-integration-id')}, "
-                f"integration_id param: {request.query_params.get('integration_id')}"
+        context = _get_webhook_context(integration)
+    except Exception:  # Reported when processing the whole body
+        context = None
+    if not context or not _accepts_records_list(context.payload_model, context.config_model):
+        body = await _read_chunks(_read_body(), max_size=max_size)
+        return await process_webhook(request=request, body=body, integration=integration)
+    records_count = 0
+    try:
+        async for records in generate_batches_async(iter_json_array(_read_body(), max_size=max_size), chunk_size):
+            # Only the first chunk is forwarded to the diagnostic url, as a sample of the payload
+            await _process_webhook_payload(
+                integration=integration, json_content=records, context=context, forward_to_diagnostic=records_count == 0
+            )
+            records_count += len(records)
+    except ValueError as e:  # Invalid JSON. Chunks before the error were already processed
+        message = f"Error parsing streamed webhook payload after {records_count} records: {type(e).__name__}: {e}"
+        logger.exception(message)
+        await _publish_webhook_failed(integration=integration, error=message, config_data=context.config_data)
+        raise WebhookPayloadInvalid(message)
+    return {}
+
+
+def get_dynamic_payload_model(json_schema: dict, base_model):
+    """Build a pydantic model from a json schema, or reuse the one built before for the same schema"""
+    schema_hash = hashlib.sha256(json.dumps(json_schema, sort_keys=True, default=str).encode()).hexdigest()
+    key = (schema_hash, base_model)
+    if (model := _dynamic_payload_models.get(key)) is None:
+        model_factory = DyntamicFactory(
+            json_schema=json_schema,
+            base_model=base_model,
+            ref_template="definitions"
+        )
+        model = model_factory.make()
+        _dynamic_payload_models.set(key, model)
+    return model
+
+
+class InvalidRecord(NamedTuple):
+    """Placeholder for a record of a list that failed validation, with its errors"""
+    errors: list
+
+
+def get_list_payload_model(payload_model):
+    """
+    A model wrapping a list of payloads, to validate all of them in one pass.
+    Invalid records don't fail the whole list, they're kept as InvalidRecord with their errors.
+    """
+    if (model := _list_payload_models.get(payload_model)) is None:
+        def validate_record(cls, value):
+            try:
+                return payload_model.parse_obj(value)
+            except pydantic.ValidationError as e:
+                return InvalidRecord(e.errors())
+
+        model = pydantic.create_model(
+            f"{payload_model.__name__}List",
+            __root__=(List[Any], ...),
+            __validators__={"validate_record": pydantic.validator("__root__", each_item=True, allow_reuse=True)(validate_record)},
+        )
+        _list_payload_models.set(payload_model, model)
+    return model
+
+
+def parse_payload_list(payload_model, records: list) -> Tuple[list, Dict[int, list]]:
+    """
+    Validate a list of records with the payload model.
+    Returns the parsed valid records, and the validation errors of the invalid ones by index,
+    so a few bad records don't prevent processing the rest.
+    """
+    parsed_records, errors_by_index = [], {}
+    for index, record in enumerate(get_list_payload_model(payload_model).parse_obj(records).__root__):
+        if isinstance(record, InvalidRecord):
+            errors_by_index[index] = record.errors
+        else:
+            parsed_records.append(record)
+    return parsed_records, errors_by_index
+
+
+class _WebhookContext(NamedTuple):
+    handler: Callable
+    payload_model: Optional[type]
+    config_model: Optional[type]
+    config_data: dict
+    parsed_config: object
+
+
+def _get_webhook_context(integration) -> _WebhookContext:
+    """Get the handler and models from webhooks/handlers.py and parse the webhook config of the integration"""
+    # Look for the handler function in webhooks/handlers.py
+    webhook_handler, payload_model, config_model = get_webhook_handler()
+    # Parse config if a model was defined in webhooks/configurations.py
+    webhook_config_data = integration.webhook_configuration.data if integration.webhook_configuration else {}
+    parsed_config = config_model.parse_obj(webhook_config_data) if config_model else {}
+    return _WebhookContext(webhook_handler, payload_model, config_model, webhook_config_data, parsed_config)
+
+
+def _log_integration_not_found(request: Request):
+    logger.warning(
+        "No integration found for webhook request: "
+        f"consumer_username: {request.headers.get('x-consumer-username')}, "
+        f"integration_id header: {request.headers.get('x-gundi-integration-id')}, "
+        f"integration_id param: {request.query_params.get('integration_id')}"
+    )
+
+
+async def _publish_webhook_failed(integration, error: str, config_data: dict = None):
+    await publish_event(
+        event=IntegrationWebhookFailed(
+            payload=WebhookExecutionFailed(
+                integration_id=str(integration.id),
+                webhook_id=str(integration.type.webhook.value) if integration.type.webhook else None,
+                config_data=config_data,
+                error=error  # ToDo: Support storing the error traceback and other details as in action errors
             )
+        ),
+        topic_name=settings.INTEGRATION_EVENTS_TOPIC,
+    )
+
+
+async def process_webhook(request: Request, json_content=None, body: bytes = None, integration=None):
+    """
+    Process a webhook request with its payload, given either parsed (`json_content`) or as raw `body` bytes.
+    The request body is read if neither is given. The integration is looked up from the request if not given.
+    """
+    # Try to relate the request to an integration
+    integration = integration or await get_integration(request=request)
+    if not integration:
+        _log_integration_not_found(request)
+        return {}
+    if json_content is None:
+        try:
+            json_content = json.loads(body) if body is not None else await request.json()
+        except ValueError as e:
+            message = f"Error processing webhook: {type(e).__name__}: {str(e)}"
+            logger.exception(message)
+            await _publish_webhook_failed(integration=integration, error=message)
             return {}
-        # Look for the handler function in webhooks/handlers.py
-        webhook_handler, payload_model, config_model = get_webhook_handler()
-        json_content = await request.json()
-        # Parse config if a model was defined in webhooks/configurations.py
-        webhook_config_data = integration.webhook_configuration.data if integration and integration.webhook_configuration else {}
-        parsed_config = config_model.parse_obj(webhook_config_data) if config_model else {}
+    return await _process_webhook_payload(integration=integration, json_content=json_content)
+
+
+async def _process_webhook_payload(
+        integration, json_content, context: _WebhookContext = None, forward_to_diagnostic: bool = True
+):
+    webhook_config_data = None
+    try:
+        context = context or _get_webhook_context(integration)
+        webhook_handler, payload_model, config_model, webhook_config_data, parsed_config = context
         if parsed_config and issubclass(config_model, HexStringConfig):
             json_content["hex_data_field"] = json_content.get("hex_data_field", parsed_config.hex_data_field)
             json_content["hex_format"] = json_content.get("hex_format", parsed_config.hex_format)
         # Forward raw payload to diagnostic URL before any transformation or validation
-        if diag_url := getattr(parsed_config, "diagnostic_destination_url", None):
-            asyncio.ensure_future(
-                forward_payload_to_diagnostic_url(
+        diag_url = getattr(parsed_config, "diagnostic_destination_url", None)
+        if diag_url and forward_to_diagnostic:
+            if diagnostic_forwarder.is_running:
+                diagnostic_forwarder.enqueue(
                     destination_url=diag_url,
                     integration_id=str(integration.id),
                     json_content=json_content,
                 )
-            )
+            else:  # e.g. the app runs without lifespan
+                asyncio.ensure_future(
+                    forward_payload_to_diagnostic_url(
+                        destination_url=diag_url,
+                        integration_id=str(integration.id),
+                        json_content=json_content,
+                    )
+                )
         # Parse payload if a model was defined in webhooks/configurations.py
         if payload_model:
             try:
                 if issubclass(payload_model, GenericJsonPayload) and issubclass(config_model, DynamicSchemaConfig):
                     # Build the model from a json schema
-                    model_factory = DyntamicFactory(
+                    dynamic_payload_model = get_dynamic_payload_model(
                         json_schema=parsed_config.json_schema,
-                        base_model=payload_model,
-                        ref_template="definitions"
+                        base_model=payload_model
                     )
-                    dynamic_payload_model = model_factory.make()
                     if isinstance(json_content, list):
-                        parsed_payload = [dynamic_payload_model.parse_obj(d) for d in json_content]
+                        parsed_payload, errors = parse_payload_list(dynamic_payload_model, json_content)
+                        if errors and not parsed_payload:
+                            raise ValueError(f"All the {len(json_content)} records are invalid. First errors: {next(iter(errors.values()))}")
+                        if errors:  # Forward the valid records, and report the invalid ones
+                            logger.warning(f"{len(errors)} of {len(json_content)} records are invalid and were skipped.")
+                            await log_webhook_activity(
+                                integration_id=str(integration.id),
+                                webhook_id=str(integration.type.webhook.value),
+                                title=f"{len(errors)} of {len(json_content)} records are invalid and were skipped",
+                                level=LogLevel.WARNING,
+                                config_data=webhook_config_data,
+                                data={
+                                    "invalid_records": len(errors),
+                                    # Up to 10 records, to keep the log small
+                                    "errors": {str(index): errors[index] for index in list(errors)[:10]}
+                                }
+                            )
                     else:
                         parsed_payload = dynamic_payload_model.parse_obj(json_content)
                 else:
@@ -212,17 +801,7 @@ async def process_webhook(request: Request):
             except Exception as e:
                 message = f"Error parsing payload: {type(e).__name__}: {str(e)}. Please review configurations."
                 logger.exception(message)
-                await publish_event(
-                    event=IntegrationWebhookFailed(
-                        payload=WebhookExecutionFailed(
-                            integration_id=str(integration.id),
-                            webhook_id=str(integration.type.webhook.value),
-                            config_data=webhook_config_data,
-                            error=message
-                        )
-                    ),
-                    topic_name=settings.INTEGRATION_EVENTS_TOPIC,
-                )
+                await _publish_webhook_failed(integration=integration, error=message, config_data=webhook_config_data)
                 return {}
         else:  # Pass the raw payload
             parsed_payload = json_content
@@ -230,29 +809,9 @@ async def process_webhook(request: Request):
     except (ImportError, AttributeError, NotImplementedError) as e:
         message = "Webhooks handler not found. Please implement a 'webhook_handler' function in app/webhooks/handlers.py"
         logger.exception(message)
-        await publish_event(
-            event=IntegrationWebhookFailed(
-                payload=WebhookExecutionFailed(
-                    integration_id=str(integration.id),
-                    webhook_id=str(integration.type.webhook.value),
-                    error=message
-                )
-            ),
-            topic_name=settings.INTEGRATION_EVENTS_TOPIC,
-        )
+        await _publish_webhook_failed(integration=integration, error=message)
     except Exception as e:
         message = f"Error processing webhook: {type(e).__name__}: {str(e)}"
         logger.exception(message)
-        await publish_event(
-            event=IntegrationWebhookFailed(
-                payload=WebhookExecutionFailed(
-                    integration_id=str(integration.id) if integration else None,
-                    webhook_id=str(integration.type.webhook.value) if integration and integration.type.webhook else None,
-                    config_data=webhook_config_data,
-                    error=message  # ToDo: Support storing the error traceback and other details as in action errors
-                )
-            ),
-            topic_name=settings.INTEGRATION_EVENTS_TOPIC,
-        )
+        await _publish_webhook_failed(integration=integration, error=message, config_data=webhook_config_data)
     return {}
-
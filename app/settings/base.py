@@ -40,6 +40,8 @@ PORTAL_INBOUND_INTEGRATIONS_ENDPOINT = (
 GUNDI_API_BASE_URL = env.str("GUNDI_API_BASE_URL", None)
 GUNDI_API_SSL_VERIFY = env.bool("GUNDI_API_SSL_VERIFY", True)
 SENSORS_API_BASE_URL = env.str("SENSORS_API_BASE_URL", None)
+GUNDI_API_KEYS_CACHE_TTL = env.float("GUNDI_API_KEYS_CACHE_TTL", 300.0)  # Seconds
+GUNDI_API_KEYS_CACHE_MAX_SIZE = env.int("GUNDI_API_KEYS_CACHE_MAX_SIZE", 1024)
 
 # Used in OTel traces/spans to set the 'environment' attribute, used on metrics calculation
 TRACE_ENVIRONMENT = env.str("TRACE_ENVIRONMENT", "dev")
@@ -60,6 +62,9 @@ REDIS_HOST = env.str("REDIS_HOST", "localhost")
 REDIS_PORT = env.int("REDIS_PORT", 6379)
 REDIS_STATE_DB = env.int("REDIS_STATE_DB", 0)
 REDIS_CONFIGS_DB = env.int("REDIS_CONFIGS_DB", 1)  # ToDo: define a convention for DB numbers across services
+# In-process cache of parsed configurations, in front of redis. Set the TTL to 0 to disable it.
+CONFIG_LOCAL_CACHE_TTL = env.float("CONFIG_LOCAL_CACHE_TTL", 60.0)  # Seconds
+CONFIG_LOCAL_CACHE_MAX_SIZE = env.int("CONFIG_LOCAL_CACHE_MAX_SIZE", 1024)
 
 
 REGISTER_ON_START = env.bool("REGISTER_ON_START", False)
@@ -68,15 +73,81 @@ INTEGRATION_TYPE_NAME = env.str("INTEGRATION_TYPE_NAME", None)  # Display name e
 INTEGRATION_SERVICE_URL = env.str("INTEGRATION_SERVICE_URL", None)  # Define a string id here e.g. "my_tracker"
 PROCESS_PUBSUB_MESSAGES_IN_BACKGROUND = env.bool("PROCESS_PUBSUB_MESSAGES_IN_BACKGROUND", False)
 PROCESS_WEBHOOKS_IN_BACKGROUND = env.bool("PROCESS_WEBHOOKS_IN_BACKGROUND", True)
+WEBHOOKS_MAX_BODY_SIZE = env.int("WEBHOOKS_MAX_BODY_SIZE", 64 * 1024 * 1024)  # Bytes, bigger requests get a 413. 0 for no limit
+# Parse JSON arrays posted to webhooks as they arrive, and pass them to the handler in chunks, to keep memory bounded.
+# Streamed requests are always processed inline, as the body can't be read after the response is sent.
+WEBHOOKS_STREAMING_ENABLED = env.bool("WEBHOOKS_STREAMING_ENABLED", False)
+WEBHOOKS_STREAMING_CHUNK_SIZE = env.int("WEBHOOKS_STREAMING_CHUNK_SIZE", 1000)  # Records per handler call
+WEBHOOKS_LOG_BODY_MAX_LENGTH = env.int("WEBHOOKS_LOG_BODY_MAX_LENGTH", 1024)  # Chars of the body logged, at DEBUG level
+# Fraction of webhook requests (0.0 to 1.0) whose full body is logged, through a queue so it never blocks requests
+WEBHOOKS_LOG_BODY_SAMPLE_RATE = env.float("WEBHOOKS_LOG_BODY_SAMPLE_RATE", 0.0)
 MAX_ACTION_EXECUTION_TIME = env.int("MAX_ACTION_EXECUTION_TIME", 60 * 9)  # 10 minutes is the maximum ack timeout
+# Bounds for the webhooks and actions being processed. When the queues are full, requests get a 429 response
+WEBHOOKS_MAX_IN_FLIGHT = env.int("WEBHOOKS_MAX_IN_FLIGHT", 100)
+WEBHOOKS_MAX_QUEUE_SIZE = env.int("WEBHOOKS_MAX_QUEUE_SIZE", 1000)
+PULL_ACTIONS_MAX_IN_FLIGHT = env.int("PULL_ACTIONS_MAX_IN_FLIGHT", 20)
+PULL_ACTIONS_MAX_QUEUE_SIZE = env.int("PULL_ACTIONS_MAX_QUEUE_SIZE", 200)
+PUSH_ACTIONS_MAX_IN_FLIGHT = env.int("PUSH_ACTIONS_MAX_IN_FLIGHT", 100)
+PUSH_ACTIONS_MAX_QUEUE_SIZE = env.int("PUSH_ACTIONS_MAX_QUEUE_SIZE", 1000)
+# Runs of a pull action for an integration take a lease in redis, so overlapping runs are skipped.
+# The lease outlives the action timeout a bit, in case a run is killed before releasing it
+PULL_ACTIONS_LEASE_ENABLED = env.bool("PULL_ACTIONS_LEASE_ENABLED", True)
+PULL_ACTIONS_LEASE_TTL = env.int("PULL_ACTIONS_LEASE_TTL", MAX_ACTION_EXECUTION_TIME + 60)  # Seconds
+# Push data messages processed successfully are remembered in redis, by message id, so redeliveries
+# (e.g. after a lost ack) are acked without sending the data again. Set to 0 to disable it
+PUSH_DATA_IDEMPOTENCY_TTL = env.int("PUSH_DATA_IDEMPOTENCY_TTL", 24 * 60 * 60)  # Seconds
+BACKGROUND_TASKS_DRAIN_TIMEOUT = env.float("BACKGROUND_TASKS_DRAIN_TIMEOUT", 30.0)  # Seconds to wait on shutdown
+# Batch endpoints run many PubSub messages per request, with per-message ack/nack results
+PUBSUB_BATCH_MAX_MESSAGES = env.int("PUBSUB_BATCH_MAX_MESSAGES", 1000)
+PUBSUB_BATCH_MAX_CONCURRENCY = env.int("PUBSUB_BATCH_MAX_CONCURRENCY", 20)  # Messages of one batch processed at the same time
+# Subscriptions pulled by the worker (python -m app.worker), as an alternative to push subscriptions
+PUBSUB_ACTIONS_SUBSCRIPTION = env.str("PUBSUB_ACTIONS_SUBSCRIPTION", None)
+PUBSUB_PUSH_DATA_SUBSCRIPTION = env.str("PUBSUB_PUSH_DATA_SUBSCRIPTION", None)
+PUBSUB_CONFIG_EVENTS_SUBSCRIPTION = env.str("PUBSUB_CONFIG_EVENTS_SUBSCRIPTION", None)
+PUBSUB_SUBSCRIBER_MAX_OUTSTANDING_MESSAGES = env.int("PUBSUB_SUBSCRIBER_MAX_OUTSTANDING_MESSAGES", 100)  # Per subscription
+PUBSUB_SUBSCRIBER_MAX_OUTSTANDING_BYTES = env.int("PUBSUB_SUBSCRIBER_MAX_OUTSTANDING_BYTES", 100 * 1024 * 1024)
+PUBSUB_SUBSCRIBER_ACK_DEADLINE = env.int("PUBSUB_SUBSCRIBER_ACK_DEADLINE", 60)  # Seconds. Leases are extended up to MAX_ACTION_EXECUTION_TIME
+PUBSUB_SUBSCRIBER_ACK_BATCH_SIZE = env.int("PUBSUB_SUBSCRIBER_ACK_BATCH_SIZE", 100)
+PUBSUB_SUBSCRIBER_ACK_WINDOW = env.float("PUBSUB_SUBSCRIBER_ACK_WINDOW", 0.5)  # Seconds
+PUBSUB_SUBSCRIBER_NACK_DELAY = env.int("PUBSUB_SUBSCRIBER_NACK_DELAY", 10)  # Seconds before failed messages are redelivered
+
+# Rate limiters used by action handlers to keep under provider quotas. With "redis" the limits are shared
+# by all the instances of the service (falling back to memory if redis is unavailable), with "memory" they're per instance
+RATE_LIMITER_BACKEND = env.str("RATE_LIMITER_BACKEND", "redis")
+RATE_LIMITER_MAX_WAIT = env.float("RATE_LIMITER_MAX_WAIT", 60.0)  # Seconds to wait for a turn before failing
 
 # Settings for system events & commands (EDA)
 INTEGRATION_EVENTS_TOPIC = env.str("INTEGRATION_EVENTS_TOPIC", "integration-events")
 default_commands_topic = f"{INTEGRATION_TYPE_SLUG}-actions-topic" if INTEGRATION_TYPE_SLUG else None
 INTEGRATION_COMMANDS_TOPIC = env.str("INTEGRATION_COMMANDS_TOPIC", default_commands_topic)
 TRIGGER_ACTIONS_ALWAYS_SYNC = env.bool("TRIGGER_ACTIONS_ALWAYS_SYNC", False)
+# Events are queued and published in batches by a background task, so callers don't wait on PubSub
+PUBLISH_EVENTS_IN_BACKGROUND = env.bool("PUBLISH_EVENTS_IN_BACKGROUND", True)
+EVENTS_PUBLISHER_MAX_BATCH_SIZE = env.int("EVENTS_PUBLISHER_MAX_BATCH_SIZE", 100)  # PubSub allows up to 1000
+EVENTS_PUBLISHER_MAX_BATCH_BYTES = env.int("EVENTS_PUBLISHER_MAX_BATCH_BYTES", 1024 * 1024)  # PubSub allows up to 10MB
+EVENTS_PUBLISHER_MAX_LINGER_SECONDS = env.float("EVENTS_PUBLISHER_MAX_LINGER_SECONDS", 0.5)
+EVENTS_PUBLISHER_MAX_QUEUE_SIZE = env.int("EVENTS_PUBLISHER_MAX_QUEUE_SIZE", 10000)  # Publish inline when full
+EVENTS_PUBLISHER_DRAIN_TIMEOUT = env.float("EVENTS_PUBLISHER_DRAIN_TIMEOUT", 30.0)  # Seconds to flush on shutdown
+# Tries per batch before its events are queued again, and the max seconds between tries
+EVENTS_PUBLISHER_MAX_ATTEMPTS = env.int("EVENTS_PUBLISHER_MAX_ATTEMPTS", 3)
+EVENTS_PUBLISHER_MAX_RETRY_WAIT = env.float("EVENTS_PUBLISHER_MAX_RETRY_WAIT", 5.0)
+
+# Payload models built from the JSON schema of webhook configurations, reused across requests
+DYNAMIC_PAYLOAD_MODELS_CACHE_MAX_SIZE = env.int("DYNAMIC_PAYLOAD_MODELS_CACHE_MAX_SIZE", 256)
+# Compiled JQ filters of webhook configurations, reused across requests
+JQ_PROGRAMS_CACHE_MAX_SIZE = env.int("JQ_PROGRAMS_CACHE_MAX_SIZE", 256)
+# Compiled decoders of the hex formats of webhook payloads, reused across requests
+STRUCT_HEX_DECODERS_CACHE_MAX_SIZE = env.int("STRUCT_HEX_DECODERS_CACHE_MAX_SIZE", 256)
 
 # SSRF protection for diagnostic URL forwarding.
 # When non-empty, only the listed hostnames are permitted as diagnostic destinations.
 # Example: "diagnostics.example.com,hooks.example.org"
 DIAGNOSTIC_URL_ALLOWLIST = env.list("DIAGNOSTIC_URL_ALLOWLIST", [])
+# Validated diagnostic hostnames and their addresses are cached, and connections are pinned to the validated address
+DIAGNOSTIC_DNS_CACHE_TTL = env.float("DIAGNOSTIC_DNS_CACHE_TTL", 60.0)  # Seconds
+DIAGNOSTIC_DNS_CACHE_MAX_SIZE = env.int("DIAGNOSTIC_DNS_CACHE_MAX_SIZE", 256)
+# Diagnostic payloads are queued and sent by background workers. When the queue is full, payloads are dropped
+DIAGNOSTIC_FORWARDING_WORKERS = env.int("DIAGNOSTIC_FORWARDING_WORKERS", 4)
+DIAGNOSTIC_FORWARDING_MAX_QUEUE_SIZE = env.int("DIAGNOSTIC_FORWARDING_MAX_QUEUE_SIZE", 1000)
+DIAGNOSTIC_FORWARDING_MAX_PER_DESTINATION = env.int("DIAGNOSTIC_FORWARDING_MAX_PER_DESTINATION", 2)
+DIAGNOSTIC_FORWARDING_DRAIN_TIMEOUT = env.float("DIAGNOSTIC_FORWARDING_DRAIN_TIMEOUT", 10.0)  # Seconds to flush on shutdown
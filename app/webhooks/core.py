@@ -1,10 +1,18 @@
+import functools
 import importlib
 import inspect
 import json
-from typing import Optional, Union
+from typing import Any, List, Optional, Union
+import pyjq
 from pydantic import BaseModel
 from fastapi.encoders import jsonable_encoder
-from app.services.utils import StructHexString, UISchemaModelMixin, FieldWithUIOptions, UIOptions, OptionalStringType
+from app import settings
+from app.services.utils import StructHexString, UISchemaModelMixin, FieldWithUIOptions, UIOptions, OptionalStringType, \
+    LRUCache
+
+
+# Compiled JQ programs by filter text, shared by all the integrations
+_jq_programs = LRUCache(max_size=settings.JQ_PROGRAMS_CACHE_MAX_SIZE)
 
 
 class WebhookConfiguration(UISchemaModelMixin, BaseModel):
@@ -51,6 +59,23 @@ class JQTransformConfig(UISchemaModelMixin, BaseModel):
     )
 
 
+def get_jq_program(jq_filter: str):
+    """Compile a JQ filter, or reuse the program compiled before for the same filter"""
+    if (program := _jq_programs.get(jq_filter)) is None:
+        program = pyjq.compile(jq_filter)
+        _jq_programs.set(jq_filter, program)
+    return program
+
+
+def jq_transform(jq_filter: str, data: Any) -> List[Any]:
+    """Apply a JQ filter to the data and return all the results, like pyjq.all() but without recompiling the filter"""
+    return get_jq_program(jq_filter).all(data)
+
+
+def get_jq_cache_stats() -> dict:
+    return {"size": len(_jq_programs), "hits": _jq_programs.hits, "misses": _jq_programs.misses}
+
+
 class GenericJsonTransformConfig(JQTransformConfig, DynamicSchemaConfig):
     output_type: Optional[str] = FieldWithUIOptions(
         None,
@@ -108,21 +133,29 @@ class GenericJsonWithHexStrPayload(HexStringPayload, GenericJsonPayload):
     pass
 
 
+@functools.lru_cache(maxsize=None)
 def get_webhook_handler():
+    # Resolved once and cached, as handlers don't change at runtime. Use reload_webhook_handler() to resolve it again.
 
     # Import the module using importlib
     module = importlib.import_module("app.webhooks.handlers")
     handler = module.webhook_handler
+    parameters = inspect.signature(handler).parameters
 
-    if (annotation := inspect.signature(handler).parameters.get("payload").annotation) != inspect._empty:
+    if (annotation := parameters.get("payload").annotation) != inspect._empty:
         payload_model = annotation
     else:
         payload_model = None
 
     # Introspect schemas
-    if (annotation := inspect.signature(handler).parameters.get("webhook_config").annotation) != inspect._empty:
+    if (annotation := parameters.get("webhook_config").annotation) != inspect._empty:
         config_model = annotation
     else:
         config_model = None
 
     return handler, payload_model, config_model
+
+
+def reload_webhook_handler():
+    """Forget the cached webhook handler and models, e.g. after patching the handlers module in tests."""
+    get_webhook_handler.cache_clear()
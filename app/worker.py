@@ -0,0 +1,86 @@
+import asyncio
+import logging
+import signal
+import click
+from gcloud.aio.pubsub import SubscriberClient
+
+from app import settings
+from app.services.action_runner import _portal
+from app.services.activity_logger import close_publisher_client, start_event_publisher, stop_event_publisher
+from app.services.clients import close_gundi_client
+from app.services.gundi import clear_api_keys
+from app.services.pubsub_messages import run_action_message, run_push_data_message, run_config_event_message
+from app.services.pubsub_subscriber import StreamingPullSubscriber
+
+
+logger = logging.getLogger(__name__)
+
+
+def build_subscribers(subscriber_client, actions_subscription=None, push_data_subscription=None,
+                      config_events_subscription=None):
+    subscriptions = [
+        (actions_subscription, run_action_message),
+        (push_data_subscription, run_push_data_message),
+        (config_events_subscription, run_config_event_message),
+    ]
+    return [
+        StreamingPullSubscriber(
+            subscription=subscription,
+            run_message=run_message,
+            subscriber_client=subscriber_client,
+            max_outstanding_messages=settings.PUBSUB_SUBSCRIBER_MAX_OUTSTANDING_MESSAGES,
+            max_outstanding_bytes=settings.PUBSUB_SUBSCRIBER_MAX_OUTSTANDING_BYTES,
+            ack_deadline=settings.PUBSUB_SUBSCRIBER_ACK_DEADLINE,
+            ack_batch_size=settings.PUBSUB_SUBSCRIBER_ACK_BATCH_SIZE,
+            ack_window=settings.PUBSUB_SUBSCRIBER_ACK_WINDOW,
+            nack_delay=settings.PUBSUB_SUBSCRIBER_NACK_DELAY,
+        )
+        for subscription, run_message in subscriptions if subscription
+    ]
+
+
+async def run_worker(actions_subscription=None, push_data_subscription=None, config_events_subscription=None):
+    stop_requested = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_requested.set)
+    async with SubscriberClient() as subscriber_client:  # Uses PUBSUB_EMULATOR_HOST when set
+        subscribers = build_subscribers(
+            subscriber_client, actions_subscription, push_data_subscription, config_events_subscription
+        )
+        if not subscribers:
+            raise click.UsageError("No subscriptions to pull from. Set at least one subscription.")
+        start_event_publisher()
+        for subscriber in subscribers:
+            subscriber.start()
+            logger.info(f"Pulling messages from {subscriber.subscription}")
+        await stop_requested.wait()
+        logger.info("Stopping. Waiting for the messages in progress...")
+        await asyncio.gather(*[s.stop(timeout=settings.BACKGROUND_TASKS_DRAIN_TIMEOUT) for s in subscribers])
+    await _portal.close()
+    clear_api_keys()
+    await close_gundi_client()
+    await stop_event_publisher()
+    await close_publisher_client()
+
+
+@click.command()
+@click.option('--actions-subscription', default=settings.PUBSUB_ACTIONS_SUBSCRIPTION,
+              help='Subscription with commands to run actions, e.g. pulls scheduled by the portal')
+@click.option('--push-data-subscription', default=settings.PUBSUB_PUSH_DATA_SUBSCRIPTION,
+              help='Subscription with data for push actions')
+@click.option('--config-events-subscription', default=settings.PUBSUB_CONFIG_EVENTS_SUBSCRIPTION,
+              help='Subscription with configuration events from the portal')
+def worker(actions_subscription, push_data_subscription, config_events_subscription):
+    asyncio.run(
+        run_worker(
+            actions_subscription=actions_subscription,
+            push_data_subscription=push_data_subscription,
+            config_events_subscription=config_events_subscription,
+        )
+    )
+
+
+# Main
+if __name__ == "__main__":
+    worker()